@@ -15,6 +15,9 @@ setup(
     "pycparser",
     "prompt_toolkit"
   ],
+  extras_require={
+    "numpy": ["numpy"]
+  },
   python_requires=">=3.11",
   entry_points={
     "console_scripts": [
@@ -6,6 +6,7 @@ from blockchat.client import start_node
 from blockchat.bootstrap import start_bootstrap
 
 from blockchat.node import Node, Bootstrap
+from blockchat.amount import Amount
 
 def main():
   parser = argparse.ArgumentParser()
@@ -17,6 +18,19 @@ def main():
   parser.add_argument("--bootstrap_port", "-p", type=int, default=5000, help="Bootstrap node port")
   parser.add_argument("--test", "-t", action="store_true", help="Run in test mode (no input required)")
   parser.add_argument("--docker", "-d", action="store_true", help="Run in docker")
+  parser.add_argument("--trace", type=float, default=0.0, help="Fraction of transactions to trace (0.0 disables tracing)")
+  parser.add_argument("--seal", type=float, default=0.0, help="Seal a block when its oldest transaction is older than this many seconds (bootstrap only)")
+  parser.add_argument("--max-capacity", type=int, default=None, help="Let the block capacity grow with the load up to this value (bootstrap only)")
+  parser.add_argument("--gossip", type=int, default=0, help="Gossip fanout for transactions and blocks (0 sends to every node)")
+  parser.add_argument("--multicast", type=str, default=None, help="Multicast group (address:port) for transactions and blocks, for nodes on one LAN")
+  parser.add_argument("--shm", action="store_true", help="Use shared memory for nodes on the same host")
+  parser.add_argument("--receivers", type=int, default=1, help="Number of receiver threads sharing the port of the node (SO_REUSEPORT)")
+  parser.add_argument("--rcvbuf", type=int, default=0, help="Kernel receive buffer size of each receiver socket in bytes (0 keeps the system default)")
+  parser.add_argument("--light", action="store_true", help="Run the node as a light client that follows the block headers only")
+  parser.add_argument("--api-port", type=int, default=None, help="Port of the HTTP query server (disabled by default)")
+  parser.add_argument("--replay-window", type=int, default=65536, help="Number of received transaction keys the replay filter keeps exactly")
+  parser.add_argument("--replay-capacity", type=int, default=262144, help="Number of transaction keys per Bloom filter generation of the replay filter")
+  parser.add_argument("--replay-fpr", type=float, default=0.001, help="False-positive rate of each Bloom filter generation of the replay filter")
 
   args = parser.parse_args()
   test = args.test
@@ -24,21 +38,34 @@ def main():
   nodes = args.nodes
   capacity = args.capacity
   bootstrap = args.bootstrap
-  stake = args.stake
+  stake = Amount.from_coins(args.stake)
+  trace_rate = args.trace
+  gossip_fanout = args.gossip
+  multicast_group = args.multicast
+  shared_memory = args.shm
+  receivers = args.receivers
+  receive_buffer = args.rcvbuf
+  api_port = args.api_port
+  light = args.light
+  replay_window = args.replay_window
+  replay_capacity = args.replay_capacity
+  replay_false_positive_rate = args.replay_fpr
+  seal_interval = args.seal
+  max_capacity = args.max_capacity
   bootstrap_address = args.bootstrap_address if not docker else 'bootstrap-node'
   bootstrap_port = int(args.bootstrap_port) if not docker else 5000
 
   if bootstrap:
     if test:
-      bootstrap_node = Bootstrap(bootstrap_address, bootstrap_port, debug=True, stake=stake)
-      start_bootstrap(nodes, capacity, bootstrap_node, None, True)
+      bootstrap_node = Bootstrap(bootstrap_address, bootstrap_port, debug=True, stake=stake, trace_rate=trace_rate, gossip_fanout=gossip_fanout, multicast_group=multicast_group, shared_memory=shared_memory, receivers=receivers, receive_buffer=receive_buffer, api_port=api_port, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate)
+      start_bootstrap(nodes, capacity, bootstrap_node, None, True, max_capacity, seal_interval)
     else:
-      bootstrap_node = Bootstrap(bootstrap_address, bootstrap_port, stake=stake)
-      cli.run(bootstrap_node, start_bootstrap, nodes_count=nodes, block_capacity=capacity)
+      bootstrap_node = Bootstrap(bootstrap_address, bootstrap_port, stake=stake, trace_rate=trace_rate, gossip_fanout=gossip_fanout, multicast_group=multicast_group, shared_memory=shared_memory, receivers=receivers, receive_buffer=receive_buffer, api_port=api_port, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate)
+      cli.run(bootstrap_node, start_bootstrap, nodes_count=nodes, block_capacity=capacity, max_block_capacity=max_capacity, seal_interval=seal_interval)
   else:
     if test:
-      client_node = Node(bootstrap_address, bootstrap_port, debug=True, stake=stake)
+      client_node = Node(bootstrap_address, bootstrap_port, debug=True, stake=stake, trace_rate=trace_rate, gossip_fanout=gossip_fanout, multicast_group=multicast_group, shared_memory=shared_memory, receivers=receivers, receive_buffer=receive_buffer, api_port=api_port, light=light, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate)
       start_node(nodes, capacity, client_node, None, True)
     else:
-      client_node = Node(bootstrap_address, bootstrap_port, stake=stake)
+      client_node = Node(bootstrap_address, bootstrap_port, stake=stake, trace_rate=trace_rate, gossip_fanout=gossip_fanout, multicast_group=multicast_group, shared_memory=shared_memory, receivers=receivers, receive_buffer=receive_buffer, api_port=api_port, light=light, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate)
       cli.run(client_node, start_node, nodes_count=nodes, block_capacity=capacity)
@@ -0,0 +1,213 @@
+"""A module for the AdmissionQueue class.
+
+This module contains the AdmissionQueue class, a bounded queue of inbound
+transactions with a rate limit per sender and round-robin scheduling across
+senders, which is used by a node to shed load under overload. The node uses
+the peer that sent a transaction as its sender, since the signature is not
+verified yet when the transaction is admitted.
+"""
+
+import time
+
+from collections import deque
+from queue import Empty
+from threading import Condition
+
+class AdmissionQueue:
+  """A class to represent a bounded, per-sender fair queue of transactions.
+
+  Every sender has its own FIFO queue and a token bucket that refills at the
+  rate limit up to the burst size. A transaction is shed when its sender has
+  no token left, when its sender's queue is full, or when the whole queue is
+  full; shedding is a counter increment, so it is cheap, and it happens before
+  the transaction is validated. get takes one transaction from each sender in
+  turn, so a chatty sender delays only its own transactions. Control items
+  (None, e.g. the seal requests of the sealer) are always admitted and served
+  first. Like Queue, it supports put, get, get_nowait and empty.
+
+  Attributes:
+    capacity (int): The maximum number of queued transactions.
+    sender_capacity (int): The maximum number of queued transactions per sender.
+    rate (float): The number of transactions per second admitted per sender, after the burst.
+    burst (float): The number of transactions a sender can send at once.
+    exempt (set): The senders without a rate limit (e.g. the node itself).
+    clock (function): The clock of the token buckets, in seconds.
+    admitted (int): The number of admitted transactions.
+    shed_rate (int): The number of transactions shed by the rate limit.
+    shed_full (int): The number of transactions shed because a queue was full.
+
+  Methods:
+    exempt_sender: Lift the rate limit of a sender.
+    put: Admit a transaction of a sender, or shed it.
+    get: Get the next transaction, waiting until there is one.
+    get_nowait: Get the next transaction, without waiting.
+    empty: Check if the queue is empty.
+    stats: Get the admission counters.
+  """
+
+  def __init__(self, capacity=8192, sender_capacity=1024, rate=500.0, burst=1000.0, exempt=(), clock=time.monotonic):
+    """Initializes a new instance of AdmissionQueue.
+
+    Args:
+      capacity (int, optional): The maximum number of queued transactions. Defaults to 8192.
+      sender_capacity (int, optional): The maximum number of queued transactions per sender. Defaults to 1024.
+      rate (float, optional): The transactions per second admitted per sender. Defaults to 500.0.
+      burst (float, optional): The number of transactions a sender can send at once. Defaults to 1000.0.
+      exempt (iterable, optional): The senders without a rate limit. Defaults to none.
+      clock (function, optional): The clock of the token buckets, in seconds. Defaults to time.monotonic.
+    """
+
+    self.capacity = capacity
+    self.sender_capacity = sender_capacity
+    self.rate = rate
+    self.burst = burst
+    self.exempt = set(exempt)
+    self.clock = clock
+
+    self.control = deque()
+    self.queues = {}
+    self.order = deque()
+    self.buckets = {}
+    self.size = 0
+
+    self.admitted = 0
+    self.shed_rate = 0
+    self.shed_full = 0
+
+    self.condition = Condition()
+
+  def take_token(self, sender):
+    tokens, last = self.buckets.get(sender, (self.burst, None))
+    now = self.clock()
+    if last is not None:
+      tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+    if tokens < 1.0:
+      self.buckets[sender] = (tokens, now)
+      return False
+
+    self.buckets[sender] = (tokens - 1.0, now)
+
+    # Forget the buckets that are full again, so unknown senders cannot grow the table
+    if len(self.buckets) > 4 * self.capacity:
+      idle = now - self.burst / self.rate
+      self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] > idle}
+
+    return True
+
+  def exempt_sender(self, sender):
+    """Lifts the rate limit of a sender, e.g. a known validator. Its transactions are still shed when a queue is full.
+
+    Args:
+      sender (hashable): The sender, e.g. the (address, port) of a peer.
+    """
+
+    with self.condition:
+      self.exempt.add(sender)
+      self.buckets.pop(sender, None)
+
+  def put(self, item, sender=None):
+    """Admits a transaction of a sender, or sheds it.
+
+    Args:
+      item (dict): The transaction, or None for a control item.
+      sender (hashable, optional): The sender, e.g. the (address, port) of a peer. Items without a sender are control items.
+
+    Returns:
+      bool: True if the item was admitted, False if it was shed.
+    """
+
+    with self.condition:
+      if item is None or sender is None:
+        self.control.append(item)
+        self.condition.notify()
+        return True
+
+      if sender not in self.exempt and not self.take_token(sender):
+        self.shed_rate += 1
+        return False
+
+      queue = self.queues.get(sender)
+      if self.size >= self.capacity or (queue is not None and len(queue) >= self.sender_capacity):
+        self.shed_full += 1
+        return False
+
+      if queue is None:
+        queue = self.queues[sender] = deque()
+        self.order.append(sender)
+      queue.append(item)
+
+      self.size += 1
+      self.admitted += 1
+      self.condition.notify()
+      return True
+
+  def pop(self):
+    if self.control:
+      return self.control.popleft()
+
+    sender = self.order.popleft()
+    queue = self.queues[sender]
+    item = queue.popleft()
+    self.size -= 1
+
+    # Move the sender to the back of the round, or forget it if it has nothing left
+    if queue:
+      self.order.append(sender)
+    else:
+      del self.queues[sender]
+
+    return item
+
+  def get(self):
+    """Gets the next item, waiting until there is one.
+
+    Returns:
+      dict: The transaction, or None for a control item.
+    """
+
+    with self.condition:
+      while not self.control and not self.size:
+        self.condition.wait()
+      return self.pop()
+
+  def get_nowait(self):
+    """Gets the next item, without waiting.
+
+    Raises:
+      Empty: If the queue is empty.
+
+    Returns:
+      dict: The transaction, or None for a control item.
+    """
+
+    with self.condition:
+      if not self.control and not self.size:
+        raise Empty
+      return self.pop()
+
+  def empty(self):
+    """Checks if the queue is empty.
+
+    Returns:
+      bool: True if there is no item.
+    """
+
+    with self.condition:
+      return not self.control and not self.size
+
+  def stats(self):
+    """Gets the admission counters.
+
+    Returns:
+      dict: The queued, admitted and shed transactions, and the number of queued senders.
+    """
+
+    with self.condition:
+      return {
+        'queued': self.size,
+        'senders': len(self.queues),
+        'admitted': self.admitted,
+        'shed_rate': self.shed_rate,
+        'shed_full': self.shed_full,
+      }
@@ -0,0 +1,111 @@
+"""A module for the Amount class.
+
+This module contains the Amount class, which is used to convert amounts of BCC
+to and from the integer minor units in which balances, stakes, fees and
+transaction values are kept, sent and validated.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+class Amount:
+  """A class to represent the fixed-point arithmetic of amounts.
+
+  An amount is an int of minor units, one millionth of a BCC (scale). Sums of
+  amounts are exact, so every node computes the same balances in any order.
+  The fee of a transfer is a whole number of units, rounded down; the fee rate
+  is in basis points (hundredths of a percent). A message costs one BCC per
+  character.
+
+  Attributes:
+    scale (int): The number of minor units per BCC.
+    basis (int): The number of basis points in a rate of 1.
+
+  Methods:
+    from_coins: Convert an amount of BCC to minor units.
+    format: Format an amount of minor units as BCC.
+    is_valid: Check if a value is an amount of minor units.
+    fee: Get the fee of a transfer.
+    message_cost: Get the cost of a message.
+  """
+
+  scale = 1000000
+  basis = 10000
+
+  @staticmethod
+  def from_coins(value):
+    """Converts an amount of BCC (e.g. '12.5', 12.5 or 12) to minor units, exactly.
+
+    Args:
+      value (str, int or float): The amount of BCC.
+
+    Raises:
+      ValueError: If the value is not a number, or is finer than one minor unit.
+
+    Returns:
+      int: The amount in minor units.
+    """
+
+    try:
+      units = Decimal(str(value)) * Amount.scale
+    except InvalidOperation:
+      raise ValueError(f'Invalid amount: {value}')
+
+    if not units.is_finite() or units != units.to_integral_value():
+      raise ValueError(f'Invalid amount: {value}')
+
+    return int(units)
+
+  @staticmethod
+  def format(units):
+    """Formats an amount of minor units as BCC, without trailing zeros.
+
+    Args:
+      units (int): The amount in minor units.
+
+    Returns:
+      str: The amount of BCC.
+    """
+
+    whole, fraction = divmod(abs(units), Amount.scale)
+    text = f'{whole}.{fraction:06d}'.rstrip('0').rstrip('.')
+    return f'-{text}' if units < 0 else text
+
+  @staticmethod
+  def is_valid(value):
+    """Checks if a value is an amount of minor units (an int, not a bool).
+
+    Args:
+      value: The value.
+
+    Returns:
+      bool: True if the value is an int.
+    """
+
+    return isinstance(value, int) and not isinstance(value, bool)
+
+  @staticmethod
+  def fee(value, fee_rate):
+    """Gets the fee of a transfer, rounded down to a whole minor unit.
+
+    Args:
+      value (int): The amount transferred, in minor units.
+      fee_rate (int): The fee rate, in basis points.
+
+    Returns:
+      int: The fee, in minor units.
+    """
+
+    return value * fee_rate // Amount.basis
+
+  @staticmethod
+  def message_cost(message):
+    """Gets the cost of a message, one BCC per character.
+
+    Args:
+      message (str): The message.
+
+    Returns:
+      int: The cost, in minor units.
+    """
+
+    return len(message) * Amount.scale
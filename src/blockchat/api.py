@@ -0,0 +1,271 @@
+"""A module for the QueryCache class and the QueryServer class.
+
+This module contains the QueryCache class, a cache of serialized views of the
+chain that is invalidated when a block is registered, and the QueryServer
+class, a read-only HTTP/JSON server of a node for balances, stakes, nonces,
+blocks, transaction status and the size of the mempool.
+"""
+
+import json
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from urllib.parse import urlsplit
+
+class QueryCache:
+  """A class to represent a cache of serialized views, versioned by the registered blocks.
+
+  Every view is stored with the version it was computed at, and is served
+  while the version has not changed; the node bumps the version (invalidate)
+  after each change of the chain. The version is read before a view is
+  computed, so a view computed while a block is being registered is stored
+  with the old version and computed again by the next request.
+
+  Attributes:
+    version (int): The current version.
+    capacity (int): The maximum number of views per version.
+    hits (int): The number of requests served from the cache.
+    misses (int): The number of views computed.
+
+  Methods:
+    invalidate: Start a new version, dropping the cached views.
+    get: Get a view, computing it if it is not cached for the current version.
+  """
+
+  def __init__(self, capacity=4096):
+    """Initializes a new instance of QueryCache.
+
+    Args:
+      capacity (int, optional): The maximum number of views per version. Defaults to 4096.
+    """
+
+    self.version = 0
+    self.capacity = capacity
+    self.views = {}
+    self.hits = 0
+    self.misses = 0
+    self.lock = Lock()
+
+  def invalidate(self):
+    """Starts a new version, dropping the cached views."""
+
+    with self.lock:
+      self.version += 1
+      self.views = {}
+
+  def get(self, key, compute):
+    """Gets a view, computing it if it is not cached for the current version.
+
+    Args:
+      key (tuple): The key of the view.
+      compute (function): A function computing the view, or returning None if it does not exist (which is not cached).
+
+    Returns:
+      bytes: The view, serialized as JSON, or None if it does not exist.
+    """
+
+    with self.lock:
+      version = self.version
+      cached = self.views.get(key)
+      if cached is not None and cached[0] == version:
+        self.hits += 1
+        return cached[1]
+      self.misses += 1
+
+    view = compute()
+    if view is None:
+      return None
+
+    payload = json.dumps(view).encode()
+    with self.lock:
+      if version == self.version and len(self.views) < self.capacity:
+        self.views[key] = (version, payload)
+
+    return payload
+
+class QueryServer:
+  """A class to represent the read-only HTTP/JSON query server of a node.
+
+  Every response is a JSON object. The views of the chain (accounts, blocks,
+  confirmed transactions) are taken from the state after the last block of
+  the chain and served from a QueryCache, so polling them does not take the
+  blockchain lock until the next block is registered; pending transactions
+  and the mempool are read live.
+
+    GET /accounts                  The confirmed balance, stake and nonce of every node.
+    GET /accounts/<id>             The confirmed balance, stake and nonce of a node.
+    GET /blocks/latest             The last block of the chain.
+    GET /blocks/<index>            A block by index.
+    GET /blocks/<hash>             A block by hash.
+    GET /transactions/<uuid|hash>  The status of a transaction (confirmed, final or pending).
+    GET /mempool                   The number of received transactions not in the chain yet.
+    GET /stats                     The receive, admission and replay counters of the node.
+
+  Attributes:
+    node (Node): The node that owns the server.
+    address (str): The address of the server.
+    port (int): The port of the server.
+    cache (QueryCache): The cached views of the node.
+
+  Methods:
+    start: Start serving requests in a background thread.
+    close: Stop the server.
+  """
+
+  def __init__(self, node, address='0.0.0.0', port=0):
+    """Initializes a new instance of QueryServer and binds its socket.
+
+    Args:
+      node (Node): The node that owns the server.
+      address (str, optional): The address of the server. Defaults to '0.0.0.0'.
+      port (int, optional): The port of the server, 0 for a random one. Defaults to 0.
+    """
+
+    self.node = node
+    self.cache = node.query_cache
+
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        status, payload = server.handle(urlsplit(self.path).path)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def log_message(self, format, *args):
+        pass
+
+    self.server = ThreadingHTTPServer((address, port), Handler)
+    self.server.daemon_threads = True
+    self.address, self.port = self.server.server_address[:2]
+
+  def start(self):
+    """Starts serving requests in a background thread."""
+
+    thread = Thread(target=self.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+  def close(self):
+    """Stops the server."""
+
+    self.server.shutdown()
+    self.server.server_close()
+
+  @staticmethod
+  def error(status, message):
+    return status, json.dumps({'error': message}).encode()
+
+  def handle(self, path):
+    """Answers a request.
+
+    Args:
+      path (str): The path of the request.
+
+    Returns:
+      tuple: The HTTP status and the JSON payload.
+    """
+
+    if self.node.blockchain is None or self.node.block_tree is None:
+      return self.error(503, 'The node has not joined the network yet')
+
+    parts = [part for part in path.split('/') if part]
+    if len(parts) == 1 and parts[0] == 'mempool':
+      return 200, json.dumps(self.mempool()).encode()
+    if len(parts) == 1 and parts[0] == 'stats':
+      return 200, json.dumps({**self.node.get_stats(), 'cache': {'version': self.cache.version, 'hits': self.cache.hits, 'misses': self.cache.misses}}).encode()
+
+    if len(parts) == 1 and parts[0] == 'accounts':
+      payload = self.cache.get(('accounts',), self.accounts)
+    elif len(parts) == 2 and parts[0] == 'accounts' and parts[1].isdigit():
+      payload = self.cache.get(('account', int(parts[1])), lambda: self.account(int(parts[1])))
+    elif len(parts) == 2 and parts[0] == 'blocks':
+      payload = self.cache.get(('block', parts[1]), lambda: self.block(parts[1]))
+    elif len(parts) == 2 and parts[0] == 'transactions':
+      payload = self.cache.get(('transaction', parts[1]), lambda: self.transaction(parts[1]))
+      if payload is None:
+        pending = self.pending(parts[1])
+        payload = json.dumps(pending).encode() if pending is not None else None
+    else:
+      return self.error(404, f'Unknown path {path}')
+
+    if payload is None:
+      return self.error(404, f'{parts[1]} not found')
+    return 200, payload
+
+  def accounts(self):
+    # The state after the last block only changes when a block is registered
+    with self.node.blockchain_lock:
+      blockchain = self.node.blockchain
+      state = self.node.block_tree.get(blockchain.get_last_block().hash)['state']
+      return {
+        'block': blockchain.get_last_block().index,
+        'accounts': [
+          {
+            'id': node['id'],
+            'balance': state[node['key']]['balance'] if node['key'] in state else 0,
+            'stake': state[node['key']]['stake'] if node['key'] in state else 0,
+            'nonce': blockchain.nonces.get(node['key'], -1),
+          }
+          for node in blockchain.nodes
+        ],
+      }
+
+  def account(self, id):
+    view = self.accounts()
+    account = next((account for account in view['accounts'] if account['id'] == id), None)
+    return {'block': view['block'], **account} if account is not None else None
+
+  def block(self, key):
+    with self.node.blockchain_lock:
+      chain = self.node.blockchain.chain
+      if key == 'latest':
+        block = chain[-1]
+      elif key.isdigit():
+        block = chain[int(key)] if int(key) < len(chain) else None
+      else:
+        block = self.node.blockchain.get_block(key)
+
+      if block is None:
+        return None
+      return {**dict(block), 'confirmations': len(chain) - 1 - block.index}
+
+  def transaction(self, key):
+    with self.node.blockchain_lock:
+      found = self.node.blockchain.get_transaction(key)
+      if found is None:
+        return None
+
+      block, transaction = found
+      confirmations = len(self.node.blockchain.chain) - 1 - block.index
+      return {
+        'status': 'final' if confirmations >= self.node.finality_depth else 'confirmed',
+        'block': block.index,
+        'confirmations': confirmations,
+        'transaction': dict(transaction),
+      }
+
+  def pending(self, key):
+    # Not cached: transactions become pending between blocks
+    pool = self.node.transaction_pool
+    transaction = pool.get(key)
+    if transaction is None:
+      with self.node.pool_lock:
+        transaction = next((transaction for transaction in pool.values() if transaction['uuid'] == key), None)
+
+    if transaction is None:
+      return None
+    return {'status': 'pending', 'transaction': transaction}
+
+  def mempool(self):
+    with self.node.mining_lock:
+      pending = len(self.node.current_block) + sum(len(transactions) for transactions in self.node.sealed_blocks.values())
+
+    return {
+      'pooled': len(self.node.transaction_pool),
+      'pending': pending,
+      'queued': self.node.transaction_queue.stats()['queued'],
+    }
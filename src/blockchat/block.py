@@ -1,7 +1,8 @@
 """A module for the Block class.
 
 This module contains the Block class, which is used to represent a
-block in the blockchain.
+block in the blockchain, and the BlockAssembler class, which is used by the
+next validator to select the transactions of a block while they arrive.
 """
 
 import hashlib
@@ -13,6 +14,11 @@ from blockchat.transaction import Transaction
 class Block:
   """A class to represent a block in the blockchain.
 
+  The hash of a block commits to the hashes of its transactions, in order,
+  and each transaction hash commits to the transaction, so the header of a
+  block (see hash_header) can be checked against the block hash without the
+  transactions.
+
   Attributes:
     index (int): The index of the block.
     timestamp (str): The timestamp of the block.
@@ -23,6 +29,7 @@ class Block:
 
   Methods:
     calculate_hash: Calculate the hash of the block.
+    hash_header: Calculate the hash of a block from its header.
   """
 
   def __init__(self, index, validator, transactions, previous_hash, timestamp=None, hash=None):
@@ -60,12 +67,100 @@ class Block:
     return str(dict(self))
 
   def calculate_hash(self):
-    block_data = json.dumps({
+    return self.hash_header({
       'index': self.index,
       'timestamp': self.timestamp,
       'validator': self.validator,
-      'transactions': [dict(transaction) for transaction in self.transactions],
+      'transactions': [transaction.hash for transaction in self.transactions],
       'previous_hash': self.previous_hash
     })
 
+  @staticmethod
+  def hash_header(header):
+    """Calculates the hash of a block from its header.
+
+    Args:
+      header (dict): The index, timestamp, validator, transaction hashes and previous hash of the block.
+
+    Returns:
+      str: The hash of the block.
+    """
+
+    block_data = json.dumps({
+      'index': header['index'],
+      'timestamp': header['timestamp'],
+      'validator': header['validator'],
+      'transactions': header['transactions'],
+      'previous_hash': header['previous_hash']
+    })
+
     return hashlib.sha256(block_data.encode()).hexdigest()
+
+class BlockAssembler:
+  """A class to assemble a block incrementally.
+
+  The next validator adds every registered transaction of the block as it
+  arrives, and the assembler keeps those that the state after the previous
+  block can cover, in order (see Node.select_transactions). A block lists its
+  transactions by timestamp, which is usually the order in which they are
+  registered: when the block is sealed with the transactions that were added,
+  in that order, its transactions are already selected, and only its
+  timestamp and its hash, which covers the transaction hashes only, are left
+  to compute. Otherwise the validator selects them again.
+
+  Attributes:
+    index (int): The index of the block.
+    validator (int): The validator of the block.
+    previous_hash (str): The hash of the previous block.
+    accept (function): Checks if a transaction is included, given the transactions accepted before it.
+    hashes (list): The hashes of the transactions added so far, in order.
+    transactions (list): The transactions accepted so far, in order.
+
+  Methods:
+    add: Add a transaction to the block.
+    build: Build the block for the sealed transactions.
+  """
+
+  def __init__(self, index, validator, previous_hash, accept):
+    """Initializes a new instance of BlockAssembler.
+
+    Args:
+      index (int): The index of the block.
+      validator (int): The validator of the block.
+      previous_hash (str): The hash of the previous block.
+      accept (function): Checks if a transaction is included, given the transactions accepted before it.
+    """
+
+    self.index = index
+    self.validator = validator
+    self.previous_hash = previous_hash
+    self.accept = accept
+    self.hashes = []
+    self.transactions = []
+
+  def add(self, transaction):
+    """Adds a transaction to the block, if it is accepted.
+
+    Args:
+      transaction (Transaction): The transaction.
+    """
+
+    self.hashes.append(transaction.hash)
+    if self.accept(transaction):
+      self.transactions.append(transaction)
+
+  def build(self, transactions, timestamp):
+    """Builds the block for the sealed transactions, if they are the ones added, in the same order.
+
+    Args:
+      transactions (list): The sealed transactions, in block order.
+      timestamp (str): The timestamp of the block.
+
+    Returns:
+      Block: The block, or None if other transactions were sealed.
+    """
+
+    if [transaction.hash for transaction in transactions] != self.hashes:
+      return None
+
+    return Block(self.index, self.validator, self.transactions, self.previous_hash, timestamp)
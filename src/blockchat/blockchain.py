@@ -4,7 +4,15 @@ This module contains the Blockchain class, which is used to represent the
 blockchain of the network.
 """
 
+from datetime import datetime
+
 from blockchat.block import Block
+from blockchat.amount import Amount
+
+try:
+  from blockchat.ledger import Ledger
+except ImportError:
+  Ledger = None
 
 class Blockchain:
   """A class to represent the blockchain of the network.
@@ -12,16 +20,34 @@ class Blockchain:
   Attributes:
     chain (list): A list of blocks in the blockchain.
     block_capacity (int): The maximum number of transactions per block.
+    max_block_capacity (int): The upper bound of the adaptive block capacity.
+    seal_interval (float): The maximum age in seconds of a pending transaction before its block is sealed, 0.0 to seal only at capacity.
     block_index (int): The index of the current block.
     nodes (list): A list of nodes in the network.
-    fee_rate (float): The fee rate for transactions.
+    fee_rate (int): The fee rate for transfers, in basis points.
+    nonces (dict): A dictionary mapping sender addresses to their last nonce in the chain.
+    block_hashes (dict): A dictionary mapping block hashes to their position in the chain.
+    transaction_uuids (dict): A dictionary mapping transaction uuids to their (block position, transaction position).
+    transaction_hashes (dict): A dictionary mapping transaction hashes to their (block position, transaction position).
+    accounts (dict): A dictionary mapping node addresses to the (block position, transaction position) of the transactions they sent or received, in chain order.
 
   Methods:
     add_block: Add a block to the blockchain.
+    rollback: Remove the blocks after a given block.
+    index_block: Add a block and its transactions to the indexes.
+    unindex_block: Remove a block and its transactions from the indexes.
+    get_block: Get a block by hash.
+    get_transaction: Get a transaction by uuid or hash.
+    get_account_transactions: Get the transactions sent or received by a node.
     get_last_block: Get the last block in the blockchain.
+    get_block_capacity: Get the capacity of the next block.
+    get_state: Get the balance and stake of each node by replaying the chain.
+    apply_block: Apply the transactions of a block to a state and credit the fees to its validator.
+    apply_transactions: Apply a list of transactions to a state.
+    get_fees: Get the fees of a list of transactions.
   """
 
-  def __init__(self, block_capacity, chain=[], block_index=0, nodes=[]):
+  def __init__(self, block_capacity, chain=[], block_index=0, nodes=[], max_block_capacity=None, seal_interval=0.0):
     """Initializes a new instance of Blockchain.
 
     Args:
@@ -29,13 +55,28 @@ class Blockchain:
       chain (list, optional): A list of blocks in the blockchain. Defaults to [].
       block_index (int, optional): The index of the current block. Defaults to 0.
       nodes (list, optional): A list of nodes in the network. Defaults to [].
+      max_block_capacity (int, optional): The upper bound of the adaptive block capacity. Defaults to block_capacity.
+      seal_interval (float, optional): The maximum age of a pending transaction in seconds. Defaults to 0.0.
     """
 
     self.chain = [Block(**block) for block in chain]
     self.block_capacity = block_capacity
+    self.max_block_capacity = block_capacity if max_block_capacity is None else max(block_capacity, max_block_capacity)
+    self.seal_interval = seal_interval
     self.block_index = block_index
     self.nodes = nodes
-    self.fee_rate = 0.03
+    self.fee_rate = 300
+
+    self.nonces = {}
+    self.block_hashes = {}
+    self.transaction_uuids = {}
+    self.transaction_hashes = {}
+    self.accounts = {}
+
+    # The indexes are not serialized, they are rebuilt with the chain
+    for position, block in enumerate(self.chain):
+      self.update_nonces(block)
+      self.index_block(position, block)
 
   def add_block(self, block):
     """Adds a block to the blockchain.
@@ -46,6 +87,118 @@ class Blockchain:
 
     self.chain.append(block)
     self.block_index += 1
+    self.update_nonces(block)
+    self.index_block(len(self.chain) - 1, block)
+
+  def rollback(self, index, nonces):
+    """Removes the blocks after a given block, to switch to another branch.
+
+    Args:
+      index (int): The index of the last block to keep.
+      nonces (dict): The last nonce of each sender after that block.
+    """
+
+    for position in range(len(self.chain) - 1, index, -1):
+      self.unindex_block(position, self.chain[position])
+
+    del self.chain[index + 1:]
+    self.block_index = index + 1
+    self.nonces = dict(nonces)
+
+  def index_block(self, position, block):
+    """Adds a block and its transactions to the indexes.
+
+    Args:
+      position (int): The position of the block in the chain.
+      block (Block): The block.
+    """
+
+    self.block_hashes[block.hash] = position
+    for offset, transaction in enumerate(block.transactions):
+      location = (position, offset)
+      self.transaction_uuids[transaction.uuid] = location
+      self.transaction_hashes[transaction.hash] = location
+
+      self.accounts.setdefault(transaction.sender_address, []).append(location)
+      if transaction.receiver_address != transaction.sender_address:
+        self.accounts.setdefault(transaction.receiver_address, []).append(location)
+
+  def unindex_block(self, position, block):
+    """Removes a block and its transactions from the indexes. Only the last block of the chain can be removed.
+
+    Args:
+      position (int): The position of the block in the chain.
+      block (Block): The block.
+    """
+
+    self.block_hashes.pop(block.hash, None)
+    for transaction in block.transactions:
+      self.transaction_uuids.pop(transaction.uuid, None)
+      self.transaction_hashes.pop(transaction.hash, None)
+
+      for address in (transaction.sender_address, transaction.receiver_address):
+        locations = self.accounts.get(address)
+        while locations and locations[-1][0] >= position:
+          locations.pop()
+        if locations == []:
+          del self.accounts[address]
+
+  def get_block(self, block_hash):
+    """Gets a block of the chain by hash.
+
+    Args:
+      block_hash (str): The hash of the block.
+
+    Returns:
+      Block: The block, or None if it is not in the chain.
+    """
+
+    position = self.block_hashes.get(block_hash)
+    return self.chain[position] if position is not None else None
+
+  def get_transaction(self, key):
+    """Gets a transaction of the chain by uuid or hash.
+
+    Args:
+      key (str): The uuid or the hash of the transaction.
+
+    Returns:
+      tuple: The block and the transaction, or None if it is not in the chain.
+    """
+
+    location = self.transaction_uuids.get(key) or self.transaction_hashes.get(key)
+    if location is None:
+      return None
+
+    block = self.chain[location[0]]
+    return block, block.transactions[location[1]]
+
+  def get_account_transactions(self, address):
+    """Gets the transactions sent or received by a node, in chain order.
+
+    Args:
+      address (str): The address (public key) of the node.
+
+    Returns:
+      list: The (block, transaction) pairs.
+    """
+
+    return [(self.chain[position], self.chain[position].transactions[offset]) for position, offset in self.accounts.get(address, [])]
+
+  def update_nonces(self, block, nonces=None):
+    """Updates the last nonce of each sender with the transactions of a block.
+
+    Args:
+      block (Block): The block.
+      nonces (dict, optional): The nonces to update in place. Defaults to the nonces of the chain.
+    """
+
+    if nonces is None:
+      nonces = self.nonces
+
+    for transaction in block.transactions:
+      if transaction.nonce > nonces.get(transaction.sender_address, -1):
+        nonces[transaction.sender_address] = transaction.nonce
 
   def get_last_block(self):
     """Gets the last block in the blockchain.
@@ -56,41 +209,137 @@ class Blockchain:
 
     return self.chain[-1]
 
+  def get_block_capacity(self):
+    """Gets the capacity of the next block.
+
+    The capacity grows with the load so that blocks are not sealed more often
+    than the target block time (the seal interval, or one second if sealing by
+    age is disabled), between block_capacity and max_block_capacity. The load is
+    measured from the transaction count and the timestamps of the last blocks,
+    so every node computes the same capacity for the same chain.
+
+    Returns:
+      int: The capacity of the next block.
+    """
+
+    # Skip the genesis block, it does not reflect the load
+    recent = self.chain[1:][-4:]
+    if self.max_block_capacity == self.block_capacity or len(recent) < 2:
+      return self.block_capacity
+
+    count = sum(len(block.transactions) for block in recent[1:])
+    span = (datetime.fromisoformat(recent[-1].timestamp) - datetime.fromisoformat(recent[0].timestamp)).total_seconds()
+    if span <= 0:
+      return self.max_block_capacity
+
+    capacity = int(count / span * (self.seal_interval or 1.0))
+    return max(self.block_capacity, min(self.max_block_capacity, capacity))
+
   def get_state(self):
     """Gets the balance and stake of each node in the network, by iterating
     over all the transactions for every valid block in the blockchain.
 
+    Every node starts with the stake it declared when it joined the network
+    (initial_stake), and a stake transaction replaces the stake of its sender.
+
+    The chain is replayed with a Ledger if NumPy is installed, which gives the
+    same results as replaying it block by block with apply_block, somewhat
+    faster (see Ledger).
+
     Returns:
       tuple: A tuple containing the state of the network and the fees from the
       the last block.
     """
 
-    state = [{**node, 'balance': 0, 'stake': 0} for node in self.nodes]
+    if Ledger is not None:
+      ledger = Ledger(self.nodes, self.fee_rate)
+      fees = ledger.apply_blocks(self.chain)
+      return ledger.get_state(), int(fees[-1]) if len(fees) else 0
+
+    state = [{**node, 'balance': 0, 'stake': node.get('initial_stake', 0)} for node in self.nodes]
+    state_by_key = {node['key']: node for node in state}
 
+    fees = 0
     for block in self.chain:
-      fees = 0
-      for transaction in block.transactions:
-        sender = next((node for node in state if node['key'] == transaction.sender_address), None)
+      fees = self.apply_block(state_by_key, block)
 
-        # Handle each type of transaction (coins, message, stake)
-        if transaction.type_of_transaction == 'coins':
-          recipient = next(node for node in state if node['key'] == transaction.receiver_address)
+    return state, fees
 
-          # Skip if genesis block
-          if sender is not None:
-            sender['balance'] -= (1.0 + self.fee_rate) * transaction.value
-            fees += transaction.value * self.fee_rate
+  def apply_block(self, state, block):
+    """Applies the transactions of a block to a state and credits the fees
+    to the validator of the block.
 
-          recipient['balance'] += transaction.value
+    Args:
+      state (dict): A dictionary mapping node addresses to their state, updated in place.
+      block (Block): The block.
 
-        elif transaction.type_of_transaction == 'message':
-          sender['balance'] -= float(len(transaction.value))
-          fees += float(len(transaction.value))
+    Returns:
+      int: The fees of the block, in minor units.
+    """
 
-        elif transaction.type_of_transaction == 'stake':
-          sender['stake'] += transaction.value
+    fees = self.apply_transactions(state, block.transactions)
 
-    return state, fees
+    validator = next((node for node in state.values() if node['id'] == block.validator), None)
+    if validator is not None:
+      validator['balance'] += fees
+
+    return fees
+
+  def apply_transactions(self, state, transactions):
+    """Applies a list of transactions to a state, without crediting their fees.
+
+    Args:
+      state (dict): A dictionary mapping node addresses to their state, updated in place.
+      transactions (list): The transactions.
+
+    Returns:
+      int: The fees of the transactions, in minor units.
+    """
+
+    fees = 0
+    for transaction in transactions:
+      sender = state.get(transaction.sender_address)
+
+      # Handle each type of transaction (coins, message, stake)
+      if transaction.type_of_transaction == 'coins':
+        recipient = state[transaction.receiver_address]
+
+        # Skip if genesis block
+        if sender is not None:
+          fee = Amount.fee(transaction.value, self.fee_rate)
+          sender['balance'] -= transaction.value + fee
+          fees += fee
+
+        recipient['balance'] += transaction.value
+
+      elif transaction.type_of_transaction == 'message':
+        cost = Amount.message_cost(transaction.value)
+        sender['balance'] -= cost
+        fees += cost
+
+      elif transaction.type_of_transaction == 'stake':
+        sender['stake'] = transaction.value
+
+    return fees
+
+  def get_fees(self, transactions):
+    """Gets the fees of a list of transactions.
+
+    Args:
+      transactions (list): The transactions.
+
+    Returns:
+      int: The fees, in minor units.
+    """
+
+    fees = 0
+    for transaction in transactions:
+      if transaction.type_of_transaction == 'coins':
+        fees += Amount.fee(transaction.value, self.fee_rate)
+      elif transaction.type_of_transaction == 'message':
+        fees += Amount.message_cost(transaction.value)
+
+    return fees
 
   def __str__(self):
     return str([str(block) for block in self.chain])
@@ -100,6 +349,8 @@ class Blockchain:
 
   def __iter__(self):
     yield 'block_capacity', self.block_capacity
+    yield 'max_block_capacity', self.max_block_capacity
+    yield 'seal_interval', self.seal_interval
     yield 'block_index', self.block_index
     yield 'chain', [dict(block) for block in self.chain]
     yield 'nodes', self.nodes
@@ -0,0 +1,171 @@
+"""A module for the BlockTree class.
+
+This module contains the BlockTree class, which is used to keep the recent
+blocks of the blockchain, including competing branches, together with the
+ledger state after each of them.
+"""
+
+class BlockTree:
+  """A class to represent the tree of the recent blocks of the blockchain.
+
+  The tree is rooted at the last final block. Every entry holds the block, its
+  height and a snapshot of the ledger state (balances, stakes and last nonces)
+  after the block, so that switching branches only needs the snapshot of the
+  common ancestor and the blocks of the new branch.
+
+  The fork-choice rule is deterministic: the best tip is the highest block,
+  and among blocks of the same height the one with the lowest hash.
+
+  Attributes:
+    finality_depth (int): The number of blocks after which a block is final and competing branches are pruned.
+    entries (dict): A dictionary of the blocks in the tree, keyed by hash.
+    children (dict): A dictionary mapping block hashes to the hashes of their children.
+    root (str): The hash of the last final block.
+
+  Methods:
+    add: Add a block to the tree.
+    get: Get the entry of a block.
+    best_tip: Get the hash of the best tip according to the fork-choice rule.
+    path: Get the blocks to roll back and to apply to switch between two tips.
+    prune: Make a block final and drop the branches that do not descend from it.
+  """
+
+  def __init__(self, root_block, state, nonces, finality_depth=6):
+    """Initializes a new instance of BlockTree.
+
+    Args:
+      root_block (Block): The last block of the chain, which is considered final.
+      state (dict): The ledger state after the block, keyed by node address.
+      nonces (dict): The last nonce of each sender after the block.
+      finality_depth (int, optional): The number of blocks after which a block is final. Defaults to 6.
+    """
+
+    self.finality_depth = finality_depth
+    self.entries = {}
+    self.children = {}
+    self.root = root_block.hash
+
+    self.insert(root_block, None, state, nonces)
+
+  def __contains__(self, block_hash):
+    return block_hash in self.entries
+
+  def insert(self, block, parent_hash, state, nonces):
+    entry = {
+      'block': block,
+      'parent': parent_hash,
+      'height': block.index,
+      'state': state,
+      'nonces': nonces,
+    }
+    self.entries[block.hash] = entry
+    self.children[block.hash] = []
+
+    return entry
+
+  def add(self, block, state, nonces):
+    """Adds a block to the tree, below its parent.
+
+    Args:
+      block (Block): The block, whose parent must be in the tree.
+      state (dict): The ledger state after the block, keyed by node address.
+      nonces (dict): The last nonce of each sender after the block.
+
+    Returns:
+      dict: The entry of the block.
+    """
+
+    entry = self.insert(block, block.previous_hash, state, nonces)
+    self.children[block.previous_hash].append(block.hash)
+
+    return entry
+
+  def get(self, block_hash):
+    """Gets the entry of a block.
+
+    Args:
+      block_hash (str): The hash of the block.
+
+    Returns:
+      dict: The entry (block, parent, height, state, nonces), or None if the block is not in the tree.
+    """
+
+    return self.entries.get(block_hash)
+
+  def best_tip(self):
+    """Gets the best tip according to the fork-choice rule.
+
+    Returns:
+      str: The hash of the highest block, the lowest hash among blocks of the same height.
+    """
+
+    return min(self.entries, key=lambda block_hash: (-self.entries[block_hash]['height'], block_hash))
+
+  def path(self, from_hash, to_hash):
+    """Gets the blocks to roll back and to apply to switch from one tip to another.
+
+    Args:
+      from_hash (str): The hash of the current tip.
+      to_hash (str): The hash of the new tip.
+
+    Returns:
+      tuple: The hash of the common ancestor, the blocks to roll back (newest first) and the blocks to apply (oldest first).
+    """
+
+    rollback, apply = [], []
+    source, target = self.entries[from_hash], self.entries[to_hash]
+
+    while target['height'] > source['height']:
+      apply.append(target['block'])
+      target = self.entries[target['parent']]
+    while source['height'] > target['height']:
+      rollback.append(source['block'])
+      source = self.entries[source['parent']]
+    while source['block'].hash != target['block'].hash:
+      rollback.append(source['block'])
+      apply.append(target['block'])
+      source, target = self.entries[source['parent']], self.entries[target['parent']]
+
+    return source['block'].hash, rollback, list(reversed(apply))
+
+  def prune(self, tip_hash):
+    """Makes the ancestor of the tip at finality depth final and drops the branches that do not descend from it.
+
+    Args:
+      tip_hash (str): The hash of the current tip.
+
+    Returns:
+      int: The number of dropped blocks of competing branches.
+    """
+
+    root = self.entries[tip_hash]
+    while root['parent'] is not None and root['height'] > self.entries[tip_hash]['height'] - self.finality_depth:
+      root = self.entries[root['parent']]
+
+    if root['block'].hash == self.root:
+      return 0
+
+    # Keep the descendants of the new root
+    keep = set()
+    stack = [root['block'].hash]
+    while stack:
+      block_hash = stack.pop()
+      keep.add(block_hash)
+      stack.extend(self.children[block_hash])
+
+    # The ancestors of the new root are final, the other dropped blocks are stale
+    ancestors = 0
+    entry = root
+    while entry['parent'] is not None:
+      ancestors += 1
+      entry = self.entries[entry['parent']]
+
+    dropped = [block_hash for block_hash in self.entries if block_hash not in keep]
+    for block_hash in dropped:
+      del self.entries[block_hash]
+      del self.children[block_hash]
+
+    root['parent'] = None
+    self.root = root['block'].hash
+
+    return len(dropped) - ancestors
@@ -5,15 +5,16 @@ bootstrap process of the network.
 """
 
 import socket
-import json
 import itertools
 import time
 
 from blockchat.blockchain import Blockchain
+from blockchat.amount import Amount
+from blockchat.transport import PriorityReceiver, SharedMemoryTransport
 
 from blockchat.util import termcolor
 
-def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, test_flag=False):
+def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, test_flag=False, max_block_capacity=None, seal_interval=0.0):
   """Starts the bootstrap process of the network.
 
   This function starts the bootstrap process of the network, which is used to
@@ -27,6 +28,8 @@ def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, te
     bootstrap_port (int): The port of the bootstrap node.
     verbose (bool): Whether to enable verbose mode.
     debug (bool): Whether to enable debug mode.
+    max_block_capacity (int): The upper bound of the adaptive block capacity.
+    seal_interval (float): The maximum age of a pending transaction before its block is sealed.
   """
 
   # Get an output color for each node
@@ -34,7 +37,7 @@ def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, te
   bootstrap.node_color = colors.pop(0)
   color = itertools.cycle(colors)
 
-  blockchain = Blockchain(block_capacity)
+  blockchain = Blockchain(block_capacity, max_block_capacity=max_block_capacity, seal_interval=seal_interval)
   bootstrap.blockchain = blockchain
   bootstrap.log(termcolor.blue('Blockchain created'))
 
@@ -45,23 +48,33 @@ def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, te
 
   # Start the UDP server
   with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+    # Share the port with the other receiver sockets if there are more than one
+    if bootstrap.receivers > 1:
+      PriorityReceiver.share_port(s)
     s.bind((bootstrap_address, bootstrap_port))
     address, port = s.getsockname()
     bootstrap.socket = s
+
+    # Receive control messages ahead of transactions, and use shared memory for the nodes on the same host
+    if bootstrap.shared_memory:
+      bootstrap.socket = SharedMemoryTransport(bootstrap, s, receivers=bootstrap.receivers, receive_buffer=bootstrap.receive_buffer)
+    else:
+      bootstrap.socket = PriorityReceiver(bootstrap, s, receivers=bootstrap.receivers, receive_buffer=bootstrap.receive_buffer)
+    bootstrap.socket.start()
+    bootstrap.start_query_server()
     bootstrap.log(termcolor.blue(f'Listening on {termcolor.underline(f"{address}:{port}")}'))
 
-    bootstrap.transaction_handler.start()
-    bootstrap.block_handler.start()
+    # Profile on SIGUSR1 (only possible when running on the main thread)
+    bootstrap.profiler.install_signal_handler(10.0, 'profile', bootstrap.profile_done)
+
+    bootstrap.start_handlers()
 
     # Listen for messages
     try:
       while True:
-        message, (address, port) = s.recvfrom(4096*block_capacity)
-
-        # Try parsing the message
-        try:
-          message = json.loads(message.decode())
-        except json.JSONDecodeError:
+        # The message is decoded straight from the receive buffer, None if it is not valid JSON
+        message, (address, port) = bootstrap.socket.receive()
+        if message is None:
           bootstrap.log(termcolor.yellow(f'Invalid message received from {termcolor.underline(f"{address}:{port}")}'), not bootstrap.debug)
           continue
 
@@ -75,10 +88,10 @@ def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, te
           if bootstrap.node_counter >= nodes_count:
             bootstrap.log(termcolor.yellow('Node limit reached'), not bootstrap.debug)
           else:
-            new_node = bootstrap.add_node(bootstrap.node_counter, message['key'], address, port, message['stake'])
+            new_node = bootstrap.add_node(bootstrap.node_counter, message['key'], address, port, message['stake'] if Amount.is_valid(message['stake']) else 0, light=message.get('light', False))
             bootstrap.activate_node(new_node, next(color))
             bootstrap.broadcast_node(new_node)
-            bootstrap.execute_transaction(new_node['id'], 'coins', 1000.0)
+            bootstrap.execute_transaction(new_node['id'], 'coins', Amount.from_coins(1000))
 
             # Start the test messenger when all nodes have connected
             if bootstrap.node_counter == nodes_count:
@@ -91,18 +104,29 @@ def start_bootstrap(nodes_count, block_capacity, bootstrap, ready_queue=None, te
               if test_flag:
                 bootstrap.test_messenger.start()
 
-        elif message['message_type'] == 'transaction':
-          bootstrap.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address}:{port}")} (transaction)'), not bootstrap.debug)
-          bootstrap.receive_transaction(message['transaction'])
-
-        elif message['message_type'] == 'block':
-          bootstrap.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address}:{port}")} (block)'), not bootstrap.debug)
-          bootstrap.receive_block(message['block'])
-
-        else:
+        elif not bootstrap.dispatch(message, (address, port)):
           bootstrap.log(termcolor.yellow(f'Invalid message received from {termcolor.underline(f"{address}:{port}")}'), not bootstrap.debug)
     except KeyboardInterrupt:
       # Terminate the process if the user interrupts it
       bootstrap.log(termcolor.blue('Process terminated by user'))
+
+      if bootstrap.tracer is not None:
+        count = bootstrap.tracer.export(f'trace-{bootstrap.id}.jsonl')
+        bootstrap.log(termcolor.blue(f'Exported {count} spans to trace-{bootstrap.id}.jsonl'))
+
+      stats = bootstrap.get_stats()
+      received = stats['receive']
+      bootstrap.log(termcolor.blue(f'Received {received["control"]} control and {received["data"]} data messages, {received["overtaken"]} control messages overtook waiting data messages, {received["inbox_dropped"]} messages were dropped on a full inbox lane, {received["buffer_misses"]} datagrams found no free buffer'))
+      bootstrap.log(termcolor.blue(f'Received {received["datagrams"]} datagrams per receiver socket, the kernel dropped {received["drops"]}'))
+
+      admitted = stats['transactions']
+      bootstrap.log(termcolor.blue(f'Admitted {admitted["admitted"]} transactions, shed {admitted["shed_rate"]} over their peer rate and {admitted["shed_full"]} on a full queue, shed {stats["blocks"]["shed"]} blocks'))
+
+      if bootstrap.shared_memory:
+        bootstrap.log(termcolor.blue(f'Sent {bootstrap.socket.sent} and received {bootstrap.socket.received} messages through shared memory'))
+      bootstrap.socket.close()
+      bootstrap.history.close()
+      if bootstrap.query_server is not None:
+        bootstrap.query_server.close()
       s.close()
       return
@@ -0,0 +1,177 @@
+"""A module for the Broadcaster class.
+
+This module contains the Broadcaster class, which is used by a node to send a
+message to every node in the network without blocking the calling thread.
+"""
+
+import json
+
+from threading import Thread, Lock
+from queue import Queue, Full
+
+from blockchat.util import termcolor
+
+class Broadcaster:
+  """A class to represent the broadcast subsystem of a node.
+
+  A message is serialized once and handed to a small pool of sender threads.
+  Every peer is always served by the same sender thread, so the messages to a
+  peer keep the order in which they were broadcast, while each sender thread
+  sends its whole batch of peers in one go. With no sender threads, messages
+  are sent from the calling thread. Messages addressed to the node itself
+  skip the network and are delivered locally. Light clients do not get
+  transactions and blocks, their full peer sends them the headers.
+
+  The sender threads are started once, on the first broadcast. Their queues are
+  bounded: a batch that does not fit is dropped and counted, like a datagram
+  lost on the network, and the repair paths of the node recover it. A peer
+  that cannot be reached does not stop the thread, the error is logged and the
+  thread goes on with the next peer.
+
+  Attributes:
+    node (Node): The node that owns the broadcaster.
+    workers (int): The number of sender threads, 0 to send from the calling thread.
+    queue_size (int): The maximum number of batches waiting in the queue of a sender thread.
+    queues (list): A list of Queue objects, one per sender thread.
+    sent (int): The number of datagrams sent.
+    dropped (int): The number of batches dropped because the queue of their sender thread was full.
+    errors (int): The number of datagrams that could not be sent.
+    full_types (set): The types of the messages only sent to full nodes.
+
+  Methods:
+    broadcast: Broadcast a message to all nodes in the network.
+    start: Start the sender threads.
+    ensure_started: Start the sender threads if they were not started yet.
+    enqueue: Queue a batch for a sender thread, dropping it if the queue is full.
+    send: Send a payload to a list of addresses.
+    send_batches: Send the queued batches of a sender thread.
+  """
+
+  full_types = {'transaction', 'block', 'compact_block'}
+
+  def __init__(self, node, workers=2, queue_size=1024):
+    """Initializes a new instance of Broadcaster.
+
+    Args:
+      node (Node): The node that owns the broadcaster.
+      workers (int, optional): The number of sender threads, 0 to send from the calling thread. Defaults to 2.
+      queue_size (int, optional): The maximum number of batches waiting for a sender thread. Defaults to 1024.
+    """
+
+    self.node = node
+    self.workers = workers
+    self.queue_size = queue_size
+    self.queues = []
+    self.sent = 0
+    self.dropped = 0
+    self.errors = 0
+
+    self.started = False
+    self.start_lock = Lock()
+    self.stats_lock = Lock()
+
+  def start(self):
+    """Starts the sender threads."""
+
+    for _ in range(self.workers):
+      queue = Queue(maxsize=self.queue_size)
+      thread = Thread(target=self.send_batches, args=(queue,))
+      thread.daemon = True
+      thread.start()
+      self.queues.append(queue)
+
+  def ensure_started(self):
+    """Starts the sender threads (and the threads of a subclass) exactly once."""
+
+    with self.start_lock:
+      if not self.started:
+        self.started = True
+        self.start()
+
+  def enqueue(self, queue, payload, addresses):
+    """Queues a batch for a sender thread, dropping it if the queue is full.
+
+    Args:
+      queue (Queue): The queue of the sender thread.
+      payload (bytes): The serialized message.
+      addresses (list): The (address, port) of the peers.
+    """
+
+    try:
+      queue.put_nowait((payload, addresses))
+    except Full:
+      with self.stats_lock:
+        self.dropped += 1
+
+  def send(self, payload, addresses):
+    """Sends a payload to a list of addresses, logging the peers that cannot be reached.
+
+    Args:
+      payload (bytes): The serialized message.
+      addresses (list): The (address, port) of the peers.
+    """
+
+    sent = errors = 0
+    for address in addresses:
+      try:
+        self.node.socket.sendto(payload, address)
+        sent += 1
+      except OSError as e:
+        errors += 1
+        self.node.log(termcolor.yellow(f'Could not send to {termcolor.underline(f"{address[0]}:{address[1]}")}: {e}'), not self.node.debug)
+
+    with self.stats_lock:
+      self.sent += sent
+      self.errors += errors
+
+  def broadcast(self, message, exclude=()):
+    """Broadcasts a message to all nodes in the network.
+
+    Args:
+      message (dict): The message.
+      exclude (iterable, optional): The IDs of the nodes that should not receive the message.
+
+    Returns:
+      bytes: The serialized message.
+    """
+
+    if self.workers:
+      self.ensure_started()
+
+    payload = json.dumps(message).encode()
+
+    batches = [[] for _ in range(max(self.workers, 1))]
+    deliver_locally = False
+    for node in self.node.blockchain.nodes:
+      if node['id'] in exclude or node.get('light') and message['message_type'] in self.full_types:
+        continue
+      if node['id'] == self.node.id:
+        deliver_locally = True
+        continue
+      batches[node['id'] % len(batches)].append((node['address'], node['port']))
+
+    if not self.workers:
+      self.send(payload, batches[0])
+    else:
+      for queue, batch in zip(self.queues, batches):
+        if batch:
+          self.enqueue(queue, payload, batch)
+
+    if deliver_locally:
+      self.node.deliver(message)
+
+    return payload
+
+  def send_batches(self, queue):
+    """Sends the batches of a sender thread, until the process exits.
+
+    Args:
+      queue (Queue): The queue of (payload, addresses) batches of the thread.
+    """
+
+    while True:
+      payload, addresses = queue.get()
+      try:
+        self.send(payload, addresses)
+      except Exception as e:
+        self.node.log(termcolor.red(f'Sender thread failed to send a message: {e!r}'), not self.node.debug)
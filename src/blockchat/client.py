@@ -5,11 +5,11 @@ process of the network.
 """
 
 import socket
-import json
 import time
 
 from blockchat.blockchain import Blockchain
 from blockchat.transaction import Transaction
+from blockchat.transport import PriorityReceiver, SharedMemoryTransport
 
 from blockchat.util import termcolor
 
@@ -29,12 +29,17 @@ def start_node(nodes_count, block_capacity, client, ready_queue=None, test_flag=
 
   # Start the UDP server
   with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-    # Bind to a random port
+    # Bind to a random port, shared with the other receiver sockets if there are more than one
+    if client.receivers > 1:
+      PriorityReceiver.share_port(s)
     s.bind(('0.0.0.0', port))
     address, port = s.getsockname()
     client.socket = s
     client.log(termcolor.blue(f'Client node listening on {termcolor.underline(f"{address}:{port}")}'))
 
+    # Profile on SIGUSR1 (only possible when running on the main thread)
+    client.profiler.install_signal_handler(10.0, 'profile', client.profile_done)
+
     # Ping bootstrap to see if it is
     try:
       client.ping_bootstrap()
@@ -44,6 +49,14 @@ def start_node(nodes_count, block_capacity, client, ready_queue=None, test_flag=
       s.close()
       return
 
+    # Receive control messages ahead of transactions, and use shared memory for the nodes on the same host
+    if client.shared_memory:
+      client.socket = SharedMemoryTransport(client, s, receivers=client.receivers, receive_buffer=client.receive_buffer)
+    else:
+      client.socket = PriorityReceiver(client, s, receivers=client.receivers, receive_buffer=client.receive_buffer)
+    client.socket.start()
+    client.start_query_server()
+
     # Send public-key to bootstrap to get an id
     client.send_key()
 
@@ -64,16 +77,14 @@ def start_node(nodes_count, block_capacity, client, ready_queue=None, test_flag=
               ready_queue.put('ready')
               time.sleep(0.1)
 
-          if test_flag and all(node['balance'] > 0 for node in client.blockchain.nodes):  # and False:
+          # A light client only knows its own balance
+          if test_flag and (client.wallet.balance > 0 if client.light else all(node['balance'] > 0 for node in client.blockchain.nodes)):  # and False:
             test_flag = False
             client.test_messenger.start()
 
-        message, (address, port) = s.recvfrom(4096*block_capacity)
-
-        # Try parsing the message
-        try:
-          message = json.loads(message.decode())
-        except json.JSONDecodeError:
+        # The message is decoded straight from the receive buffer, None if it is not valid JSON
+        message, (address, port) = client.socket.receive()
+        if message is None:
           client.log(termcolor.yellow(f'Invalid message received from {termcolor.underline(f"{address}:{port}")}'), not client.debug)
           continue
 
@@ -84,31 +95,50 @@ def start_node(nodes_count, block_capacity, client, ready_queue=None, test_flag=
           client.node_color = message['color']
 
           blockchain = Blockchain(**message['blockchain'])
+          if client.light:
+            client.activate_light(blockchain, message['headers'], message['balance'])
+            client.log(termcolor.magenta('Waiting for all nodes to connect...'))
+            continue
+
           client.validate_chain(blockchain)
           client.blockchain = blockchain
           client.node_counter = len(client.blockchain.nodes)
           client.current_block = [Transaction(**transaction) for transaction in message['current_block']]
+          for transaction in message['current_block']:
+            client.pool_transaction(transaction)
           client.log(termcolor.magenta('Waiting for all nodes to connect...'))
 
-          client.transaction_handler.start()
-          client.block_handler.start()
+          if client.multicast_group is not None and 'multicast_sequences' in message:
+            client.broadcaster.set_sequences(message['multicast_sequences'])
+          client.start_handlers()
 
         elif message['message_type'] == 'node' and (address, port) == (client.bootstrap_address, client.bootstrap_port):
           client.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address}:{port}")} (node)'), not client.debug)
           client.add_node(**message['node'])
 
-        elif message['message_type'] == 'transaction':
-          client.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address}:{port}")} (transaction)'), not client.debug)
-          client.receive_transaction(message['transaction'])
-
-        elif message['message_type'] == 'block':
-          client.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address}:{port}")} (block)'), not client.debug)
-          client.receive_block(message['block'])
-
-        else:
+        elif not client.dispatch(message, (address, port)):
           client.log(termcolor.yellow(f'Invalid message received from {termcolor.underline(f"{address}:{port}")} (type: {message["message_type"]})'), not client.debug)
     except KeyboardInterrupt:
       # Terminate the process if the user interrupts it
       client.log(termcolor.blue('Process terminated by user'))
+
+      if client.tracer is not None:
+        count = client.tracer.export(f'trace-{client.id}.jsonl')
+        client.log(termcolor.blue(f'Exported {count} spans to trace-{client.id}.jsonl'))
+
+      stats = client.get_stats()
+      received = stats['receive']
+      client.log(termcolor.blue(f'Received {received["control"]} control and {received["data"]} data messages, {received["overtaken"]} control messages overtook waiting data messages, {received["inbox_dropped"]} messages were dropped on a full inbox lane, {received["buffer_misses"]} datagrams found no free buffer'))
+      client.log(termcolor.blue(f'Received {received["datagrams"]} datagrams per receiver socket, the kernel dropped {received["drops"]}'))
+
+      admitted = stats['transactions']
+      client.log(termcolor.blue(f'Admitted {admitted["admitted"]} transactions, shed {admitted["shed_rate"]} over their peer rate and {admitted["shed_full"]} on a full queue, shed {stats["blocks"]["shed"]} blocks'))
+
+      if client.shared_memory:
+        client.log(termcolor.blue(f'Sent {client.socket.sent} and received {client.socket.received} messages through shared memory'))
+      client.socket.close()
+      client.history.close()
+      if client.query_server is not None:
+        client.query_server.close()
       s.close()
       return
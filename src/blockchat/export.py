@@ -0,0 +1,250 @@
+"""A module for the ChainExporter class.
+
+This module contains the ChainExporter class, which is used to export the
+blocks and transactions of the blockchain to column files on disk, for offline
+analysis of fees, volume and validators.
+"""
+
+import os
+import json
+import struct
+
+from datetime import datetime
+
+from blockchat.amount import Amount
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+class ChainExporter:
+  """A class to export the blockchain to column files, one file per column.
+
+  Every column is a file of fixed-size little-endian values, so a column can be
+  appended to without rewriting it, and read as an array (np.memmap) without
+  parsing. The blocks table has one row per block and the transactions table
+  one row per transaction; 'columns.json' holds the number of rows, the types
+  of the columns and the names of the transaction types. Exporting streams
+  block by block and only appends the blocks after the last exported one; if
+  the chain switched branch since then, the rows of the replaced blocks are
+  truncated first. Values and fees are integers of minor units (see Amount),
+  so sums over a column are exact; the columns of an older format are
+  exported again from the first block.
+
+  Reading the columns (load, summary) requires NumPy, writing them does not.
+
+  Attributes:
+    directory (str): The directory of the column files.
+    meta (dict): The contents of 'columns.json'.
+
+  Methods:
+    export: Append the new blocks of a blockchain to the column files.
+    load: Load the columns of a directory as arrays.
+    summary: Aggregate the fees, volume and blocks per validator and type.
+  """
+
+  block_columns = {'index': '<q', 'timestamp': '<d', 'validator': '<q', 'hash': '64s', 'first_transaction': '<q'}
+  transaction_columns = {'block': '<q', 'sender': '<q', 'receiver': '<q', 'type': '<b', 'value': '<q', 'fee': '<q'}
+  dtypes = {'<q': '<i8', '<d': '<f8', '<b': 'i1', '64s': 'S64'}
+  types = ['coins', 'message', 'stake']
+
+  def __init__(self, directory):
+    """Initializes a new instance of ChainExporter, creating the directory if needed.
+
+    Args:
+      directory (str): The directory of the column files.
+    """
+
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+    columns = {
+      'blocks': {name: self.dtypes[code] for name, code in self.block_columns.items()},
+      'transactions': {name: self.dtypes[code] for name, code in self.transaction_columns.items()},
+    }
+
+    try:
+      with open(os.path.join(directory, 'columns.json')) as f:
+        self.meta = json.load(f)
+    except FileNotFoundError:
+      self.meta = None
+
+    if self.meta is None or self.meta['columns'] != columns:
+      for table, dtypes in columns.items():
+        for column in dtypes:
+          if os.path.exists(self.path(table, column)):
+            os.remove(self.path(table, column))
+
+      self.meta = {'blocks': 0, 'transactions': 0, 'types': self.types, 'columns': columns}
+
+  def path(self, table, column):
+    return os.path.join(self.directory, f'{table}.{column}.bin')
+
+  def read(self, table, column, row):
+    """Reads one value of a column.
+
+    Args:
+      table (str): The table, 'blocks' or 'transactions'.
+      column (str): The column.
+      row (int): The row.
+
+    Returns:
+      The value.
+    """
+
+    code = (self.block_columns if table == 'blocks' else self.transaction_columns)[column]
+    size = struct.calcsize(code)
+    with open(self.path(table, column), 'rb') as f:
+      f.seek(row * size)
+      return struct.unpack(code, f.read(size))[0]
+
+  def truncate(self, blocks):
+    """Removes the rows of the blocks after a given number of blocks, and of their transactions.
+
+    Args:
+      blocks (int): The number of blocks to keep.
+    """
+
+    transactions = self.read('blocks', 'first_transaction', blocks) if blocks < self.meta['blocks'] else self.meta['transactions']
+
+    for table, columns, rows in (('blocks', self.block_columns, blocks), ('transactions', self.transaction_columns, transactions)):
+      for column, code in columns.items():
+        with open(self.path(table, column), 'r+b') as f:
+          f.truncate(rows * struct.calcsize(code))
+
+    self.meta['blocks'] = blocks
+    self.meta['transactions'] = transactions
+
+  def export(self, blockchain, until=None):
+    """Appends the blocks of a blockchain that are not exported yet to the column files.
+
+    Args:
+      blockchain (Blockchain): The blockchain.
+      until (int, optional): The number of blocks to export, e.g. to leave out blocks that are not final. Defaults to all.
+
+    Returns:
+      int: The number of appended blocks.
+    """
+
+    chain = blockchain.chain[:until]
+    ids = {node['key']: node['id'] for node in blockchain.nodes}
+
+    # Keep the exported blocks that are still in the chain
+    start = min(self.meta['blocks'], len(chain))
+    while start > 0 and self.read('blocks', 'hash', start - 1).decode() != chain[start - 1].hash:
+      start -= 1
+    if start < self.meta['blocks']:
+      self.truncate(start)
+
+    files = {}
+    for table, columns in (('blocks', self.block_columns), ('transactions', self.transaction_columns)):
+      for column, code in columns.items():
+        files[table, column] = (open(self.path(table, column), 'ab'), struct.Struct(code))
+
+    try:
+      for block in chain[start:]:
+        row = {
+          'index': block.index,
+          'timestamp': datetime.fromisoformat(block.timestamp).timestamp(),
+          'validator': block.validator,
+          'hash': block.hash.encode(),
+          'first_transaction': self.meta['transactions'],
+        }
+        for column in self.block_columns:
+          file, packer = files['blocks', column]
+          file.write(packer.pack(row[column]))
+
+        for transaction in block.transactions:
+          sender = ids.get(transaction.sender_address, -1)
+          if transaction.type_of_transaction == 'message':
+            value = fee = Amount.message_cost(transaction.value)
+          else:
+            value = transaction.value
+            fee = Amount.fee(value, blockchain.fee_rate) if transaction.type_of_transaction == 'coins' and sender >= 0 else 0
+
+          row = {
+            'block': block.index,
+            'sender': sender,
+            'receiver': ids.get(transaction.receiver_address, -1),
+            'type': self.types.index(transaction.type_of_transaction),
+            'value': value,
+            'fee': fee,
+          }
+          for column in self.transaction_columns:
+            file, packer = files['transactions', column]
+            file.write(packer.pack(row[column]))
+
+        self.meta['blocks'] += 1
+        self.meta['transactions'] += len(block.transactions)
+    finally:
+      for file, _ in files.values():
+        file.close()
+
+      # Publish the new row counts only after the rows are written
+      temporary = os.path.join(self.directory, 'columns.json.tmp')
+      with open(temporary, 'w') as f:
+        json.dump(self.meta, f)
+      os.replace(temporary, os.path.join(self.directory, 'columns.json'))
+
+    return len(chain) - start
+
+  @staticmethod
+  def load(directory):
+    """Loads the columns of a directory as memory-mapped arrays.
+
+    Args:
+      directory (str): The directory of the column files.
+
+    Returns:
+      dict: A dictionary with the 'blocks' and 'transactions' tables (dictionaries mapping column names to arrays) and the transaction 'types'.
+    """
+
+    if np is None:
+      raise ImportError('Loading exported columns requires numpy')
+
+    with open(os.path.join(directory, 'columns.json')) as f:
+      meta = json.load(f)
+
+    columns = {'types': meta['types']}
+    for table, dtypes in meta['columns'].items():
+      columns[table] = {}
+      for column, dtype in dtypes.items():
+        path = os.path.join(directory, f'{table}.{column}.bin')
+        rows = meta[table]
+        columns[table][column] = np.memmap(path, dtype=dtype, mode='r', shape=(rows,)) if rows else np.empty(0, dtype=dtype)
+
+    return columns
+
+  @staticmethod
+  def summary(columns):
+    """Aggregates the fees earned and blocks validated by each validator, and the count and volume of each transaction type.
+
+    Args:
+      columns (dict): The columns, as returned by load.
+
+    Returns:
+      dict: The aggregates.
+    """
+
+    blocks, transactions = columns['blocks'], columns['transactions']
+
+    # Block indices are positions in the chain, so the validator of a transaction is a lookup
+    validators = blocks['validator'][transactions['block']]
+    size = int(blocks['validator'].max()) + 1 if len(blocks['validator']) else 0
+    # Sum in int64 (bincount weights are floats), so the totals are exact
+    fees = np.zeros(size, dtype=np.int64)
+    np.add.at(fees, validators, transactions['fee'])
+    validated = np.bincount(blocks['validator'], minlength=size)
+
+    count = np.bincount(transactions['type'], minlength=len(columns['types']))
+    volume = np.zeros(len(columns['types']), dtype=np.int64)
+    np.add.at(volume, transactions['type'], transactions['value'])
+
+    return {
+      'blocks': len(blocks['index']),
+      'transactions': len(transactions['block']),
+      'fees': int(transactions['fee'].sum()),
+      'validators': {validator: {'blocks': int(validated[validator]), 'fees': int(fees[validator])} for validator in range(size) if validated[validator]},
+      'types': {name: {'count': int(count[code]), 'volume': int(volume[code])} for code, name in enumerate(columns['types'])},
+    }
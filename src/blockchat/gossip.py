@@ -0,0 +1,222 @@
+"""A module for the Gossip class.
+
+This module contains the Gossip class, an epidemic broadcast subsystem that a
+node can use instead of sending every transaction and block to every other node.
+"""
+
+import json
+import time
+import random
+import hashlib
+
+from collections import OrderedDict
+from threading import Thread, Lock
+
+from blockchat.broadcast import Broadcaster
+
+class Gossip(Broadcaster):
+  """A class to represent the gossip (epidemic) broadcast subsystem of a node.
+
+  Transactions and blocks are wrapped in a 'gossip' envelope and sent to a few
+  random peers (the fanout). Every node identifies a message by the hash of its
+  payload, computed locally, so a peer cannot make the node drop a message by
+  sending another one under the same id. A node that receives an
+  envelope for the first time delivers it locally and forwards it to another
+  set of random peers; envelopes that were already seen are dropped. Messages
+  that get lost are repaired by pulling: every repair interval the node sends
+  the ids of its most recent messages to a random peer, which answers with the
+  messages that are missing from that list. All other message types are sent
+  to every node, as with the Broadcaster. With no sender threads, envelopes are
+  sent from the calling thread and the owner of the node sends the pull
+  requests (e.g. the simulator, on its virtual clock).
+
+  The peers are taken from the membership list in Blockchain.nodes.
+
+  Attributes:
+    fanout (int): The number of peers each message is forwarded to.
+    capacity (int): The maximum number of seen messages kept for deduplication and repair.
+    digest_size (int): The number of recent message ids (shortened to 16 characters) sent in a pull request.
+    repair_interval (float): The time between two pull requests in seconds.
+    seen (OrderedDict): The recently seen messages, keyed by id.
+
+  Methods:
+    broadcast: Gossip a transaction or block, or send any other message to all nodes.
+    receive: Handle a gossip envelope received from a peer.
+    pull: Answer a pull request with the messages the peer is missing.
+    repair: Periodically send pull requests to random peers.
+    pull_request: Send a pull request to a random peer.
+    message_id: Get the id of a transaction or block message, the hash of its payload.
+  """
+
+  gossip_types = ('transaction', 'block', 'compact_block')
+
+  def __init__(self, node, fanout=3, capacity=4096, digest_size=128, repair_interval=1.0, workers=2):
+    """Initializes a new instance of Gossip.
+
+    Args:
+      node (Node): The node that owns the gossip subsystem.
+      fanout (int, optional): The number of peers each message is forwarded to. Defaults to 3.
+      capacity (int, optional): The maximum number of seen messages. Defaults to 4096.
+      digest_size (int, optional): The number of message ids in a pull request. Defaults to 128.
+      repair_interval (float, optional): The time between two pull requests in seconds. Defaults to 1.0.
+      workers (int, optional): The number of sender threads, 0 to send from the calling thread without a repair thread. Defaults to 2.
+    """
+
+    super().__init__(node, workers)
+
+    self.fanout = fanout
+    self.capacity = capacity
+    self.digest_size = digest_size
+    self.repair_interval = repair_interval
+
+    self.seen = OrderedDict()
+    self.seen_lock = Lock()
+
+    # Keep a private generator, the global one is seeded for validator selection
+    self.random = random.Random()
+
+  def start(self):
+    """Starts the sender threads and the repair thread."""
+
+    super().start()
+
+    thread = Thread(target=self.repair)
+    thread.daemon = True
+    thread.start()
+
+  @staticmethod
+  def message_id(message):
+    """Gets the id of a transaction or block message, which is the SHA-256 hash of its canonical JSON payload.
+
+    Args:
+      message (dict): The message.
+
+    Returns:
+      str: The id of the message.
+    """
+
+    return hashlib.sha256(json.dumps(message, sort_keys=True).encode()).hexdigest()
+
+  def remember(self, message_id, message):
+    """Marks a message as seen.
+
+    Args:
+      message_id (str): The id of the message.
+      message (dict): The message.
+
+    Returns:
+      bool: True if the message was not seen before, False otherwise.
+    """
+
+    with self.seen_lock:
+      if message_id in self.seen:
+        return False
+
+      self.seen[message_id] = message
+      while len(self.seen) > self.capacity:
+        self.seen.popitem(last=False)
+
+      return True
+
+  def forward(self, envelope, exclude_address=None):
+    """Sends a gossip envelope to fanout random peers.
+
+    Args:
+      envelope (dict): The gossip envelope.
+      exclude_address (tuple, optional): The (address, port) of a peer that should not receive it.
+    """
+
+    if self.workers:
+      self.ensure_started()
+
+    peers = [
+      node for node in self.node.blockchain.nodes
+      if node['id'] != self.node.id and not node.get('light') and (node['address'], node['port']) != exclude_address
+    ]
+    peers = self.random.sample(peers, min(self.fanout, len(peers)))
+
+    payload = json.dumps(envelope).encode()
+    if not self.workers:
+      self.send(payload, [(node['address'], node['port']) for node in peers])
+      return
+
+    batches = [[] for _ in range(self.workers)]
+    for node in peers:
+      batches[node['id'] % self.workers].append((node['address'], node['port']))
+
+    for queue, batch in zip(self.queues, batches):
+      if batch:
+        self.enqueue(queue, payload, batch)
+
+  def broadcast(self, message, exclude=()):
+    """Gossips a transaction or block, or sends any other message to all nodes.
+
+    Args:
+      message (dict): The message.
+      exclude (iterable, optional): The IDs of the nodes that should not receive a non-gossip message.
+    """
+
+    if message['message_type'] not in self.gossip_types:
+      return super().broadcast(message, exclude)
+
+    message_id = self.message_id(message)
+    self.remember(message_id, message)
+
+    self.forward({'message_type': 'gossip', 'message': message})
+    self.node.deliver(message)
+
+  def receive(self, envelope, address):
+    """Handles a gossip envelope received from a peer.
+
+    Args:
+      envelope (dict): The gossip envelope.
+      address (tuple): The (address, port) of the peer.
+
+    Returns:
+      bool: True if the message was new and delivered, False if it was a duplicate.
+    """
+
+    message = envelope['message']
+    if message['message_type'] not in self.gossip_types or not self.remember(self.message_id(message), message):
+      return False
+
+    self.forward(envelope, address)
+    self.node.deliver(message, address)
+
+    return True
+
+  def pull(self, request, address):
+    """Answers a pull request with the recent messages missing from the peer's digest.
+
+    Args:
+      request (dict): The pull request, with the list of ids the peer holds.
+      address (tuple): The (address, port) of the peer.
+    """
+
+    known = set(request['ids'])
+    with self.seen_lock:
+      recent = list(self.seen.items())[-self.digest_size:]
+
+    for message_id, message in recent:
+      if message_id[:16] not in known:
+        self.node.socket.sendto(json.dumps({'message_type': 'gossip', 'message': message}).encode(), address)
+
+  def repair(self):
+    """Periodically sends a pull request with the ids of the recent messages to a random peer."""
+
+    while True:
+      time.sleep(self.repair_interval)
+      self.pull_request()
+
+  def pull_request(self):
+    """Sends a pull request with the ids of the recent messages to a random peer."""
+
+    peers = [node for node in self.node.blockchain.nodes if node['id'] != self.node.id and not node.get('light')]
+    if not peers:
+      return
+
+    with self.seen_lock:
+      ids = [message_id[:16] for message_id in list(self.seen)[-self.digest_size:]]
+
+    peer = self.random.choice(peers)
+    self.node.socket.sendto(json.dumps({'message_type': 'gossip_pull', 'ids': ids}).encode(), (peer['address'], peer['port']))
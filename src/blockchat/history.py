@@ -0,0 +1,280 @@
+"""A module for the History class.
+
+This module contains the History class, which is used to keep the transaction
+history of a node, indexed by account and block, with a bounded in-memory window
+that spills older entries to disk.
+"""
+
+import os
+import json
+import tempfile
+
+from collections import OrderedDict, deque
+from itertools import islice
+from threading import Lock
+
+from blockchat.amount import Amount
+
+class History:
+  """A class to represent the transaction history of a node.
+
+  Entries are dictionaries with a sequence number, the transaction uuid (None
+  for credits), the block index (None while pending), the sender and receiver
+  ids, the type, the value and the timestamp. Only the most recent entries are
+  kept in memory, together with indexes by account, block and uuid; older
+  entries are appended to a JSON lines spill file and are only read back when
+  a query asks for them, one line at a time. Entries that are spilled while
+  still pending keep receiving their confirmations in a small overlay that is
+  applied when the spill file is read.
+
+  Attributes:
+    max_entries (int): The maximum number of entries kept in memory.
+    file_path (str): The path of the spill file, created on first spill.
+    temporary (bool): A boolean indicating whether the spill file is a temporary file removed on close.
+    entries (OrderedDict): The in-memory entries, keyed by sequence number.
+    by_account (dict): A dictionary mapping node ids to deques of sequence numbers.
+    by_block (dict): A dictionary mapping block indexes to lists of sequence numbers.
+    by_uuid (dict): A dictionary mapping transaction uuids to sequence numbers.
+    confirmations (OrderedDict): The block indexes of entries spilled while pending, keyed by uuid.
+    spilled (int): The number of entries written to the spill file.
+
+  Methods:
+    add: Add an entry to the history.
+    confirm: Set (or clear) the block index of the entries of registered transactions.
+    query: Get a page of entries, newest first, filtered by account, block or time.
+    format: Format an entry as a line of text.
+    close: Remove the spill file if it is temporary.
+  """
+
+  def __init__(self, max_entries=10000, file_path=None):
+    """Initializes a new instance of History.
+
+    Args:
+      max_entries (int, optional): The maximum number of entries kept in memory. Defaults to 10000.
+      file_path (str, optional): The path of the spill file. Defaults to a temporary file.
+    """
+
+    self.max_entries = max_entries
+    self.file_path = file_path
+    self.temporary = file_path is None
+
+    self.entries = OrderedDict()
+    self.by_account = {}
+    self.by_block = {}
+    self.by_uuid = {}
+    self.confirmations = OrderedDict()
+
+    self.sequence = 0
+    self.spilled = 0
+
+    self.lock = Lock()
+
+  def __len__(self):
+    return self.sequence
+
+  def add(self, type_of_transaction, value, timestamp, sender=None, receiver=None, uuid=None, block=None):
+    """Adds an entry to the history, spilling the oldest entry to disk if the window is full.
+
+    Args:
+      type_of_transaction (str): The type of the entry ('coins', 'message', 'stake' or 'credit').
+      value (int or str): The value of the entry, in minor units, or the message.
+      timestamp (str): The ISO timestamp of the entry.
+      sender (int, optional): The ID of the sender. Defaults to None.
+      receiver (int, optional): The ID of the receiver. Defaults to None.
+      uuid (str, optional): The UUID of the transaction. Defaults to None.
+      block (int, optional): The index of the block. Defaults to None (pending).
+
+    Returns:
+      dict: The new entry.
+    """
+
+    with self.lock:
+      entry = {
+        'seq': self.sequence,
+        'uuid': uuid,
+        'block': block,
+        'sender': sender,
+        'receiver': receiver,
+        'type': type_of_transaction,
+        'value': value,
+        'timestamp': timestamp,
+      }
+      self.sequence += 1
+
+      self.entries[entry['seq']] = entry
+      for account in {sender, receiver} - {None}:
+        self.by_account.setdefault(account, deque()).append(entry['seq'])
+      if block is not None:
+        self.by_block.setdefault(block, []).append(entry['seq'])
+      if uuid is not None:
+        self.by_uuid[uuid] = entry['seq']
+
+      while len(self.entries) > self.max_entries:
+        self.spill(self.entries.popitem(last=False)[1])
+
+      return entry
+
+  def spill(self, entry):
+    """Appends an evicted entry to the spill file and drops it from the indexes.
+
+    Args:
+      entry (dict): The entry.
+    """
+
+    if self.file_path is None and self.temporary:
+      with tempfile.NamedTemporaryFile(prefix='blockchat-history-', suffix='.jsonl', delete=False) as f:
+        self.file_path = f.name
+
+    with open(self.file_path, 'a') as f:
+      f.write(json.dumps(entry) + '\n')
+    self.spilled += 1
+
+    # Indexes are appended in sequence order, so the evicted entry is always first
+    for account in {entry['sender'], entry['receiver']} - {None}:
+      seqs = self.by_account[account]
+      seqs.popleft()
+      if not seqs:
+        del self.by_account[account]
+    if entry['block'] is not None:
+      seqs = self.by_block[entry['block']]
+      seqs.pop(0)
+      if not seqs:
+        del self.by_block[entry['block']]
+    if entry['uuid'] is not None:
+      self.by_uuid.pop(entry['uuid'], None)
+
+      # Keep following the block of a pending entry, bounded like the window itself
+      if entry['block'] is None:
+        self.confirmations[entry['uuid']] = None
+        while len(self.confirmations) > self.max_entries:
+          self.confirmations.popitem(last=False)
+
+  def confirm(self, block, uuids):
+    """Sets the block index of the entries of registered transactions.
+
+    Entries move to the new block if the chain was reorganized, and a block
+    index of None marks them as pending again. Entries that were spilled while
+    pending are updated in the confirmations overlay instead.
+
+    Args:
+      block (int): The index of the block, or None.
+      uuids (iterable): The UUIDs of the transactions in the block.
+    """
+
+    with self.lock:
+      for uuid in uuids:
+        if uuid in self.confirmations:
+          self.confirmations[uuid] = block
+          continue
+
+        seq = self.by_uuid.get(uuid)
+        if seq is None or seq not in self.entries:
+          continue
+
+        entry = self.entries[seq]
+        if entry['block'] == block:
+          continue
+
+        if entry['block'] is not None:
+          seqs = self.by_block[entry['block']]
+          seqs.remove(seq)
+          if not seqs:
+            del self.by_block[entry['block']]
+
+        entry['block'] = block
+        if block is not None:
+          seqs = self.by_block.setdefault(block, [])
+          seqs.append(seq)
+          seqs.sort()
+
+  def query(self, account=None, block=None, since=None, until=None, page=0, page_size=20):
+    """Gets a page of entries, newest first, matching all the given filters.
+
+    The in-memory indexes answer most queries; the spill file is only scanned
+    when the requested page goes past the entries held in memory, and then it
+    is streamed, keeping only the newest matching entries the page still needs.
+    The spill file is opened under the lock, so close can remove it while it
+    is streamed. There is no index by time: entries are kept in the order they
+    were added, which is not strictly the order of their timestamps, so a time
+    range alone costs a scan of the window, and of the spill file for pages
+    past the window.
+
+    Args:
+      account (int, optional): Only entries sent or received by this node id.
+      block (int, optional): Only entries registered in this block.
+      since (str, optional): Only entries with a timestamp greater than or equal to this ISO timestamp.
+      until (str, optional): Only entries with a timestamp less than this ISO timestamp.
+      page (int, optional): The page number, starting from 0. Defaults to 0.
+      page_size (int, optional): The number of entries per page. Defaults to 20.
+
+    Returns:
+      list: The entries of the page.
+    """
+
+    def matches(entry):
+      return (account is None or account in (entry['sender'], entry['receiver'])) \
+        and (block is None or entry['block'] == block) \
+        and (since is None or entry['timestamp'] >= since) \
+        and (until is None or entry['timestamp'] < until)
+
+    start, stop = page * page_size, (page + 1) * page_size
+
+    with self.lock:
+      if block is not None:
+        candidates = self.by_block.get(block, [])
+      elif account is not None:
+        candidates = self.by_account.get(account, [])
+      else:
+        candidates = self.entries.keys()
+
+      results = [entry for entry in (self.entries[seq] for seq in reversed(candidates)) if matches(entry)]
+      if len(results) >= stop or not self.spilled:
+        return results[start:stop]
+
+      spilled = self.spilled
+      confirmations = dict(self.confirmations)
+      f = open(self.file_path, 'r')
+
+    # Stream the spill file (oldest first), up to the entries written so far
+    older = deque(maxlen=stop - len(results))
+    with f:
+      for entry in map(json.loads, islice(f, spilled)):
+        if entry['uuid'] in confirmations:
+          entry['block'] = confirmations[entry['uuid']]
+        if matches(entry):
+          older.append(entry)
+    results.extend(reversed(older))
+
+    return results[start:stop]
+
+  def close(self):
+    """Removes the spill file if it is a temporary file."""
+
+    with self.lock:
+      if self.temporary and self.file_path is not None:
+        try:
+          os.remove(self.file_path)
+        except FileNotFoundError:
+          pass
+        self.file_path = None
+        self.spilled = 0
+
+  @staticmethod
+  def format(entry):
+    """Formats an entry as a line of text.
+
+    Args:
+      entry (dict): The entry.
+
+    Returns:
+      str: The formatted entry.
+    """
+
+    block = f'block {entry["block"]}' if entry['block'] is not None else 'pending'
+
+    if entry['type'] == 'credit':
+      return f'[{entry["timestamp"]}] Credited {Amount.format(entry["value"])} BCC to {entry["receiver"]} ({block})'
+
+    receiver = entry['receiver'] if entry['receiver'] is not None else 'none'
+    value = entry['value'] if entry['type'] == 'message' else f'{Amount.format(entry["value"])} BCC'
+    return f'[{entry["timestamp"]}] {entry["uuid"]} {entry["sender"]} -> {receiver}, {entry["type"]}: {value} ({block})'
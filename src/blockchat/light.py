@@ -0,0 +1,158 @@
+"""A module for the HeaderChain class.
+
+This module contains the HeaderChain class, which is used by a light client to
+follow the chain with block headers only and to keep the state of its own
+account.
+"""
+
+from blockchat.block import Block
+from blockchat.amount import Amount
+
+class HeaderChain:
+  """A class to represent the headers of the chain and the account of a light client.
+
+  A header is a block with the hashes of its transactions instead of the
+  transactions (index, timestamp, validator, transaction hashes, previous
+  hash and hash). The full peer of the light client sends the header of every
+  block it registers, and the full block instead when the block has a
+  transaction sent or received by the light client. A header is accepted if
+  its hash matches its fields and it links to a known header through its
+  previous hash, so the full peer cannot change the transactions of a block;
+  a full block is also hashed again, with every transaction, so the
+  transactions of the light client are proven to be in the block that the
+  header chain commits to. The transactions of other nodes are not
+  validated. A header that replaces known headers (a reorganization on
+  the full peer) rolls back the account to the balance after its parent.
+
+  Attributes:
+    address (str): The address (public key) of the light client.
+    fee_rate (int): The fee rate for transfers, in basis points.
+    headers (list): The headers, in chain order.
+    balances (list): The balance of the light client after each header.
+    transactions (list): The transactions of the light client in each block, as (uuid, hash, cost) tuples, cost being 0 for received transactions.
+
+  Methods:
+    header: Get the header of a block.
+    tip: Get the last header.
+    get_balance: Get the balance of the light client after the last header.
+    add: Add a header (with its block if it has transactions of the light client).
+  """
+
+  fields = ('index', 'timestamp', 'validator', 'transactions', 'previous_hash', 'hash')
+
+  def __init__(self, address, fee_rate, headers, balance=0):
+    """Initializes a new instance of HeaderChain.
+
+    Args:
+      address (str): The address (public key) of the light client.
+      fee_rate (int): The fee rate for transfers, in basis points.
+      headers (list): The headers of the chain, from the genesis block.
+      balance (int, optional): The balance of the light client after the last header, in minor units. Defaults to 0.
+
+    Raises:
+      ValueError: If a header does not match its hash, or the headers do not link to each other.
+    """
+
+    for header in headers:
+      if Block.hash_header(header) != header['hash']:
+        raise ValueError(f'Header {header["index"]} does not match its hash')
+    for previous, header in zip(headers, headers[1:]):
+      if header['previous_hash'] != previous['hash'] or header['index'] != previous['index'] + 1:
+        raise ValueError(f'Header {header["index"]} does not follow header {previous["index"]}')
+
+    self.address = address
+    self.fee_rate = fee_rate
+    self.headers = list(headers)
+    self.balances = [balance] * len(headers)
+    self.transactions = [[] for _ in headers]
+
+  @classmethod
+  def header(cls, block):
+    """Gets the header of a block.
+
+    Args:
+      block (Block): The block.
+
+    Returns:
+      dict: The header.
+    """
+
+    header = {field: getattr(block, field) for field in cls.fields}
+    header['transactions'] = [transaction.hash for transaction in block.transactions]
+    return header
+
+  def tip(self):
+    """Gets the last header.
+
+    Returns:
+      dict: The header.
+    """
+
+    return self.headers[-1]
+
+  def get_balance(self):
+    """Gets the balance of the light client after the last header.
+
+    Returns:
+      int: The balance, in minor units.
+    """
+
+    return self.balances[-1]
+
+  def apply(self, block):
+    balance = self.get_balance()
+    transactions = []
+    for transaction in block.transactions:
+      if transaction.sender_address == self.address:
+        if transaction.type_of_transaction == 'coins':
+          cost = transaction.value + Amount.fee(transaction.value, self.fee_rate)
+        elif transaction.type_of_transaction == 'message':
+          cost = Amount.message_cost(transaction.value)
+        else:
+          cost = 0
+        balance -= cost
+        transactions.append((transaction.uuid, transaction.hash, cost))
+      elif transaction.receiver_address == self.address:
+        if transaction.type_of_transaction == 'coins':
+          balance += transaction.value
+        transactions.append((transaction.uuid, transaction.hash, 0))
+
+    return balance, transactions
+
+  def add(self, header, block=None):
+    """Adds a header, with its block if it has transactions of the light client.
+
+    Args:
+      header (dict): The header.
+      block (dict, optional): The full block. Defaults to None.
+
+    Returns:
+      tuple: The status ('added', 'known', 'gap' if the parent is unknown, or 'invalid'), the
+      transactions of the light client in the rolled back headers and those in the new block.
+    """
+
+    if block is not None:
+      block = Block(**block)
+      if any(transaction.calculate_hash() != transaction.hash for transaction in block.transactions):
+        return 'invalid', [], []
+      header = self.header(block)
+
+    if Block.hash_header(header) != header['hash']:
+      return 'invalid', [], []
+
+    index = header['index']
+    if index < len(self.headers) and self.headers[index]['hash'] == header['hash']:
+      return 'known', [], []
+    if index == 0 or index > len(self.headers) or self.headers[index - 1]['hash'] != header['previous_hash']:
+      return 'gap', [], []
+
+    # A header that replaces known headers switches to the branch of the full peer
+    rolled_back = [transaction for transactions in self.transactions[index:] for transaction in transactions]
+    del self.headers[index:], self.balances[index:], self.transactions[index:]
+
+    balance, transactions = self.apply(block) if block is not None else (self.get_balance(), [])
+    self.headers.append(header)
+    self.balances.append(balance)
+    self.transactions.append(transactions)
+
+    return 'added', rolled_back, transactions
@@ -1,4 +1,5 @@
 import subprocess
+import json
 
 from threading import Thread
 from queue import Queue
@@ -6,6 +7,10 @@ from queue import Queue
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
 
+from blockchat.tracing import Tracer
+from blockchat.amount import Amount
+from blockchat.export import ChainExporter
+
 help_message = """
 Available commands:
   transaction <node> <type> <value>: Send a transaction. Available types: 'coins', 'message'
@@ -14,7 +19,14 @@ Available commands:
   view: View last block
   help: Show this help text
   exit: Exit the client
-  history: Show transaction history
+  history [page]: Show transaction history, newest first
+  history account <node> [page]: Show transactions sent or received by a node
+  history block <index>: Show transactions registered in a block
+  history since <timestamp> [<timestamp>]: Show transactions in an ISO timestamp range
+  trace [file]: Export transaction lifecycle spans and show a per-stage summary
+  profile [seconds] [file]: Sample all node threads and write a flamegraph collapsed-stack file
+  export [directory]: Append the final blocks to column files and show fees, volume and validators
+  stats: Show the receive (including kernel drops), admission and replay counters
   logs: Show logs"""
 
 welcome_message = """Welcome to BlockChat!
@@ -27,16 +39,18 @@ Type 'help' to see the available commands."""
 
 def run(client, node_process_func, **kwargs):
   session = PromptSession()
-  completer = WordCompleter(['transaction', 'stake', 'balance', 'view', 'help', 'exit', 'history', 'logs', 'message', 'coins'])
+  completer = WordCompleter(['transaction', 'stake', 'balance', 'view', 'help', 'exit', 'history', 'trace', 'profile', 'export', 'stats', 'logs', 'message', 'coins'])
 
   client.create_logfile()
+  client.profiler.install_signal_handler(10.0, 'profile', client.profile_done)
 
   print(welcome_message)
 
   ready_queue = Queue()
   node_thread = Thread(
     target=node_process_func,
-    args=(kwargs['nodes_count'], kwargs['block_capacity'], client, ready_queue,)
+    args=(kwargs.pop('nodes_count'), kwargs.pop('block_capacity'), client, ready_queue,),
+    kwargs=kwargs
   )
   node_thread.daemon = True
   node_thread.start()
@@ -64,10 +78,10 @@ def run(client, node_process_func, **kwargs):
         print(help_message)
 
       elif input.startswith('balance'):
-        print(f'Current balance: {client.wallet.balance} BCC')
+        print(f'Current balance: {Amount.format(client.wallet.balance)} BCC')
 
       elif input.startswith('view'):
-        print(client.blockchain.get_last_block())
+        print(client.headers.tip() if client.light else client.blockchain.get_last_block())
 
       elif input.startswith('transaction'):
         try:
@@ -79,7 +93,11 @@ def run(client, node_process_func, **kwargs):
 
         node = int(node)
         if type == 'coins':
-          value = int(value)
+          try:
+            value = Amount.from_coins(value)
+          except ValueError as error:
+            print(error)
+            continue
 
         client.execute_transaction(node, type, value)
 
@@ -91,7 +109,24 @@ def run(client, node_process_func, **kwargs):
           print('Usage: stake <value>')
           continue
 
-        client.set_stake(float(value))
+        try:
+          client.set_stake(Amount.from_coins(value))
+        except ValueError as error:
+          print(error)
+
+      elif input.startswith('profile'):
+        args = input.split(' ')
+        try:
+          duration = float(args[1]) if len(args) > 1 else 10.0
+        except ValueError:
+          print('Invalid profiling duration')
+          print('Usage: profile [seconds] [file]')
+          continue
+
+        client.profile(duration, args[2] if len(args) > 2 else None)
+
+      elif input.startswith('stats'):
+        print(json.dumps(client.get_stats(), indent=2))
 
       elif input.startswith('logs'):
         try:
@@ -100,7 +135,51 @@ def run(client, node_process_func, **kwargs):
           print('Failed to open logs')
 
       elif input.startswith('history'):
-        print(client.history)
+        args = input.split(' ')[1:]
+        try:
+          if args and args[0] == 'account':
+            entries = client.history.query(account=int(args[1]), page=int(args[2]) if len(args) > 2 else 0)
+          elif args and args[0] == 'block':
+            # A block holds up to the maximum capacity of transactions, plus the fees credited to its validator
+            entries = client.history.query(block=int(args[1]), page_size=client.blockchain.max_block_capacity + 1)
+          elif args and args[0] == 'since':
+            entries = client.history.query(since=args[1], until=args[2] if len(args) > 2 else None)
+          else:
+            entries = client.history.query(page=int(args[0]) if args else 0)
+        except (ValueError, IndexError):
+          print('Invalid history arguments')
+          print('Usage: history [page] | history account <node> [page] | history block <index> | history since <timestamp> [<timestamp>]')
+          continue
+
+        if not entries:
+          print('No transactions found')
+        for entry in entries:
+          print(client.history.format(entry))
+
+      elif input.startswith('trace'):
+        if client.tracer is None:
+          print('Tracing is disabled, start the node with --trace <rate>')
+          continue
+
+        args = input.split(' ', 1)
+        file_path = args[1] if len(args) > 1 else f'trace-{client.id}.jsonl'
+        count = client.tracer.export(file_path)
+        print(f'Exported {count} spans to {file_path}')
+        print(json.dumps(Tracer.summary(client.tracer.spans), indent=2))
+
+      elif input.startswith('export'):
+        args = input.split(' ', 1)
+        directory = args[1] if len(args) > 1 else f'chain-{client.id}'
+
+        # Leave out the blocks that may still be replaced by another branch
+        exporter = ChainExporter(directory)
+        count = exporter.export(client.blockchain, max(len(client.blockchain.chain) - client.finality_depth, 0))
+        print(f'Exported {count} blocks to {directory} ({exporter.meta["blocks"]} blocks, {exporter.meta["transactions"]} transactions)')
+
+        try:
+          print(json.dumps(ChainExporter.summary(ChainExporter.load(directory)), indent=2))
+        except ImportError:
+          print('Install numpy to show a summary of the exported columns')
 
       else:
         print('Invalid command\n')
@@ -4,6 +4,7 @@ from client import start_node
 from bootstrap import start_bootstrap
 
 from node import Node, Bootstrap
+from amount import Amount
 
 def main():
   parser = argparse.ArgumentParser()
@@ -16,7 +17,7 @@ def main():
   nodes = args.nodes
   capacity = args.capacity
   bootstrap = args.bootstrap
-  stake = args.stake
+  stake = Amount.from_coins(args.stake)
 
   bootstrap_address = 'bootstrap-node'
   # bootstrap_port = 5000
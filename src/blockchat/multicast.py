@@ -0,0 +1,275 @@
+"""A module for the Multicast class.
+
+This module contains the Multicast class, a broadcast subsystem that a node can
+use on a LAN to send every transaction and block once to an IP multicast group,
+instead of sending it to every other node.
+"""
+
+import json
+import time
+import socket
+
+from collections import OrderedDict
+from threading import Thread, Lock
+
+from blockchat.broadcast import Broadcaster
+
+class Multicast(Broadcaster):
+  """A class to represent the IP multicast broadcast subsystem of a node.
+
+  Transactions and blocks are wrapped in a 'multicast' envelope with the id of
+  the sender and a per-sender sequence number, and sent once to the multicast
+  group. Every node delivers the envelopes of each sender in sequence order; when
+  a gap is detected, the missing sequence numbers are requested from the sender
+  by unicast and the sender resends them from its recent history, also by
+  unicast. A gap that cannot be filled within the gap timeout is skipped. All
+  other message types (e.g. 'node') are sent to every node by unicast, as with
+  the Broadcaster, and so are all point-to-point messages. Gap timeouts are
+  measured on the clock of the node.
+
+  Attributes:
+    group (tuple): The (address, port) of the multicast group.
+    history_size (int): The number of recent envelopes kept for resending.
+    gap_timeout (float): The time in seconds after which a gap is skipped.
+    sequence (int): The sequence number of the next envelope sent by the node.
+    senders (dict): The receive state of each sender (next sequence number, held envelopes, gap times), keyed by id.
+    socket (socket): The socket that receives from the multicast group, None until the node joins.
+
+  Methods:
+    join: Join the multicast group and start the receiver and repair threads.
+    attach: Use a socket that already receives from the group, without threads.
+    broadcast: Multicast a transaction or block, or send any other message to all nodes.
+    receive: Handle a multicast envelope, received from the group or resent by unicast.
+    resend: Answer a request for missing envelopes.
+    get_sequences: Get the next expected sequence number of every sender.
+    set_sequences: Set the next expected sequence number of every sender.
+    repair_gaps: Request the missing envelopes again and skip the gaps that exceeded the gap timeout.
+  """
+
+  multicast_types = ('transaction', 'block', 'compact_block')
+
+  def __init__(self, node, group, history_size=4096, gap_timeout=2.0, workers=2):
+    """Initializes a new instance of Multicast.
+
+    Args:
+      node (Node): The node that owns the multicast subsystem.
+      group (tuple): The (address, port) of the multicast group.
+      history_size (int, optional): The number of recent envelopes kept for resending. Defaults to 4096.
+      gap_timeout (float, optional): The time in seconds after which a gap is skipped. Defaults to 2.0.
+      workers (int, optional): The number of unicast sender threads. Defaults to 2.
+    """
+
+    super().__init__(node, workers)
+
+    self.group = group
+    self.history_size = history_size
+    self.gap_timeout = gap_timeout
+
+    self.sequence = 0
+    self.history = OrderedDict()
+    self.senders = {}
+    self.socket = None
+
+    self.send_lock = Lock()
+    self.receive_lock = Lock()
+
+  def join(self):
+    """Joins the multicast group on the interface of the node, and starts the receiver and repair threads.
+
+    The interface is the address of the node in Blockchain.nodes, so nodes on
+    the same host (e.g. 127.0.0.1) and nodes on a LAN both work.
+    """
+
+    own = next((node for node in self.node.blockchain.nodes if node['id'] == self.node.id), None)
+    interface = socket.inet_aton(own['address'] if own is not None else '0.0.0.0')
+
+    # Send on the unicast socket, so that unicast replies (e.g. missing transactions) reach the node
+    self.node.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    self.node.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    self.node.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, interface)
+
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.socket.bind(self.group)
+    self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(self.group[0]) + interface)
+
+    for target in (self.listen, self.repair):
+      thread = Thread(target=target)
+      thread.daemon = True
+      thread.start()
+
+  def attach(self, group_socket):
+    """Uses a socket that already receives from the multicast group (e.g. a simulated one), without starting threads.
+
+    The owner of the node hands the received envelopes to receive and calls
+    repair_gaps periodically.
+
+    Args:
+      group_socket (socket): The socket of the group.
+    """
+
+    self.socket = group_socket
+
+  def broadcast(self, message, exclude=()):
+    """Multicasts a transaction or block, or sends any other message to all nodes.
+
+    Args:
+      message (dict): The message.
+      exclude (iterable, optional): The IDs of the nodes that should not receive a non-multicast message.
+    """
+
+    if message['message_type'] not in self.multicast_types or self.socket is None:
+      return super().broadcast(message, exclude)
+
+    with self.send_lock:
+      envelope = {'message_type': 'multicast', 'sender': self.node.id, 'seq': self.sequence, 'message': message}
+      payload = json.dumps(envelope).encode()
+
+      self.history[self.sequence] = payload
+      while len(self.history) > self.history_size:
+        self.history.popitem(last=False)
+      self.sequence += 1
+
+      self.send(payload, [self.group])
+
+    self.node.deliver(message)
+
+  def listen(self):
+    """Receives envelopes from the multicast group, until the process exits."""
+
+    while True:
+      payload, address = self.socket.recvfrom(4096*self.node.blockchain.max_block_capacity)
+      try:
+        envelope = json.loads(payload.decode())
+      except json.JSONDecodeError:
+        continue
+
+      if envelope.get('message_type') == 'multicast':
+        self.receive(envelope, address)
+
+  def receive(self, envelope, address):
+    """Handles a multicast envelope, received from the group or resent by unicast.
+
+    The envelopes of a sender are delivered in sequence order; an envelope
+    after a gap is held and the missing envelopes are requested from the sender.
+
+    Args:
+      envelope (dict): The multicast envelope.
+      address (tuple): The (address, port) of the sender.
+
+    Returns:
+      bool: True if the envelope was new, False if it was a duplicate or sent by the node itself.
+    """
+
+    sender, seq = envelope['sender'], envelope['seq']
+    if sender == self.node.id:
+      return False
+
+    with self.receive_lock:
+      state = self.senders.setdefault(sender, {'next': seq, 'held': {}, 'since': None, 'requested': 0.0})
+      if seq < state['next'] or seq in state['held']:
+        return False
+
+      state['held'][seq] = (envelope['message'], address)
+      self.deliver_ready(state)
+
+      if state['held'] and state['since'] is None:
+        state['since'] = self.node.clock()
+        self.request(sender, state)
+
+    return True
+
+  def deliver_ready(self, state):
+    """Delivers the held envelopes of a sender that follow the last delivered one, in order.
+
+    Args:
+      state (dict): The receive state of the sender.
+    """
+
+    while state['next'] in state['held']:
+      message, address = state['held'].pop(state['next'])
+      state['next'] += 1
+      self.node.deliver(message, address)
+
+    if not state['held']:
+      state['since'] = None
+
+  def request(self, sender, state):
+    """Requests the missing envelopes of a sender by unicast.
+
+    Args:
+      sender (int): The ID of the sender.
+      state (dict): The receive state of the sender.
+    """
+
+    node = next((node for node in self.node.blockchain.nodes if node['id'] == sender), None)
+    if node is None:
+      return
+
+    missing = [seq for seq in range(state['next'], max(state['held'])) if seq not in state['held']]
+    state['requested'] = self.node.clock()
+    self.node.socket.sendto(json.dumps({'message_type': 'multicast_nack', 'seqs': missing[:256]}).encode(), (node['address'], node['port']))
+
+  def resend(self, request, address):
+    """Resends the requested envelopes from the recent history, by unicast.
+
+    Args:
+      request (dict): The request, with the missing sequence numbers.
+      address (tuple): The (address, port) of the node that requested them.
+    """
+
+    with self.send_lock:
+      payloads = [self.history[seq] for seq in request['seqs'] if seq in self.history]
+
+    for payload in payloads:
+      self.node.socket.sendto(payload, address)
+
+  def repair(self):
+    """Periodically requests the missing envelopes again, and skips the gaps that exceeded the gap timeout."""
+
+    while True:
+      time.sleep(self.gap_timeout / 4)
+      self.repair_gaps()
+
+  def repair_gaps(self):
+    """Requests the missing envelopes again, and skips the gaps that exceeded the gap timeout."""
+
+    now = self.node.clock()
+    with self.receive_lock:
+      for sender, state in self.senders.items():
+        if not state['held']:
+          continue
+
+        if now - state['since'] > self.gap_timeout:
+          state['next'] = min(state['held'])
+          state['since'] = None
+          self.deliver_ready(state)
+          if state['held']:
+            state['since'] = now
+        elif now - state['requested'] > self.gap_timeout / 4:
+          self.request(sender, state)
+
+  def get_sequences(self):
+    """Gets the next expected sequence number of every sender, including the node itself.
+
+    Returns:
+      dict: A dictionary mapping node ids to sequence numbers.
+    """
+
+    with self.receive_lock:
+      sequences = {sender: state['next'] for sender, state in self.senders.items()}
+    with self.send_lock:
+      sequences[self.node.id] = self.sequence
+
+    return sequences
+
+  def set_sequences(self, sequences):
+    """Sets the next expected sequence number of every sender, so that a joining node can recover the envelopes it missed.
+
+    Args:
+      sequences (dict): A dictionary mapping node ids (possibly as strings) to sequence numbers.
+    """
+
+    with self.receive_lock:
+      for sender, seq in sequences.items():
+        self.senders.setdefault(int(sender), {'next': seq, 'held': {}, 'since': None, 'requested': 0.0})
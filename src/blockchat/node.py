@@ -21,9 +21,11 @@ import hashlib
 import time
 import os
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread, Lock
-from queue import Queue
+from queue import Queue, Full, Empty
 from socket import timeout
 
 from cryptography.hazmat.primitives import hashes
@@ -31,8 +33,20 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import serialization
 
 from blockchat.wallet import Wallet
-from blockchat.block import Block
+from blockchat.block import Block, BlockAssembler
+from blockchat.blocktree import BlockTree
 from blockchat.transaction import Transaction
+from blockchat.tracing import Tracer
+from blockchat.profiler import Profiler
+from blockchat.history import History
+from blockchat.broadcast import Broadcaster
+from blockchat.gossip import Gossip
+from blockchat.multicast import Multicast
+from blockchat.replay import ReplayFilter
+from blockchat.admission import AdmissionQueue
+from blockchat.api import QueryCache, QueryServer
+from blockchat.light import HeaderChain
+from blockchat.amount import Amount
 
 from blockchat.util import termcolor
 
@@ -46,21 +60,69 @@ class Node:
 
     id (int): An integer representing the ID of the node.
     wallet (Wallet): A Wallet object representing the wallet of the node.
-    balance (float): A float representing the balance of the node.
+    balance (int): An integer representing the balance of the node, in minor units (see Amount).
     nonce (int): An integer representing the nonce of the node.
     blockchain (Blockchain): A Blockchain object representing the blockchain of the network.
-    stake (float): A float representing the stake of the node in the blockchain.
+    stake (int): An integer representing the stake of the node in the blockchain, in minor units.
+    history (History): A History object indexing the transactions and credits of the node.
 
     current_block (list): A list of Transaction objects representing the current block of transactions not mined yet.
-    current_fees (float): A float representing the current fees from completed transactions.
-
-    past_fees (Queue): A Queue object representing the past fees of the blockchain.
-    past_pools (Queue): A Queue object representing the past pools of validators of the blockchain.
+    seal_index (int): The index of the block being filled with registered transactions.
+    transaction_queue (AdmissionQueue): The bounded queue of received transactions, with a rate limit per peer.
+    block_queue (Queue): The bounded queue of received blocks.
+    shed_blocks (int): The number of blocks dropped because the block queue was full.
+    transaction_pool (OrderedDict): A bounded OrderedDict of recently received transactions, keyed by hash.
+    pool_nonces (dict): The hash of each pooled transaction, keyed by (sender address, nonce).
+    held_transactions (OrderedDict): The received transactions that are ahead of the next nonce of their sender, with the time they were held, keyed by (sender address, nonce), oldest first.
+    held_capacity (int): The maximum number of held transactions.
+    hold_timeout (float): The time in seconds after which the node stops waiting for the missing nonces before a held transaction.
+    partial_blocks (dict): A dictionary of compact blocks waiting for missing transactions, with the missing hashes, the sender and the requests made, keyed by block hash.
+    partial_retry (float): The time in seconds before the missing transactions of a partial block are requested again.
+    partial_attempts (int): The number of requests for the missing transactions of a partial block before the full block is requested.
+    partial_timeout (float): The time in seconds after which the full block of a partial block is requested.
+    verified_transactions (OrderedDict): A bounded cache of the hashes of transactions with verified signatures.
+    replay_filter (ReplayFilter): The uuids and hashes of the received transactions, to drop duplicates before validation.
+    block_tree (BlockTree): The tree of the recent blocks, including competing branches, with the state after each block.
+    finality_depth (int): The number of blocks after which a block is final and competing branches are pruned.
+    next_validator (tuple): The (index, seed, pool, validator id) computed for the next block when the previous one was registered.
+    assembler (BlockAssembler): The block being assembled if the node is the next validator, None otherwise.
+
+    sealed_blocks (dict): A dictionary of sealed blocks (lists of transactions) waiting to be registered, keyed by index.
+    mined_blocks (set): A set of the indexes of the sealed blocks that went through the mining process.
+    orphan_blocks (dict): A dictionary of received blocks whose previous block is unknown, keyed by hash.
+    requested_blocks (dict): A dictionary mapping the hashes of requested missing blocks to the time of the request.
+    requested_transactions (dict): A dictionary mapping the (sender address, nonce) of requested missing transactions to the time of the request.
+    repair_interval (float): The time in seconds between two passes of the block handler over the missing blocks.
+    registered_at (float): The time the last block was registered, to detect that the node fell behind.
+
+    tracer (Tracer): A Tracer object recording transaction lifecycle spans, or None if tracing is disabled.
+    profiler (Profiler): A Profiler object sampling the stacks of the node threads on demand.
+    broadcaster (Broadcaster): A Broadcaster (or Gossip, or Multicast) object sending messages to all nodes in the network.
+    gossip_fanout (int): The gossip fanout, 0 if transactions and blocks are sent to every node directly.
+    multicast_group (tuple): The (address, port) of the multicast group for transactions and blocks, None if multicast is disabled.
+    shared_memory (bool): A boolean indicating whether to exchange messages with nodes on the same host through shared memory.
+    receivers (int): The number of sockets and threads receiving the datagrams of the node, sharing its port.
+    receive_buffer (int): The kernel receive buffer size of each socket in bytes, 0 for the system default.
+    api_port (int): The port of the HTTP query server, None if it is disabled (0 for a random port).
+    query_cache (QueryCache): The cached views of the chain served by the query server, invalidated when a block is registered.
+    query_server (QueryServer): The HTTP query server, None if it is disabled or not started.
+    light (bool): A boolean indicating whether the node is a light client, which follows the block headers only.
+    headers (HeaderChain): The block headers and the account of a light client, None for a full node.
+    light_pending (dict): The costs of the transactions of a light client that are not in a block yet, keyed by hash.
+    requested_headers (float): The time a light client last requested missing headers from its full peer.
+    light_orphans (dict): The messages of headers that arrived before their parent on a light client, keyed by index.
 
   Methods:
+    prepare_chain: Build the block tree and schedule the next validator once the blockchain is known.
     log: Log a message to the console.
+    trace: Record a lifecycle span for a transaction.
+    profile: Start a sampling profiler window over all node threads.
+    get_stats: Get the receive, admission and replay counters of the node.
+    start_query_server: Start the HTTP query server, if it is enabled.
     colorize: Colorize a message using the node color.
     send: Send a message to a specified address and port.
+    deliver: Deliver a message broadcast by the node to itself.
+    dispatch: Handle a message received from another node.
     set_stake: Set the stake of the node in the blockchain.
     execute_transaction: Execute a transaction.
     create_transaction: Create a transaction.
@@ -70,20 +132,63 @@ class Node:
     validate_transaction: Validate a transaction received from another node in the blockchain network.
     verify_signature: Verify the signature of a transaction using the sender's public key.
     register_transaction: Register a transaction in the blockchain.
+    seal_block: Close the current block and start the mining process.
+    mine_pending: Mine the sealed block that follows the last registered block.
+    seal_blocks: Periodically request sealing of blocks whose oldest transaction is too old.
+    check_seal: Request sealing of the current block if the node is its validator and its oldest transaction is too old.
     mine_block: Mine a block in the blockchain.
+    get_validator_pool: Get the pool of validators based on the stake of each node.
+    schedule_validator: Compute the validator of the next block and start assembling it if elected.
     get_validator_from_pool: Get the validator from a pool of validators.
-    broadcast_block: Broadcast a block to all nodes in the blockchain network.
+    broadcast_block: Broadcast a compact block to all nodes in the blockchain network.
     receive_block: Receive a block from another node in the blockchain network.
+    handle_transaction: Validate and register a transaction from the transaction queue.
+    hold_transaction: Hold a transaction that is ahead of the next nonce of its sender.
+    release_transactions: Handle the held transactions whose sender caught up, and give up on the gaps that timed out.
+    clock: Get the time used for the timeouts of the node.
+    now: Get the date and time used for the timestamps of the node.
+    create_uuid: Create the uuid of a new transaction.
+    process_block: Validate and add a block to the block tree, or buffer it if its previous block is unknown.
+    repair_blocks: Request again the blocks missing before the orphan blocks.
+    request_block: Request a missing block from the validator of a block that follows it.
+    send_block: Send a requested block to a node.
+    receive_compact_block: Rebuild a block from a compact block and the transaction pool.
+    send_block_transactions: Send the requested transactions of a compact block to a node.
+    receive_block_transactions: Fill the missing transactions of a compact block.
+    check_block_format: Check that a block has the required keys with values of the right types.
+    check_transaction_format: Check that a transaction of a block is well formed.
     validate_block: Validate a block received from another node in the blockchain network.
-    register_block: Register a block in the blockchain.
+    validate_block_transactions: Validate the signatures, nonces and balance effects of the transactions of a block.
+    register_block: Add a block to the block tree and to the chain if it is on the best branch.
+    credit_validator: Record the fees of a block credited to the node in its history.
+    restore_state: Rebuild the live balances, stakes and nonces of the nodes from the block tree and the pending transactions.
+    reorganize: Switch the chain to another branch of the block tree.
+    prune_blocks: Prune stale branches and orphans behind the finality depth.
+    copy_state: Copy a state snapshot of the block tree, adding the nodes that joined later.
+    serve_light_clients: Send the header (or the block) of registered blocks to the light clients of the node.
+    send_headers: Send the headers after a given block to a light client.
+    activate_light: Start following the chain with the headers sent on activation.
+    receive_header: Add a header (or block) sent by the full peer of a light client.
   """
 
-  def __init__(self, bootstrap_address='127.0.0.1', bootstrap_port=5000, verbose=True, debug=False, stake=0.0):
+  def __init__(self, bootstrap_address='127.0.0.1', bootstrap_port=5000, verbose=True, debug=False, stake=0, trace_rate=0.0, gossip_fanout=0, multicast_group=None, shared_memory=False, receivers=1, receive_buffer=0, api_port=None, light=False, replay_window=65536, replay_capacity=262144, replay_false_positive_rate=0.001, wallet=None):
     """Initializes a new instance of Node.
 
     Args:
       verbose (bool): A boolean indicating whether to increase output verbosity.
       debug (bool): A boolean indicating whether to enable debug mode.
+      trace_rate (float): The fraction of transactions to trace, 0.0 disables tracing.
+      gossip_fanout (int): The gossip fanout, 0 disables gossip.
+      multicast_group (str): The 'address:port' of the multicast group, None disables multicast.
+      shared_memory (bool): Whether to use shared memory for nodes on the same host.
+      receivers (int): The number of sockets and threads receiving datagrams, sharing the port of the node.
+      receive_buffer (int): The kernel receive buffer size of each socket in bytes, 0 keeps the system default.
+      api_port (int): The port of the HTTP query server, None disables it.
+      light (bool): Whether the node is a light client (never a validator, so it has no stake).
+      replay_window (int): The number of transaction keys the replay filter keeps exactly.
+      replay_capacity (int): The number of transaction keys per Bloom filter generation of the replay filter.
+      replay_false_positive_rate (float): The false-positive rate of each Bloom filter generation of the replay filter.
+      wallet (Wallet): The wallet of the node, None to create one with a new key pair.
     """
     self.bootstrap_address = bootstrap_address
     self.bootstrap_port = bootstrap_port
@@ -94,35 +199,123 @@ class Node:
     self.node_counter = None
 
     self.id = None
-    self.wallet = Wallet()
+    self.wallet = Wallet() if wallet is None else wallet
     self.nonce = 0
     self.blockchain = None
-    self.stake = stake
+    self.stake = stake if not light else 0
     self.socket = None
 
-    self.history = ''
+    self.history = History()
     self.log_file = None
 
     self.current_block = []
-    self.current_fees = 0
-
-    self.past_blocks = Queue()
-    self.past_pools = Queue()
-
-    self.transaction_queue = Queue()
-    self.block_queue = Queue()
+    self.seal_index = None
+
+    self.transaction_pool = OrderedDict()
+    self.pool_capacity = 4096
+    self.pool_nonces = {}
+    self.partial_blocks = {}
+    self.partial_retry = 0.5
+    self.partial_attempts = 4
+    self.partial_timeout = 5.0
+    self.pool_lock = Lock()
+
+    self.verified_transactions = OrderedDict()
+    self.verified_capacity = 65536
+    self.verifier = None
+    self.replay_filter = ReplayFilter(replay_window, replay_capacity, replay_false_positive_rate, confirm=self.is_known_transaction)
+    self.block_tree = None
+    self.finality_depth = 6
+
+    self.next_validator = None
+    self.assembler = None
+
+    self.sealed_blocks = {}
+    self.mined_blocks = set()
+    self.orphan_blocks = {}
+    self.requested_blocks = {}
+    self.requested_transactions = {}
+    self.repair_interval = 1.0
+    self.repaired = 0.0
+    self.registered_at = 0.0
+    self.sync_peer = 0
+    self.mining_lock = Lock()
+
+    self.transaction_queue = AdmissionQueue(exempt=('local',), clock=self.clock)
+    self.held_transactions = OrderedDict()
+    self.held_capacity = 4096
+    self.hold_timeout = 5.0
+    self.block_queue = Queue(maxsize=1024)
+    self.shed_blocks = 0
 
     self.balance_lock = Lock()
     self.blockchain_lock = Lock()
 
+    self.tracer = Tracer(trace_rate) if trace_rate > 0.0 else None
+    self.profiler = Profiler()
+    self.gossip_fanout = gossip_fanout
+    self.shared_memory = shared_memory
+    self.receivers = receivers
+    self.receive_buffer = receive_buffer
+
+    self.api_port = api_port
+    self.query_cache = QueryCache()
+    self.query_server = None
+
+    self.light = light
+    self.headers = None
+    self.light_pending = {}
+    self.requested_headers = 0.0
+    self.light_orphans = {}
+    self.light_orphans_capacity = 256
+
+    # A light client only sends its own transactions, directly to the full nodes
+    self.multicast_group = None
+    if light:
+      self.broadcaster = Broadcaster(self)
+    elif gossip_fanout > 0:
+      self.broadcaster = Gossip(self, gossip_fanout)
+    elif multicast_group:
+      address, port = multicast_group.rsplit(':', 1)
+      self.multicast_group = (address, int(port))
+      self.broadcaster = Multicast(self, self.multicast_group)
+    else:
+      self.broadcaster = Broadcaster(self)
+
     self.test_messenger = Thread(target=self.transact_from_file)
     self.transaction_handler = Thread(target=self.handle_transactions)
     self.block_handler = Thread(target=self.handle_blocks)
+    self.sealer = Thread(target=self.seal_blocks)
 
     # Set threads as daemons
     self.test_messenger.daemon = True
     self.transaction_handler.daemon = True
     self.block_handler.daemon = True
+    self.sealer.daemon = True
+
+  def start_handlers(self):
+    """Prepares the chain state, joins the multicast group if enabled and starts the transaction and block handlers, and the sealer if blocks are sealed by age."""
+
+    self.prepare_chain()
+
+    if self.multicast_group is not None:
+      self.broadcaster.join()
+
+    self.transaction_handler.start()
+    self.block_handler.start()
+
+    if self.blockchain.seal_interval > 0:
+      self.sealer.start()
+
+  def prepare_chain(self):
+    """Sets the seal index, builds the block tree and schedules the validator of the next block, once the blockchain is known."""
+
+    self.seal_index = self.blockchain.block_index
+
+    state, _ = self.blockchain.get_state()
+    self.block_tree = BlockTree(self.blockchain.get_last_block(), {node['key']: node for node in state}, dict(self.blockchain.nonces), self.finality_depth)
+
+    self.schedule_validator()
 
   def create_logfile(self):
     """Creates a log file."""
@@ -157,6 +350,76 @@ class Node:
       else:
         print(f'{self.colorize(f"[NODE-{self.id}]")} {message}')
 
+  def trace(self, transaction_uuid, stage, timestamp=None):
+    """Record a lifecycle span for a transaction, if tracing is enabled.
+
+    Args:
+      transaction_uuid (str): The UUID of the transaction.
+      stage (str): The name of the stage.
+      timestamp (float, optional): The time of the span. Defaults to now.
+    """
+
+    if self.tracer is not None:
+      self.tracer.record(transaction_uuid, self.id, stage, timestamp)
+
+  def profile(self, duration=10.0, file_path=None):
+    """Start a sampling profiler window over all node threads.
+
+    The collapsed stacks are written to file_path when the window ends.
+
+    Args:
+      duration (float): The length of the window in seconds.
+      file_path (str, optional): The output file. Defaults to profile-<id>-<timestamp>.folded.
+
+    Returns:
+      bool: True if the profiler was started, False if it is already running.
+    """
+
+    if file_path is None:
+      file_path = f'profile-{self.id}-{int(time.time())}.folded'
+
+    if not self.profiler.start(duration, file_path, self.profile_done):
+      self.log(termcolor.yellow('Profiler is already running'))
+      return False
+
+    self.log(termcolor.magenta(f'Profiling for {duration} seconds'))
+    return True
+
+  def profile_done(self, file_path, samples):
+    """Logs the end of a profiler window.
+
+    Args:
+      file_path (str): The output file.
+      samples (int): The number of samples taken.
+    """
+
+    self.log(termcolor.green(f'Profiler wrote {samples} samples to {file_path}'))
+
+  def get_stats(self):
+    """Gets the counters of the receive pipeline (including the kernel drops of each socket), the admission control and the replay filter.
+
+    Returns:
+      dict: The counters.
+    """
+
+    return {
+      'receive': self.socket.stats() if hasattr(self.socket, 'inbox') else None,
+      'transactions': self.transaction_queue.stats(),
+      'blocks': {'queued': self.block_queue.qsize(), 'shed': self.shed_blocks},
+      'replay': {'duplicates': self.replay_filter.duplicates, 'false_positives': self.replay_filter.false_positives},
+      'light': {'headers': len(self.headers.headers), 'pending': len(self.light_pending)} if self.headers is not None else None,
+    }
+
+  def start_query_server(self):
+    """Starts the HTTP query server on the api port, if it is enabled."""
+
+    if self.api_port is None:
+      return
+
+    self.query_server = QueryServer(self, '0.0.0.0', self.api_port)
+    self.query_server.start()
+    self.log(termcolor.blue(f'Query server listening on {termcolor.underline(f"{self.query_server.address}:{self.query_server.port}")}'))
+
   def colorize(self, message):
     """Colorize a message based on node_color.
 
@@ -179,6 +442,71 @@ class Node:
 
     self.socket.sendto(message.encode(), (address, port))
 
+  def deliver(self, message, address=None):
+    """Deliver a broadcast message to the node, without using the network.
+
+    Args:
+      message (dict): The message.
+      address (tuple, optional): The (address, port) of the node that relayed the message, None if it is the node itself.
+    """
+
+    if message['message_type'] == 'transaction':
+      self.receive_transaction(message['transaction'], address)
+    elif message['message_type'] == 'block':
+      self.receive_block(message['block'])
+    elif message['message_type'] == 'compact_block':
+      self.receive_compact_block(message['compact_block'], address)
+
+  def dispatch(self, message, address):
+    """Handles a message received from another node, for all message types shared by full nodes and light clients.
+
+    The membership messages ('key', 'activate', 'node', 'ping') are handled by
+    the receive loop of the bootstrap node and of the clients.
+
+    Args:
+      message (dict): The message.
+      address (tuple): The (address, port) of the node that sent the message.
+
+    Returns:
+      bool: True if the message was handled, False if its type is not known to the node.
+    """
+
+    message_type = message['message_type']
+
+    if message_type == 'transaction':
+      self.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address[0]}:{address[1]}")} (transaction)'), not self.debug)
+      self.receive_transaction(message['transaction'], address)
+    elif message_type == 'block':
+      self.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address[0]}:{address[1]}")} (block)'), not self.debug)
+      self.receive_block(message['block'])
+    elif message_type == 'compact_block':
+      self.log(termcolor.blue(f'Received message from {termcolor.underline(f"{address[0]}:{address[1]}")} (compact block)'), not self.debug)
+      self.receive_compact_block(message['compact_block'], address)
+    elif message_type == 'get_block_transactions':
+      self.send_block_transactions(message, address)
+    elif message_type == 'block_transactions':
+      self.receive_block_transactions(message, address)
+    elif message_type == 'get_block':
+      self.send_block(message, address)
+    elif message_type == 'get_transaction':
+      self.send_transaction(message, address)
+    elif message_type == 'header' and self.light:
+      self.receive_header(message, address)
+    elif message_type == 'get_headers':
+      self.send_headers(message, address)
+    elif message_type == 'gossip' and self.gossip_fanout:
+      self.broadcaster.receive(message, address)
+    elif message_type == 'gossip_pull' and self.gossip_fanout:
+      self.broadcaster.pull(message, address)
+    elif message_type == 'multicast' and self.multicast_group:
+      self.broadcaster.receive(message, address)
+    elif message_type == 'multicast_nack' and self.multicast_group:
+      self.broadcaster.resend(message, address)
+    else:
+      return False
+
+    return True
+
   def ping_bootstrap(self):
     """Pings bootstrap node to check if it is online, until it responds.
 
@@ -209,13 +537,14 @@ class Node:
     message = json.dumps({
       'message_type': 'key',
       'key': self.wallet.get_address(),
-      'stake': self.stake
+      'stake': self.stake,
+      'light': self.light
     })
 
     self.log(termcolor.magenta('Sending key to bootstrap node'))
     self.send(message, self.bootstrap_address, self.bootstrap_port)
 
-  def add_node(self, id, key, address, port, stake=0, nonce=0, balance=0):
+  def add_node(self, id, key, address, port, stake=0, nonce=0, balance=0, light=False, peer=None, initial_stake=None):
     """Adds a node to the blockchain network.
 
     Args:
@@ -224,8 +553,11 @@ class Node:
       port (int): The port of the node.
       key (str): The public key of the node.
       nonce (int): The nonce of the node.
-      balance (float): The balance of the node.
-      stake (float): The stake of the node.
+      balance (int): The balance of the node, in minor units.
+      stake (int): The stake of the node, in minor units.
+      light (bool): Whether the node is a light client.
+      peer (int): The ID of the full node that serves the headers of a light client. Defaults to this node.
+      initial_stake (int): The stake the node declared when it joined, the start of its stake in the chain state. Defaults to stake.
     """
 
     new_node = {
@@ -234,23 +566,36 @@ class Node:
       'port': port,
       'key': key,
       'stake': stake,
+      'initial_stake': stake if initial_stake is None else initial_stake,
       'balance': balance,
       'nonce': nonce
     }
+    if light:
+      new_node['light'] = True
+      new_node['peer'] = self.id if peer is None else peer
     self.blockchain.nodes.append(new_node)
     self.node_counter += 1
+
+    # Validators send more than the rate limit of admission control when they catch up
+    if new_node['initial_stake'] > 0:
+      self.transaction_queue.exempt_sender((address, port))
+    self.query_cache.invalidate()
     self.log(termcolor.blue(f'Added node {new_node["id"]}'), not self.debug)
 
+    # The new stake changes the pool of the next block, unless it is already mined
+    if self.next_validator is not None and self.blockchain.block_index not in self.mined_blocks:
+      self.schedule_validator()
+
     return new_node
 
   def set_stake(self, amount):
     """Set the stake of the node in the blockchain.
 
     Args:
-      amount (float): The amount to stake.
+      amount (int): The amount to stake, in minor units.
     """
 
-    self.log(termcolor.magenta(f'Setting stake to {amount}'))
+    self.log(termcolor.magenta(f'Setting stake to {Amount.format(amount)}'))
 
     self.execute_transaction(-1, 'stake', amount)
 
@@ -310,12 +655,14 @@ class Node:
     Args:
       receiver_id (int): The ID of the receiver.
       type_of_transaction (str): The type of transaction.
-      value (float): The value of the transaction.
+      value (int or str): The value of the transaction, in minor units (see Amount), or the message.
 
     Returns:
       bool: True if the transaction was executed successfully, False otherwise.
     """
 
+    started = time.time()
+
     # Get the receiver and check if it exists
     receiver = next((node for node in self.blockchain.nodes if node['id'] == receiver_id), None) if receiver_id != -1 else {'key': '0'}
     if not receiver:
@@ -326,21 +673,25 @@ class Node:
     with self.balance_lock:
       available_balance = self.wallet.balance - self.stake
       if type_of_transaction == 'stake':
-        if value <= 0.0:
+        if self.light:
+          self.log(termcolor.red('Execute: A light client cannot stake, it does not validate blocks'))
+          return False
+        elif not Amount.is_valid(value) or value <= 0:
           self.log(termcolor.red(f'Execute: Invalid amount to stake: {value}'))
           return False
         elif value > self.wallet.balance:
-          self.log(termcolor.red(f'Execute: Insufficient balance to stake: {self.wallet.balance} < {float(value)} (stake)'))
+          self.log(termcolor.red(f'Execute: Insufficient balance to stake: {Amount.format(self.wallet.balance)} < {Amount.format(value)} (stake)'))
           return False
         else:
           self.stake = value
       elif type_of_transaction == 'coins':
-        total_cost = (1.0 + self.blockchain.fee_rate) * value
-        if total_cost <= 0.0:
+        if not Amount.is_valid(value) or value <= 0:
           self.log(termcolor.red(f'Execute: Invalid amount to transfer: {value}'))
           return False
-        elif available_balance < total_cost:
-          self.log(termcolor.red(f'Execute: Insufficient balance to transfer: {available_balance} < {total_cost} (transfer)'))
+
+        total_cost = value + Amount.fee(value, self.blockchain.fee_rate)
+        if available_balance < total_cost:
+          self.log(termcolor.red(f'Execute: Insufficient balance to transfer: {Amount.format(available_balance)} < {Amount.format(total_cost)} (transfer)'))
           return False
         else:
           self.wallet.balance -= total_cost
@@ -348,11 +699,13 @@ class Node:
         if not isinstance(value, str):
           self.log(termcolor.red('Execute: Invalid message to send'))
           return False
-        elif available_balance < len(value):
-          self.log(termcolor.red(f'Execute: Insufficient balance to send message: {available_balance} < {float(len(value))} (message)'))
+
+        total_cost = Amount.message_cost(value)
+        if available_balance < total_cost:
+          self.log(termcolor.red(f'Execute: Insufficient balance to send message: {Amount.format(available_balance)} < {Amount.format(total_cost)} (message)'))
           return False
         else:
-          self.wallet.balance -= len(value)
+          self.wallet.balance -= total_cost
       else:
         self.log(termcolor.red(f'Execute: Invalid transaction type: {type_of_transaction}'))
         return False
@@ -361,6 +714,12 @@ class Node:
     transaction = self.create_transaction(receiver['key'], type_of_transaction, value)
 
     self.log(termcolor.magenta(f'Executing transaction {termcolor.underline(transaction.uuid)}'))
+    self.trace(transaction.uuid, 'execute', started)
+
+    # A light client does not receive its own transaction back, it is pending until a block includes it
+    if self.light:
+      with self.balance_lock:
+        self.light_pending[transaction.hash] = total_cost
 
     self.broadcast_transaction(transaction)
 
@@ -372,17 +731,17 @@ class Node:
     Args:
       receiver_address (str): The address of the receiver.
       type_of_transaction (str): The type of the transaction, one of 'coins', 'message', or 'stake'.
-      value (float): The value of the transaction.
+      value (int or str): The value of the transaction, in minor units, or the message.
 
     Returns:
       Transaction: The transaction.
     """
 
     transaction = {
-      'uuid': str(uuid.uuid4()),
+      'uuid': self.create_uuid(),
       'sender_address': self.wallet.get_address(),
       'receiver_address': receiver_address,
-      'timestamp': datetime.now().isoformat(),
+      'timestamp': self.now().isoformat(),
       'type_of_transaction': type_of_transaction,
       'value': value,
       'nonce': self.nonce,
@@ -430,42 +789,328 @@ class Node:
       transaction (Transaction): The transaction.
     """
 
-    message = json.dumps({
+    message = {
       'message_type': 'transaction',
       'transaction': dict(transaction)
-    })
+    }
 
     self.log(termcolor.magenta(f'Broadcasting transaction {termcolor.underline(transaction.uuid)}'))
-    for node in self.blockchain.nodes:
-      self.send(message, node['address'], node['port'])
+    self.broadcaster.broadcast(message)
+
+    self.trace(transaction.uuid, 'broadcast')
 
-  def receive_transaction(self, transaction):
+  def receive_transaction(self, transaction, address=None):
     """Handles a transaction received from another node in the blockchain network.
 
-    This method first validates the transaction using the validate_transaction
-    method. If the transaction is valid, it registers the transaction using the
-    register_transaction method.
+    This method drops the transaction if the replay filter has seen its uuid
+    or its recomputed hash, or if its hash is invalid. Otherwise it queues the
+    transaction for validation (see handle_transaction) and pools it; the
+    replay filter records it once it is valid. Admission control charges the
+    peer that sent the datagram, not the claimed sender, which is not verified
+    yet: forged transactions cannot use up the rate of another sender.
 
     Args:
       transaction (dict): The transaction.
+      address (tuple, optional): The (address, port) of the peer that sent it, None if it is the node itself.
 
     Returns:
       bool: True if the transaction was received and handled successfully, False otherwise.
     """
 
     self.log(termcolor.blue(f'Received transaction {termcolor.underline(transaction["uuid"])}'), not self.debug)
-    self.transaction_queue.put(transaction)
+
+    # Reject transactions that were already received, before validating them again; the claimed hash is not trusted
+    transaction_hash = self.hash_transaction(transaction)
+    if self.replay_filter.contains(transaction['uuid'], transaction_hash):
+      self.log(termcolor.yellow(f'Transaction {termcolor.underline(transaction["uuid"])} was already received, dropping'), not self.debug)
+      return False
+
+    # Keep a transaction with a forged hash out of the pool, where it would stand for the real one
+    if transaction.get('hash') != transaction_hash:
+      self.log(termcolor.red(f'Transaction {termcolor.underline(transaction["uuid"])} has an invalid hash, dropping'), not self.debug)
+      return False
+
+    self.trace(transaction['uuid'], 'receive')
+
+    # Shed the transaction if its peer is over its rate or the queue is full, before it can push valid ones out of the pool
+    if not self.transaction_queue.put(transaction, tuple(address) if address is not None else 'local'):
+      self.log(termcolor.yellow(f'Transaction {termcolor.underline(transaction["uuid"])} was shed by admission control'), not self.debug)
+      return False
+
+    self.pool_transaction(transaction)
+    return True
+
+  def is_known_transaction(self, key):
+    """Checks if a transaction uuid or hash belongs to a committed or pending (registered but not committed) transaction.
+
+    It confirms the Bloom filter hits of the replay filter.
+
+    Args:
+      key (str): The uuid or hash.
+
+    Returns:
+      bool: True if the transaction is known.
+    """
+
+    if key in self.blockchain.transaction_uuids or key in self.blockchain.transaction_hashes:
+      return True
+
+    with self.mining_lock:
+      pending = [transaction for block in self.sealed_blocks.values() for transaction in block] + self.current_block
+    return any(key == transaction.uuid or key == transaction.hash for transaction in pending)
+
+  def pool_transaction(self, transaction):
+    """Adds a transaction to the transaction pool and fills the compact blocks waiting for it.
+
+    Args:
+      transaction (dict): The transaction.
+    """
+
+    completed = []
+    with self.pool_lock:
+      self.transaction_pool[transaction['hash']] = transaction
+      self.pool_nonces[(transaction['sender_address'], transaction['nonce'])] = transaction['hash']
+      while len(self.transaction_pool) > self.pool_capacity:
+        transaction_hash, evicted = self.transaction_pool.popitem(last=False)
+        key = (evicted['sender_address'], evicted['nonce'])
+        if self.pool_nonces.get(key) == transaction_hash:
+          del self.pool_nonces[key]
+
+      for block_hash, partial in self.partial_blocks.items():
+        if transaction['hash'] in partial['missing']:
+          partial['missing'].discard(transaction['hash'])
+          if not partial['missing']:
+            completed.append(block_hash)
+
+    for block_hash in completed:
+      self.complete_block(block_hash)
+
+  def get_pooled_transaction(self, sender_key, nonce):
+    """Gets a pooled transaction by sender and nonce, e.g. one that filled a compact block.
+
+    Args:
+      sender_key (str): The address of the sender.
+      nonce (int): The nonce.
+
+    Returns:
+      dict: The transaction, or None if it is not in the pool.
+    """
+
+    with self.pool_lock:
+      transaction_hash = self.pool_nonces.get((sender_key, nonce))
+      return self.transaction_pool.get(transaction_hash) if transaction_hash is not None else None
 
   def handle_transactions(self):
     """Handles transactions from the transaction queue."""
 
     while True:
-      transaction = self.transaction_queue.get()
+      self.handle_transaction(self.transaction_queue.get())
+
+  def handle_transaction(self, transaction):
+    """Validates and registers a transaction from the transaction queue, or handles a control item.
+
+    A control item (None) is queued by the sealer, to seal the current block
+    if it is due, and after every registered block, to release the held
+    transactions whose sender caught up with the committed nonces.
+
+    Args:
+      transaction (dict): The transaction, or None for a control item.
+    """
+
+    # A control item from the sealer or the block handler
+    if transaction is None:
+      self.release_transactions()
+      if self.current_block and self.is_block_due():
+        self.log(termcolor.blue('Reached maximum block age. Starting mining process'), not self.debug)
+        self.seal_block()
+      return
+
+    self.trace(transaction['uuid'], 'dequeue')
+
+    # Drop transactions that are already in the chain, e.g. delivered twice
+    if transaction['hash'] in self.blockchain.transaction_hashes:
+      self.log(termcolor.yellow(f'Transaction {termcolor.underline(transaction["uuid"])} is already in the chain'), not self.debug)
+      return
+
+    # Drop transactions whose nonce was already used, and hold the ones that overtook an earlier one of the same sender
+    sender = next((node for node in self.blockchain.nodes if node['key'] == transaction['sender_address']), None)
+    if sender is not None and isinstance(transaction['nonce'], int):
+      if transaction['nonce'] < sender['nonce']:
+        self.log(termcolor.yellow(f'Transaction {termcolor.underline(transaction["uuid"])} has an old nonce, dropping'), not self.debug)
+        return
+      if transaction['nonce'] > sender['nonce']:
+        self.hold_transaction(transaction)
+
+        # The missing transaction may be in the pool, e.g. from a compact block, otherwise ask its sender
+        missing = self.get_pooled_transaction(transaction['sender_address'], sender['nonce'])
+        if missing is not None:
+          self.handle_transaction(missing)
+        else:
+          self.request_transaction(transaction['sender_address'], sender['nonce'])
+        return
+
+    while transaction is not None:
       if not self.validate_transaction(transaction):
         self.log(termcolor.yellow(f'Transaction {termcolor.underline(transaction["uuid"])} is invalid'), not self.debug)
+      else:
+        self.trace(transaction['uuid'], 'validate')
+        self.replay_filter.add(transaction['uuid'], transaction['hash'])
+        self.register_transaction(transaction)
+
+      held = self.held_transactions.pop((transaction['sender_address'], sender['nonce']), None) if sender is not None else None
+      transaction = held[0] if held is not None else None
+
+    # Ask for a release pass if the oldest held transaction timed out, e.g. when no block arrives to trigger one
+    if self.held_transactions and next(iter(self.held_transactions.values()))[1] <= self.clock() - self.hold_timeout:
+      self.transaction_queue.put(None)
+
+  def hold_transaction(self, transaction):
+    """Holds a transaction that is ahead of the next nonce of its sender, until the missing ones arrive or time out.
+
+    The held transactions are bounded: when there are too many, the oldest one
+    is dropped, which the sender's later transactions survive because the gap
+    it leaves times out like any other.
+
+    Args:
+      transaction (dict): The transaction.
+    """
+
+    key = (transaction['sender_address'], transaction['nonce'])
+    if key in self.held_transactions:
+      return
+
+    self.log(termcolor.yellow(f'Transaction {termcolor.underline(transaction["uuid"])} is ahead of its sender, holding'), not self.debug)
+    self.held_transactions[key] = (transaction, self.clock())
+    while len(self.held_transactions) > self.held_capacity:
+      dropped, _ = self.held_transactions.popitem(last=False)[1]
+      self.log(termcolor.yellow(f'Transaction {termcolor.underline(dropped["uuid"])} was held for too long, dropping'), not self.debug)
+
+  def release_transactions(self):
+    """Handles the held transactions whose sender caught up, and gives up on the gaps that timed out.
+
+    The next nonce of a sender moves forward when its missing transaction
+    arrives or is found in the pool (e.g. from a compact block), and also
+    when a block commits it (see
+    restore_state), so a transaction that never reached the node does not
+    block its sender. A missing transaction that is not in the pool is
+    requested from its sender, at most once per repair interval; the block
+    handler queues a release pass every repair interval while transactions
+    are held. A held
+    transaction whose nonce is already used is dropped. If a gap is still open
+    after the hold timeout, the missing transactions are considered lost: the
+    next nonce of the sender skips to its oldest held transaction.
+    """
+
+    if not self.held_transactions:
+      return
+
+    senders = {node['key']: node for node in self.blockchain.nodes}
+
+    # Fill the gaps with the pooled transactions, or ask the senders for them again
+    for sender_key in {key[0] for key in self.held_transactions}:
+      if sender_key not in senders:
         continue
+      missing = self.get_pooled_transaction(sender_key, senders[sender_key]['nonce'])
+      if missing is not None:
+        self.handle_transaction(missing)
+      else:
+        self.request_transaction(sender_key, senders[sender_key]['nonce'])
+
+    # Give up on the gaps before the transactions held for longer than the timeout
+    deadline = self.clock() - self.hold_timeout
+    skips = {}
+    for (sender_key, nonce), (_, held_at) in self.held_transactions.items():
+      if held_at > deadline:
+        break
+      skips[sender_key] = min(nonce, skips.get(sender_key, nonce))
+
+    with self.blockchain_lock:
+      for sender_key, nonce in skips.items():
+        sender = senders.get(sender_key)
+        if sender is not None and sender['nonce'] < nonce:
+          self.log(termcolor.yellow(f'Gave up waiting for nonces {sender["nonce"]} to {nonce - 1} of node {sender["id"]}'), not self.debug)
+          sender['nonce'] = nonce
+
+    for key in list(self.held_transactions):
+      sender = senders.get(key[0])
+      if key not in self.held_transactions:
+        continue
+      if sender is None or key[1] < sender['nonce']:
+        del self.held_transactions[key]
+      elif key[1] == sender['nonce']:
+        self.handle_transaction(self.held_transactions.pop(key)[0])
+
+  def request_transaction(self, sender_key, nonce):
+    """Requests a missing transaction from its sender, at most once per repair interval.
+
+    Args:
+      sender_key (str): The address of the sender.
+      nonce (int): The nonce of the transaction.
+    """
+
+    now = self.clock()
+    requested = self.requested_transactions.get((sender_key, nonce))
+    if requested is not None and now - requested < self.repair_interval:
+      return
+    self.requested_transactions[(sender_key, nonce)] = now
+    while len(self.requested_transactions) > self.held_capacity:
+      del self.requested_transactions[next(iter(self.requested_transactions))]
+
+    sender = next((node for node in self.blockchain.nodes if node['key'] == sender_key), None)
+    if sender is None or sender['id'] == self.id:
+      return
+
+    self.log(termcolor.yellow(f'Requesting transaction {nonce} from node {sender["id"]}'), not self.debug)
+    self.send(json.dumps({'message_type': 'get_transaction', 'sender_address': sender_key, 'nonce': nonce}), sender['address'], sender['port'])
+
+  def send_transaction(self, request, address):
+    """Sends a requested transaction to a node, if it is pending on this node or in its pool.
+
+    Args:
+      request (dict): The request, with the address of the sender and the nonce of the transaction.
+      address (tuple): The (address, port) of the node.
+    """
+
+    with self.mining_lock:
+      pending = [transaction for block in self.sealed_blocks.values() for transaction in block] + self.current_block
+    transaction = next((dict(transaction) for transaction in pending if transaction.sender_address == request['sender_address'] and transaction.nonce == request['nonce']), None)
+    if transaction is None:
+      transaction = self.get_pooled_transaction(request['sender_address'], request['nonce'])
+    if transaction is None:
+      return
+
+    self.socket.sendto(json.dumps({'message_type': 'transaction', 'transaction': transaction}).encode(), address)
+
+  def clock(self):
+    """Gets the time used for the timeouts of the node, in seconds.
+
+    Returns:
+      float: The time of a monotonic clock.
+    """
+
+    return time.monotonic()
 
-      self.register_transaction(transaction)
+  def now(self):
+    """Gets the date and time used for the timestamps of the transactions and blocks of the node.
+
+    Returns:
+      datetime: The current local date and time.
+    """
+
+    return datetime.now()
+
+  def create_uuid(self):
+    """Creates the uuid of a new transaction.
+
+    Returns:
+      str: A random uuid.
+    """
+
+    return str(uuid.uuid4())
+
+  @staticmethod
+  def hash_transaction(transaction):
+    return hashlib.sha256(json.dumps({key: value for key, value in transaction.items() if key != 'hash'}).encode()).hexdigest()
 
   def validate_transaction(self, transaction):
     """Validates a transaction
@@ -500,9 +1145,6 @@ class Node:
     if not sender:
       self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid sender: {sender_key}'), not self.debug)
       return False
-    else:
-      with self.blockchain_lock:
-        sender['nonce'] += 1
 
     receiver = 'stake_receiver' if receiver_key == '0' and transaction['type_of_transaction'] == 'stake' else next((node for node in self.blockchain.nodes if node['key'] == receiver_key), None)
     if not receiver:
@@ -515,44 +1157,51 @@ class Node:
       return False
 
     # Check if the nonce of the sender is valid
-    if transaction['nonce'] != sender['nonce'] - 1:
-      self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid nonce: {transaction["nonce"]} != {sender["nonce"] - 1} (expected)'), not self.debug)
+    if transaction['nonce'] != sender['nonce']:
+      self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid nonce: {transaction["nonce"]} != {sender["nonce"]} (expected)'), not self.debug)
       return False
 
     # Check if the signature of the transaction is valid
     if not self.verify_signature(transaction):
       self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Signature verification failed'), not self.debug)
       return False
+    self.trace(transaction['uuid'], 'verify')
 
     # Check if the hash of the transaction is the expected one
-    expected_hash = hashlib.sha256(json.dumps({key: value for key, value in transaction.items() if key != 'hash'}).encode()).hexdigest()
+    expected_hash = self.hash_transaction(transaction)
     if transaction['hash'] != expected_hash:
       self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid hash: {transaction["hash"]} != {expected_hash} (expected)'), not self.debug)
       return False
+    self.mark_verified(transaction['hash'])
+
+    # The sender signed the transaction, so its nonce is used even if the transaction turns out invalid
+    with self.blockchain_lock:
+      sender['nonce'] += 1
 
     # Check if the sender has enough balance to execute the transaction
     available_balance = sender['balance'] - sender['stake']
     if transaction['type_of_transaction'] == 'coins':
-      total_cost = (1.0 + self.blockchain.fee_rate) * transaction['value']
-      if total_cost <= 0:
+      if not Amount.is_valid(transaction['value']) or transaction['value'] <= 0:
         self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid amount to transfer: {transaction["value"]}'), not self.debug)
         return False
+      total_cost = transaction['value'] + Amount.fee(transaction['value'], self.blockchain.fee_rate)
       if available_balance < total_cost:
-        self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Insufficient balance: {available_balance} < {total_cost}'), not self.debug)
+        self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Insufficient balance: {Amount.format(available_balance)} < {Amount.format(total_cost)}'), not self.debug)
         return False
     elif transaction['type_of_transaction'] == 'message':
       if not isinstance(transaction['value'], str):
         self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid message'))
         return False
-      if available_balance < len(transaction['value']):
-        self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Insufficient balance: {available_balance} < {float(len(transaction["value"]))}')), not self.debug
+      total_cost = Amount.message_cost(transaction['value'])
+      if available_balance < total_cost:
+        self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Insufficient balance: {Amount.format(available_balance)} < {Amount.format(total_cost)}'), not self.debug)
         return False
     elif transaction['type_of_transaction'] == 'stake':
-      if transaction['value'] <= 0:
+      if not Amount.is_valid(transaction['value']) or transaction['value'] <= 0:
         self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Invalid amount to stake: {transaction["value"]}'))
         return False
       if transaction['value'] > sender['balance']:
-        self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Insufficient balance: {sender["balance"]} < {transaction["value"]}'), not self.debug)
+        self.log(termcolor.red(f'Validate transaction {termcolor.underline(transaction["uuid"])}: Insufficient balance: {Amount.format(sender["balance"])} < {Amount.format(transaction["value"])}'), not self.debug)
         return False
 
     self.log(termcolor.green(f'Transaction {termcolor.underline(transaction["uuid"])} validated successfully'), not self.debug)
@@ -570,11 +1219,11 @@ class Node:
       bool: True if the signature is valid, False otherwise.
     """
 
-    signature = base64.b64decode(transaction['signature'])
     transaction_bytes = json.dumps({key: value for key, value in transaction.items() if key != 'signature' and key != 'hash'}).encode()
-    public_key = serialization.load_pem_public_key(transaction['sender_address'].encode())
 
     try:
+      signature = base64.b64decode(transaction['signature'])
+      public_key = serialization.load_pem_public_key(transaction['sender_address'].encode())
       public_key.verify(
         signature,
         transaction_bytes,
@@ -589,6 +1238,19 @@ class Node:
       self.log(termcolor.red(f'Verify transaction {termcolor.underline(transaction["uuid"])}: Signature verification failed'), not self.debug)
       return False
 
+  def mark_verified(self, transaction_hash):
+    """Adds a transaction hash to the bounded cache of verified signatures.
+
+    Args:
+      transaction_hash (str): The hash of the transaction.
+    """
+
+    with self.pool_lock:
+      self.verified_transactions[transaction_hash] = True
+      self.verified_transactions.move_to_end(transaction_hash)
+      while len(self.verified_transactions) > self.verified_capacity:
+        self.verified_transactions.popitem(last=False)
+
   def register_transaction(self, transaction):
     """Registers a transaction in the blockchain and updates info accordingly.
 
@@ -601,92 +1263,231 @@ class Node:
     sender = next((node for node in self.blockchain.nodes if node['key'] == transaction['sender_address']), None)
     receiver = next((node for node in self.blockchain.nodes if node['key'] == transaction['receiver_address']), None)
 
-    # Update balances and stakes
+    # Update balances and stakes, and add the transaction to the current block (and to the assembled block if elected),
+    # in one step so that restore_state sees either both or neither
     with self.blockchain_lock:
       if transaction['type_of_transaction'] == 'coins':
-        total_cost = (1.0 + self.blockchain.fee_rate) * transaction['value']
-        sender['balance'] -= total_cost
+        sender['balance'] -= transaction['value'] + Amount.fee(transaction['value'], self.blockchain.fee_rate)
         receiver['balance'] += transaction['value']
-        self.current_fees += total_cost - transaction['value']
 
         with self.balance_lock:
           if receiver['id'] == self.id:
             self.wallet.balance += transaction['value']
 
       elif transaction['type_of_transaction'] == 'message':
-        sender['balance'] -= len(transaction['value'])
-        self.current_fees += len(transaction['value'])
+        sender['balance'] -= Amount.message_cost(transaction['value'])
 
       elif transaction['type_of_transaction'] == 'stake':
         sender['stake'] = transaction['value']
 
+      with self.mining_lock:
+        self.current_block.append(Transaction(**transaction))
+        if self.assembler is not None and self.assembler.index == self.seal_index:
+          self.assembler.add(self.current_block[-1])
+        full = len(self.current_block) >= self.blockchain.get_block_capacity()
+
     if sender['id'] == self.id or receiver is not None and receiver['id'] == self.id:
-      self.history += f'{transaction["uuid"]} {sender["id"]} -> {receiver["id"] if receiver is not None else "none"}, {transaction["type_of_transaction"]}: {transaction["value"]}\n'
+      self.history.add(
+        transaction['type_of_transaction'],
+        transaction['value'],
+        transaction['timestamp'],
+        sender['id'],
+        receiver['id'] if receiver is not None else None,
+        transaction['uuid']
+      )
 
     self.log(termcolor.green(f'Transaction {termcolor.underline(transaction["uuid"])} registered successfully: {sender["id"]} -> {receiver["id"] if receiver is not None else "none"}, {transaction["type_of_transaction"]}: {transaction["value"]}'), not self.debug)
+    self.trace(transaction['uuid'], 'register')
+
+    # Mine if the block is full
+    if full:
+      self.log(termcolor.blue('Reached block capacity. Starting mining process'), not self.debug)
+      self.seal_block()
+
+  def get_block_age(self):
+    """Gets the age of the oldest transaction of the current block, from its (signed) timestamp to the clock of the node.
+
+    Returns:
+      float: The age in seconds, 0.0 if the current block is empty.
+    """
+
+    if not self.current_block:
+      return 0.0
+    oldest = min(transaction.timestamp for transaction in self.current_block)
+    return (self.now() - datetime.fromisoformat(oldest)).total_seconds()
+
+  def is_block_due(self):
+    """Checks if the node should seal the current block by age.
+
+    Sealing by age is driven by the validator: the clocks of the nodes are not
+    synchronized, so only the scheduled validator of the block being filled
+    seals it when its oldest transaction reaches the maximum block age, on its
+    own clock. The other nodes take the block it sends, whose timestamp
+    records when it was sealed, and keep the transactions it left out for the
+    next block; if no block comes, they ask their peers for it (see
+    repair_blocks).
 
-    # Add the transaction to the current block and mine if the block is full
-    self.current_block.append(Transaction(**transaction))
-    if len(self.current_block) == self.blockchain.block_capacity:
-      self.past_blocks.put(self.current_block)
-      current_block_copy = self.current_block.copy()
+    Returns:
+      bool: True if the current block should be sealed, False otherwise.
+    """
+
+    scheduled = self.next_validator
+    if self.blockchain.seal_interval <= 0 or scheduled is None or scheduled[0] != self.seal_index or scheduled[3] != self.id:
+      return False
+    return self.get_block_age() >= self.blockchain.seal_interval
+
+  def seal_block(self):
+    """Closes the current block and starts the mining process.
+
+    The sealed block is kept by index until the block with the same index is
+    registered, and the node immediately starts filling the next block. The
+    block is mined as soon as the previous block is registered.
+    """
+
+    with self.mining_lock:
+      self.sealed_blocks[self.seal_index] = self.current_block
       self.current_block = []
+      self.seal_index += 1
 
-      self.log(termcolor.blue('Reached block capacity. Starting mining process'), not self.debug)
-      self.mine_block(current_block_copy)
+    for transaction in self.sealed_blocks[self.seal_index - 1]:
+      self.trace(transaction.uuid, 'mine')
+
+    self.mine_pending()
+
+  def mine_pending(self):
+    """Mines the sealed block that follows the last registered block, if there is one."""
+
+    with self.mining_lock:
+      index = self.blockchain.block_index
+      if index not in self.sealed_blocks or index in self.mined_blocks:
+        return
+      self.mined_blocks.add(index)
+      current_block = self.sealed_blocks[index]
+
+    self.mine_block(current_block)
+
+  def seal_blocks(self):
+    """Periodically requests sealing of the current block when its oldest transaction is too old.
+
+    The request is queued as None on the transaction queue, so that sealing
+    happens on the transaction handler, in order with the registered transactions.
+    """
+
+    while True:
+      time.sleep(min(0.1, self.blockchain.seal_interval / 4))
+      self.check_seal()
+
+  def check_seal(self):
+    """Requests sealing of the current block if the node is its validator and its oldest transaction reached the maximum block age."""
+
+    if self.current_block and self.is_block_due():
+      self.transaction_queue.put(None)
 
   def mine_block(self, current_block):
     """Mines a block in the blockchain.
 
-    This method first creates a list of validators based on the stake of each
-    node in the blockchain. It then uses the get_validator_from_pool method to
-    pick a validator from the list of validators. If the node is picked as the
-    validator, it creates a new block using the current block of transactions
-    and broadcasts the block to all nodes in the blockchain network using the
+    This method picks the validator of the block, which was scheduled when the
+    previous block was registered (see schedule_validator). If the node is
+    picked as the validator, it creates a new block using the sealed block of
+    transactions (reusing the pre-assembled block when possible) and
+    broadcasts the block to all nodes in the blockchain network using the
     broadcast_block method.
 
+    Args:
+      current_block (list): The transactions of the sealed block.
+    """
+
+    index = self.blockchain.block_index
+    validator_id = self.get_validator(index)
+    self.log(termcolor.blue(f'Node {validator_id} was picked as the validator for block {index}'), not self.debug)
+    for transaction in current_block:
+      self.trace(transaction.uuid, 'validator')
+
+    if validator_id != self.id:
+      return
+
+    self.log(termcolor.magenta('Mining block'), not self.debug)
+
+    # Skip transactions that were already committed in a previous block, or that the state after it cannot cover
+    transactions = sorted(current_block, key=lambda transaction: transaction.timestamp)
+    previous_hash = self.blockchain.get_last_block().hash
+    timestamp = self.now().isoformat()
+    with self.mining_lock:
+      assembler, self.assembler = self.assembler, None
+    new_block = assembler.build(transactions, timestamp) if assembler is not None and (assembler.index, assembler.previous_hash) == (index, previous_hash) else None
+    if new_block is None:
+      transactions = self.select_transactions(transactions, self.block_tree.get(previous_hash))
+      new_block = Block(index, self.id, transactions, previous_hash, timestamp)
+
+    self.broadcast_block(new_block)
+
+  def get_validator_pool(self, state):
+    """Creates a list of validators based on the stake of each node in the state after a block.
+
+    The stakes come from the block tree, not from the live state of the nodes,
+    so that pending stake transactions do not change the pool and every node
+    computes the same validator for the same previous block. Nodes that joined
+    after the block count with the stake they declared when joining.
+
+    Args:
+      state (dict): The state after the previous block, keyed by node address.
+
+    Returns:
+      list: The IDs of the nodes, each repeated once per staked coin.
     """
 
-    # Create a list of validators based on the stake of each node
     entries = []
     for node in self.blockchain.nodes:
-      entries.extend([node['id']] * int(node['stake']))
+      stake = state[node['key']]['stake'] if node['key'] in state else node.get('initial_stake', 0)
+      entries.extend([node['id']] * (stake // Amount.scale))
 
-    seed = self.blockchain.get_last_block().hash
+    return entries
 
-    validator_id = self.get_validator_from_pool(entries, seed)
-    self.log(termcolor.blue(f'Node {validator_id} was picked as the validator for block {self.blockchain.block_index}'), not self.debug)
+  def schedule_validator(self):
+    """Computes the validator of the next block, right after the previous one is registered.
 
-    # Save the current fees and transactions for easier block validation and registration
-    self.past_pools.put(entries)
+    If the node is the validator, it starts assembling the block, so that its
+    transactions are already selected when the block is sealed.
+    """
 
-    if validator_id == self.id:
-      self.log(termcolor.magenta('Mining block'), not self.debug)
+    index = self.blockchain.block_index
+    seed = self.blockchain.get_last_block().hash
+    entries = self.get_validator_pool(self.block_tree.get(seed)['state'])
+    validator_id = self.get_validator_from_pool(entries, seed)
 
-      transactions = sorted(current_block, key=lambda transaction: transaction.timestamp)
-      new_block = Block(
-        self.blockchain.block_index,
-        self.id,
-        transactions,
-        self.blockchain.get_last_block().hash
-      )
+    self.next_validator = (index, seed, entries, validator_id)
+    self.log(termcolor.blue(f'Node {validator_id} is scheduled as the validator for block {index}'), not self.debug)
 
-      with self.balance_lock:
-        self.wallet.balance += self.current_fees
+    with self.mining_lock:
+      if validator_id == self.id:
+        self.assembler = BlockAssembler(index, self.id, seed, self.transaction_selector(self.block_tree.get(seed)))
+        for transaction in self.sealed_blocks.get(index, self.current_block if self.seal_index == index else []):
+          self.assembler.add(transaction)
+      else:
+        self.assembler = None
+
+  def get_validator(self, index):
+    """Gets the validator of a block, scheduling it if it was not scheduled yet.
 
-      self.history += f'Credited {self.current_fees} BCC for mining block {self.blockchain.block_index}\n'
+    Args:
+      index (int): The index of the block, which must follow the last registered block.
 
-      self.broadcast_block(new_block)
+    Returns:
+      int: The ID of the validator.
+    """
 
-    self.current_fees = 0
+    if self.next_validator is None or self.next_validator[:2] != (index, self.blockchain.get_last_block().hash):
+      self.schedule_validator()
 
-    while not self.past_blocks.empty():
-      pass
+    return self.next_validator[3]
 
   @staticmethod
   def get_validator_from_pool(pool, seed):
     """Picks a validator from a pool of validators based on a specified seed.
 
+    A dedicated generator is used, so that other threads using the random
+    module cannot change the outcome.
+
     Args:
       pool (list): A list of validators.
       seed (str): The seed.
@@ -695,28 +1496,38 @@ class Node:
       int: The ID of the validator.
     """
 
-    random.seed(seed)
-
     if not pool:
       return 0
 
-    return random.choice(pool)
+    return random.Random(seed).choice(pool)
 
   def broadcast_block(self, block):
-    """Broadcasts a block to all nodes in the blockchain network.
+    """Broadcasts a compact block to all nodes in the blockchain network.
+
+    The compact block carries the header of the block and the ordered hashes
+    of its transactions, which the other nodes already hold in their pool.
 
     Args:
       block (Block): The block.
     """
 
-    message = json.dumps({
-      'message_type': 'block',
-      'block': dict(block)
-    })
+    message = {
+      'message_type': 'compact_block',
+      'compact_block': {
+        'index': block.index,
+        'timestamp': block.timestamp,
+        'validator': block.validator,
+        'transactions': [transaction.hash for transaction in block.transactions],
+        'previous_hash': block.previous_hash,
+        'hash': block.hash
+      }
+    }
 
     self.log(termcolor.magenta(f'Broadcasting new block: {block.index}'), not self.debug)
-    for node in self.blockchain.nodes:
-      self.send(message, node['address'], node['port'])
+    self.broadcaster.broadcast(message)
+
+    for transaction in block.transactions:
+      self.trace(transaction.uuid, 'broadcast_block')
 
   def receive_block(self, block):
     """Handles a block received from another node in the blockchain network.
@@ -731,27 +1542,351 @@ class Node:
       bool: True if the block was received and handled successfully, False otherwise.
     """
 
+    error = self.check_block_format(block)
+    if error is not None:
+      self.log(termcolor.red(f'Received block: {error}, dropping'), not self.debug)
+      return False
+
     self.log(termcolor.blue(f'Received block {block["index"]}'), not self.debug)
-    self.block_queue.put(block)
 
-  def handle_blocks(self):
-    """Handles blocks from the block queue."""
+    try:
+      self.block_queue.put_nowait(block)
+    except Full:
+      self.shed_blocks += 1
+      self.log(termcolor.yellow(f'Block {block["index"]} was shed, the block queue is full'), not self.debug)
+      return False
 
-    while True:
-      block = self.block_queue.get()
-      if not self.validate_block(block):
-        self.log(termcolor.yellow(f'Block {block["index"]} is invalid'), not self.debug)
-        continue
+  def receive_compact_block(self, compact_block, address=None):
+    """Rebuilds a block from a compact block and the transaction pool.
+
+    If some transactions are missing from the pool, they are requested from
+    the node that sent the compact block and the block is completed when they
+    arrive, either from that node or through the usual transaction broadcast.
+    A duplicate of a compact block that is still partial sends the request
+    again (to the node that sent the duplicate), since the request or its
+    answer may have been lost; the block handler also retries and, in the
+    end, requests the full block (see repair_partial_blocks).
+
+    Args:
+      compact_block (dict): The compact block.
+      address (tuple, optional): The (address, port) of the node that sent the compact block.
+    """
+
+    self.log(termcolor.blue(f'Received compact block {compact_block["index"]}'), not self.debug)
+
+    with self.pool_lock:
+      partial = self.partial_blocks.get(compact_block['hash'])
+      if partial is None:
+        missing = {transaction_hash for transaction_hash in compact_block['transactions'] if transaction_hash not in self.transaction_pool}
+        partial = self.partial_blocks[compact_block['hash']] = {'block': compact_block, 'missing': missing, 'address': address, 'received_at': self.clock(), 'requested_at': None, 'attempts': 0}
+      elif partial['requested_at'] is not None and self.clock() - partial['requested_at'] < self.partial_retry:
+        return
+      elif address is not None:
+        partial['address'] = address
+
+    if not partial['missing']:
+      self.complete_block(compact_block['hash'])
+      return
+
+    self.request_block_transactions(compact_block['hash'])
+
+  def request_block_transactions(self, block_hash):
+    """Requests the missing transactions of a partial block from the node that sent its compact block.
+
+    Args:
+      block_hash (str): The hash of the block.
+    """
+
+    with self.pool_lock:
+      partial = self.partial_blocks.get(block_hash)
+      if partial is None or partial['address'] is None or not partial['missing']:
+        return
+      partial['requested_at'] = self.clock()
+      partial['attempts'] += 1
+      missing, address = list(partial['missing']), partial['address']
+
+    self.log(termcolor.yellow(f'Compact block {partial["block"]["index"]}: Requesting {len(missing)} missing transactions'), not self.debug)
+    self.socket.sendto(json.dumps({
+      'message_type': 'get_block_transactions',
+      'block_hash': block_hash,
+      'hashes': missing
+    }).encode(), address)
+
+  def complete_block(self, block_hash):
+    """Builds the full block of a compact block whose transactions are all in the pool.
+
+    A transaction may have left the bounded pool since it was counted, in
+    which case it is requested again instead.
+
+    Args:
+      block_hash (str): The hash of the block.
+    """
+
+    with self.pool_lock:
+      partial = self.partial_blocks.get(block_hash)
+      if partial is None:
+        return
+      transactions = [self.transaction_pool.get(transaction_hash) for transaction_hash in partial['block']['transactions']]
+      partial['missing'] = {transaction_hash for transaction_hash, transaction in zip(partial['block']['transactions'], transactions) if transaction is None}
+      if not partial['missing']:
+        del self.partial_blocks[block_hash]
+
+    if partial['missing']:
+      self.request_block_transactions(block_hash)
+      return
+
+    self.receive_block({**partial['block'], 'transactions': transactions})
+
+  def repair_partial_blocks(self):
+    """Requests the missing transactions of the partial blocks again, and gives up on the ones that stay partial.
+
+    A partial block that is still incomplete after partial_attempts requests,
+    or partial_timeout seconds, is dropped and the full block is requested from
+    the node that sent its compact block.
+    """
+
+    now = self.clock()
+    with self.pool_lock:
+      partials = list(self.partial_blocks.items())
+
+    for block_hash, partial in partials:
+      if partial['attempts'] < self.partial_attempts and now - partial['received_at'] < self.partial_timeout:
+        if partial['requested_at'] is None or now - partial['requested_at'] >= self.partial_retry:
+          self.request_block_transactions(block_hash)
+        continue
+
+      with self.pool_lock:
+        self.partial_blocks.pop(block_hash, None)
+      if partial['address'] is not None:
+        self.log(termcolor.yellow(f'Compact block {partial["block"]["index"]}: Gave up on the missing transactions, requesting the block'), not self.debug)
+        self.socket.sendto(json.dumps({'message_type': 'get_block', 'hash': block_hash}).encode(), partial['address'])
+
+  def send_block_transactions(self, request, address):
+    """Sends the requested transactions of a compact block to a node.
+
+    Args:
+      request (dict): The request, with the block hash and the transaction hashes.
+      address (tuple): The (address, port) of the node.
+    """
+
+    with self.pool_lock:
+      transactions = [self.transaction_pool[transaction_hash] for transaction_hash in request['hashes'] if transaction_hash in self.transaction_pool]
+
+    self.socket.sendto(json.dumps({
+      'message_type': 'block_transactions',
+      'block_hash': request['block_hash'],
+      'transactions': transactions
+    }).encode(), address)
+
+  def receive_block_transactions(self, message, address=None):
+    """Fills the missing transactions of a compact block, and queues them for validation like any received transaction.
+
+    Args:
+      message (dict): The message, with the block hash and the transactions.
+      address (tuple, optional): The (address, port) of the node that sent them.
+    """
+
+    for transaction in message['transactions']:
+      # The transactions go through the usual receive path, those that the node already validated or shed are only pooled
+      if not self.receive_transaction(transaction, address) and transaction.get('hash') == self.hash_transaction(transaction):
+        self.pool_transaction(transaction)
+
+  def handle_blocks(self):
+    """Handles blocks from the block queue, and repairs the missing blocks every repair interval."""
+
+    while True:
+      try:
+        self.process_block(self.block_queue.get(timeout=self.repair_interval))
+      except Empty:
+        pass
+      except Exception as e:
+        self.log(termcolor.red(f'Block handler failed to process a block: {e!r}'), not self.debug)
+
+      if self.clock() - self.repaired >= self.repair_interval:
+        self.repair_blocks()
+
+  def repair_blocks(self):
+    """Requests again the blocks missing before the orphan blocks and the transactions missing from the partial blocks, since a request or its answer may be lost.
+
+    A node that missed the last block of the network has no orphan to notice
+    it, and if it is the next validator the whole network waits for it. So
+    when the node has a sealed block waiting, or transactions that the
+    validator should have sealed by age, and no block was registered for two
+    repair intervals, it asks the next full node in turn for the blocks that
+    follow its last block. Runs on the block handler, which owns the orphan
+    blocks.
+    """
+
+    self.repaired = self.clock()
+    for block in list(self.orphan_blocks.values()):
+      self.request_block(block)
+    self.repair_partial_blocks()
+
+    # Let the transaction handler request the missing transactions of the held ones again
+    if self.held_transactions:
+      self.transaction_queue.put(None)
+
+    overdue = self.blockchain.seal_interval > 0 and self.get_block_age() > self.blockchain.seal_interval + 2 * self.repair_interval
+    if not (self.sealed_blocks or overdue) or self.repaired - self.registered_at < 2 * self.repair_interval:
+      return
+
+    peers = [node for node in self.blockchain.nodes if node['id'] != self.id and not node.get('light')]
+    if peers:
+      self.sync_peer += 1
+      peer = peers[self.sync_peer % len(peers)]
+      self.log(termcolor.yellow(f'No block registered for a while, requesting the blocks after block {self.blockchain.block_index - 1} from node {peer["id"]}'), not self.debug)
+      self.send(json.dumps({'message_type': 'get_block', 'after': self.blockchain.get_last_block().hash}), peer['address'], peer['port'])
+
+  def process_block(self, block):
+    """Validates a block and adds it to the block tree, or buffers it if its previous block is unknown.
+
+    A block may extend any block of the tree, not only the last block of the
+    chain, so that competing branches are kept until the fork-choice rule
+    settles them. A block whose previous block is missing (reordered or lost)
+    is kept as an orphan and the missing block is requested; when a block is
+    added, the orphans that follow it are processed as well. Blocks below the
+    last final block are dropped.
+
+    Args:
+      block (dict): The block.
+    """
+
+    pending = [block]
+    while pending:
+      block = pending.pop()
+
+      if block['hash'] in self.block_tree:
+        self.log(termcolor.yellow(f'Block {block["index"]} is already registered'), not self.debug)
+        continue
+
+      if block['previous_hash'] not in self.block_tree:
+        if block['index'] <= self.block_tree.get(self.block_tree.root)['height']:
+          self.log(termcolor.yellow(f'Block {block["index"]} is below the last final block'), not self.debug)
+        else:
+          self.log(termcolor.yellow(f'Block {block["index"]} follows an unknown block, buffering'), not self.debug)
+          self.orphan_blocks.setdefault(block['hash'], block)
+          self.request_block(block)
+        continue
+
+      if not self.validate_block(block):
+        self.log(termcolor.yellow(f'Block {block["index"]} is invalid'), not self.debug)
+        continue
 
       self.register_block(block)
+      pending.extend(orphan for orphan in self.orphan_blocks.values() if orphan['previous_hash'] == block['hash'])
+      for orphan in pending:
+        self.orphan_blocks.pop(orphan['hash'], None)
+
+  def request_block(self, block):
+    """Requests the first missing block before an orphan block from the validator of the block that follows it.
+
+    A block is requested at most once per second.
+
+    Args:
+      block (dict): The orphan block.
+    """
+
+    while block['previous_hash'] in self.orphan_blocks:
+      block = self.orphan_blocks[block['previous_hash']]
+
+    now = self.clock()
+    requested = self.requested_blocks.get(block['previous_hash'])
+    if requested is not None and now - requested < 1.0:
+      return
+    self.requested_blocks[block['previous_hash']] = now
+
+    validator = next((node for node in self.blockchain.nodes if node['id'] == block['validator']), None)
+    if validator is None or validator['id'] == self.id:
+      return
+
+    self.log(termcolor.yellow(f'Requesting block {block["index"] - 1} from node {validator["id"]}'), not self.debug)
+    self.send(json.dumps({'message_type': 'get_block', 'hash': block['previous_hash']}), validator['address'], validator['port'])
+
+  def send_block(self, request, address):
+    """Sends a requested block to a node, if the node holds it, or the blocks of the chain after a given block.
+
+    Args:
+      request (dict): The request, with the hash of the block, or the hash of the last block of the node ('after').
+      address (tuple): The (address, port) of the node.
+    """
+
+    if 'after' in request:
+      with self.blockchain_lock:
+        position = self.blockchain.block_hashes.get(request['after'])
+        blocks = self.blockchain.chain[position + 1:position + 9] if position is not None else []
+      for block in blocks:
+        self.socket.sendto(json.dumps({'message_type': 'block', 'block': dict(block)}).encode(), address)
+      return
+
+    entry = self.block_tree.get(request['hash'])
+    block = entry['block'] if entry is not None else self.blockchain.get_block(request['hash'])
+    if block is None:
+      return
+
+    self.socket.sendto(json.dumps({'message_type': 'block', 'block': dict(block)}).encode(), address)
+
+  @staticmethod
+  def check_block_format(block):
+    """Checks that a block has the required keys with values of the right types, before it is queued.
+
+    Args:
+      block (dict): The block.
+
+    Returns:
+      str: The reason the block is malformed, or None if it is well formed.
+    """
+
+    if not isinstance(block, dict):
+      return 'Invalid block format'
+
+    types = {'index': int, 'validator': int, 'transactions': list, 'previous_hash': str, 'timestamp': str, 'hash': str}
+    for key, expected in types.items():
+      if not isinstance(block.get(key), expected) or isinstance(block.get(key), bool):
+        return f'Invalid block format ({key})'
+
+    return None
+
+  @staticmethod
+  def check_transaction_format(transaction):
+    """Checks that a transaction of a block has the required keys with values of the right types, and a positive amount.
+
+    Args:
+      transaction (dict): The transaction.
+
+    Returns:
+      str: The reason the transaction is malformed, or None if it is well formed.
+    """
+
+    if not isinstance(transaction, dict):
+      return 'Invalid transaction format'
+
+    for key in ('uuid', 'sender_address', 'receiver_address', 'timestamp', 'type_of_transaction', 'signature', 'hash'):
+      if not isinstance(transaction.get(key), str):
+        return f'Invalid transaction format ({key})'
+    if not Amount.is_valid(transaction.get('nonce')):
+      return 'Invalid transaction format (nonce)'
+
+    if transaction['type_of_transaction'] == 'message':
+      if not isinstance(transaction.get('value'), str):
+        return 'Invalid message'
+    elif transaction['type_of_transaction'] in ('coins', 'stake'):
+      if not Amount.is_valid(transaction.get('value')) or transaction['value'] <= 0:
+        return 'Invalid amount'
+    else:
+      return 'Invalid transaction type'
+
+    return None
 
   def validate_block(self, block):
     """Validates a block.
 
     This method checks if the block is valid based on the following criteria:
       - The block has all the required keys.
-      - The previous hash of the block is valid.
+      - The previous block is in the block tree.
       - The validator of the block is valid.
+      - The transactions are well formed and their senders are nodes of the network.
+      - The hash of the block is valid.
+      - The transactions of the block are valid (see validate_block_transactions).
 
     Args:
       block (dict): The block.
@@ -768,34 +1903,220 @@ class Node:
       self.log(termcolor.red(f'Validate block {block["index"]}: Invalid block format'), not self.debug)
       return False
 
-    # Check if the previous hash of the block is valid
-    if block['previous_hash'] != self.blockchain.get_last_block().hash:
+    # Check if the previous block is known
+    parent = self.block_tree.get(block['previous_hash'])
+    if parent is None:
       self.log(termcolor.red(f'Validate block {block["index"]}: Invalid previous hash'), not self.debug)
       return False
 
-    # Check if the validator of the block is valid
-    expected_validator = self.get_validator_from_pool(self.past_pools.get(), block['previous_hash'])
+    # Check if the validator of the block is valid, using the schedule if the block extends the chain and the stakes after the previous block otherwise
+    index = parent['height'] + 1
+    if block['previous_hash'] == self.blockchain.get_last_block().hash:
+      expected_validator = self.get_validator(index)
+    else:
+      expected_validator = self.get_validator_from_pool(self.get_validator_pool(parent['state']), block['previous_hash'])
     if block['validator'] != expected_validator:
       self.log(termcolor.red(f'Validate block {block["index"]}: Invalid validator'), not self.debug)
       return False
 
-    # Check if the block has the expected hash
-    expected_hash = hashlib.sha256(json.dumps({
-      'index': self.blockchain.block_index,
+    # Check the format and the sender before anything parses the transaction (the block is not signed)
+    senders = {node['key'] for node in self.blockchain.nodes}
+    for transaction in block['transactions']:
+      error = self.check_transaction_format(transaction)
+      if error is None and transaction['sender_address'] not in senders:
+        error = 'Invalid sender'
+      if error is not None:
+        self.log(termcolor.red(f'Validate block {block["index"]}: {error} for a transaction'), not self.debug)
+        return False
+
+    # Check if the block has the expected hash, the transaction hashes are checked with the transactions
+    expected_hash = Block.hash_header({
+      'index': index,
       'timestamp': block['timestamp'],
       'validator': expected_validator,
-      'transactions': [dict(transaction) for transaction in block['transactions']],
-      'previous_hash': self.blockchain.get_last_block().hash,
-    }).encode()).hexdigest()
+      'transactions': [transaction['hash'] for transaction in block['transactions']],
+      'previous_hash': block['previous_hash'],
+    })
     if block['hash'] != expected_hash:
       self.log(termcolor.red(f'Validate block {block["index"]}: Invalid hash'), not self.debug)
       return False
 
+    # Check if the transactions of the block are valid
+    if not self.validate_block_transactions(block, parent):
+      return False
+
     self.log(termcolor.green(f'Block {block["index"]} validated successfully'), not self.debug)
     return True
 
+  def validate_block_transactions(self, block, parent):
+    """Validates the transactions of a block against the state after the previous block.
+
+    This method checks, for every transaction of the block, that:
+      - The hash of the transaction is valid.
+      - The signature of the transaction is valid. Transactions whose signature
+        was already verified on arrival are skipped, the rest are verified in parallel.
+      - The nonces of each sender are increasing and newer than the last one before the block.
+      - No sender spends its staked coins, or stakes more than its balance, starting from the state after the previous block.
+
+    Args:
+      block (dict): The block.
+      parent (dict): The block tree entry of the previous block.
+
+    Returns:
+      bool: True if the transactions are valid, False otherwise.
+    """
+
+    transactions = block['transactions']
+
+    # Check the hashes and collect the transactions with unverified signatures
+    unverified = []
+    for transaction in transactions:
+      expected_hash = self.hash_transaction(transaction)
+      if transaction['hash'] != expected_hash:
+        self.log(termcolor.red(f'Validate block {block["index"]}: Invalid hash for transaction {termcolor.underline(transaction["uuid"])}'), not self.debug)
+        return False
+      if transaction['hash'] not in self.verified_transactions:
+        unverified.append(transaction)
+
+    if unverified:
+      if self.verifier is None:
+        self.verifier = ThreadPoolExecutor(max_workers=os.cpu_count())
+      if not all(self.verifier.map(self.verify_signature, unverified)):
+        self.log(termcolor.red(f'Validate block {block["index"]}: Invalid transaction signature'), not self.debug)
+        return False
+      for transaction in unverified:
+        self.mark_verified(transaction['hash'])
+
+    # Check the nonces of each sender
+    nonces = {}
+    for transaction in transactions:
+      sender_key = transaction['sender_address']
+      last_nonce = nonces.get(sender_key, parent['nonces'].get(sender_key, -1))
+      if transaction['nonce'] <= last_nonce:
+        self.log(termcolor.red(f'Validate block {block["index"]}: Invalid nonce for transaction {termcolor.underline(transaction["uuid"])}: {transaction["nonce"]} <= {last_nonce}'), not self.debug)
+        return False
+      nonces[sender_key] = transaction['nonce']
+
+    # Check the balance effects against the state after the previous block, the staked coins cannot be spent
+    state = self.copy_state(parent['state'])
+    balances = {key: node['balance'] for key, node in state.items()}
+    stakes = {key: node['stake'] for key, node in state.items()}
+
+    for transaction in transactions:
+      error = self.apply_transaction_effects(balances, stakes, transaction)
+      if error is not None:
+        self.log(termcolor.red(f'Validate block {block["index"]}: {error} for transaction {termcolor.underline(transaction["uuid"])}'), not self.debug)
+        return False
+
+    return True
+
+  def apply_transaction_effects(self, balances, stakes, transaction):
+    """Applies the balance and stake effects of a transaction, leaving the balances unchanged if they cannot be covered.
+
+    Args:
+      balances (dict): The balances, keyed by node address, updated in place.
+      stakes (dict): The stakes, keyed by node address, updated in place.
+      transaction (dict): The transaction.
+
+    Returns:
+      str: The reason the transaction is invalid, or None if its effects were applied.
+    """
+
+    sender_key = transaction['sender_address']
+    if sender_key not in balances:
+      return 'Invalid sender'
+
+    saved = {sender_key: balances[sender_key]}
+    if transaction['type_of_transaction'] == 'coins':
+      if transaction['receiver_address'] not in balances:
+        return 'Invalid receiver'
+      saved[transaction['receiver_address']] = balances[transaction['receiver_address']]
+      balances[sender_key] -= transaction['value'] + Amount.fee(transaction['value'], self.blockchain.fee_rate)
+      balances[transaction['receiver_address']] += transaction['value']
+    elif transaction['type_of_transaction'] == 'message':
+      balances[sender_key] -= Amount.message_cost(transaction['value'])
+    elif transaction['type_of_transaction'] == 'stake':
+      if transaction['value'] > balances[sender_key]:
+        return 'Insufficient balance to stake'
+      stakes[sender_key] = transaction['value']
+      return None
+
+    if balances[sender_key] < stakes[sender_key]:
+      balances.update(saved)
+      return 'Insufficient balance'
+
+    return None
+
+  def select_transactions(self, transactions, parent):
+    """Selects the transactions of a new block that the state after the previous block can cover.
+
+    The live state of the node may have accepted a transaction in a different
+    order (e.g. a payment before the transfer that funds it). Such a
+    transaction is left out, with the later transactions of its sender, and
+    stays pending for a later block instead of making the whole block invalid.
+
+    Args:
+      transactions (list): The transactions, in block order.
+      parent (dict): The block tree entry of the previous block.
+
+    Returns:
+      list: The transactions to include.
+    """
+
+    accept = self.transaction_selector(parent)
+    return [transaction for transaction in transactions if accept(transaction)]
+
+  def transaction_selector(self, parent):
+    """Creates the check of select_transactions for one transaction at a time, e.g. for the block assembler.
+
+    Args:
+      parent (dict): The block tree entry of the previous block.
+
+    Returns:
+      function: Checks if a transaction is included, given the transactions it accepted before.
+    """
+
+    state = self.copy_state(parent['state'])
+    balances = {key: node['balance'] for key, node in state.items()}
+    stakes = {key: node['stake'] for key, node in state.items()}
+    skipped = set()
+
+    def accept(transaction):
+      sender_key = transaction.sender_address
+      if transaction.nonce <= parent['nonces'].get(sender_key, -1):
+        return False
+      if sender_key in skipped or self.apply_transaction_effects(balances, stakes, dict(transaction)) is not None:
+        skipped.add(sender_key)
+        return False
+      return True
+
+    return accept
+
+  def copy_state(self, state):
+    """Copies a state snapshot of the block tree, adding the nodes that joined after it was taken with their declared stake.
+
+    Args:
+      state (dict): The state, keyed by node address.
+
+    Returns:
+      dict: The copy.
+    """
+
+    state = {key: dict(node) for key, node in state.items()}
+    for node in self.blockchain.nodes:
+      if node['key'] not in state:
+        state[node['key']] = {**node, 'balance': 0, 'stake': node.get('initial_stake', 0)}
+
+    return state
+
   def register_block(self, block):
-    """Registers a block in the blockchain and updates info accordingly.
+    """Adds a block to the block tree, and to the chain if it is on the best branch.
+
+    The state after the block is computed from the state after the previous
+    block. If the block extends the chain it is registered directly; if it
+    makes a competing branch the best one according to the fork-choice rule,
+    the chain is reorganized (see reorganize); otherwise it is only kept in
+    the tree. Finally, the branches that fell behind the finality depth are pruned.
 
     Args:
       block (dict): The block.
@@ -803,18 +2124,205 @@ class Node:
 
     self.log(termcolor.magenta(f'Registering block {block["index"]}'), not self.debug)
 
+    new_block = Block(**block)
+    parent = self.block_tree.get(block['previous_hash'])
+
     with self.blockchain_lock:
-      self.blockchain.add_block(Block(**block))
-      self.nodes, credit = self.blockchain.get_state()
+      state, nonces = self.copy_state(parent['state']), dict(parent['nonces'])
+      self.blockchain.apply_block(state, new_block)
+      self.blockchain.update_nonces(new_block, nonces)
+      self.block_tree.add(new_block, state, nonces)
+
+      tip, best = self.blockchain.get_last_block().hash, self.block_tree.best_tip()
 
-      validator = next((node for node in self.blockchain.nodes if node['id'] == block['validator']), None)
-      validator['balance'] += credit
-      self.log(termcolor.green(f'Node {block["validator"]} credited with {credit} BCC for mining block {block["index"]}'), not self.debug)
+    if best == tip:
+      self.log(termcolor.yellow(f'Block {block["index"]} is kept on a competing branch'), not self.debug)
+      return
 
-    self.past_blocks.get()
+    if block['previous_hash'] != tip:
+      self.reorganize(tip, best)
+      return
+
+    with self.blockchain_lock:
+      self.blockchain.add_block(new_block)
+    self.registered_at = self.clock()
+    credit = self.credit_validator(new_block)
+    self.serve_light_clients([new_block])
+    self.log(termcolor.green(f'Node {block["validator"]} credited with {Amount.format(credit)} BCC for mining block {block["index"]}'), not self.debug)
+
+    # Drop the local view of the block, keeping the transactions that the validator did not include
+    committed = {transaction['hash'] for transaction in block['transactions']}
+    with self.mining_lock:
+      self.mined_blocks.discard(block['index'])
+      leftover = self.sealed_blocks.pop(block['index'], [])
+      if self.seal_index < self.blockchain.block_index:
+        leftover += self.current_block
+        self.current_block = []
+        self.seal_index = self.blockchain.block_index
+      self.current_block[:0] = [
+        transaction for transaction in leftover
+        if transaction.hash not in committed and transaction.nonce > self.blockchain.nonces.get(transaction.sender_address, -1)
+      ]
+
+    self.restore_state()
+    self.query_cache.invalidate()
+    self.transaction_queue.put(None)
+
+    self.schedule_validator()
+    self.mine_pending()
+    self.prune_blocks()
+
+    self.history.confirm(block['index'], (transaction['uuid'] for transaction in block['transactions']))
+
+    for transaction in block['transactions']:
+      self.trace(transaction['uuid'], 'register_block')
 
     self.log(termcolor.green(f'Block {block["index"]} registered successfully'), not self.debug)
 
+  def credit_validator(self, block, sign=1):
+    """Records the fees of a block (or, on rollback, their removal) in the history, if the node is its validator.
+
+    The balance of the validator itself follows from the state after the block,
+    which restore_state copies to the live state.
+
+    Args:
+      block (Block): The block.
+      sign (int, optional): 1 to credit the fees, -1 to take them back. Defaults to 1.
+
+    Returns:
+      int: The fees of the block.
+    """
+
+    fees = self.blockchain.get_fees(block.transactions)
+
+    if block.validator == self.id:
+      self.history.add('credit', sign * fees, self.now().isoformat(), receiver=self.id, block=block.index)
+
+    return fees
+
+  def restore_state(self):
+    """Rebuilds the live balances, stakes and nonces of the nodes from the block tree and the pending transactions.
+
+    The live state in Blockchain.nodes is the state after the last block of the
+    chain, taken from the block tree, with the pending transactions (the sealed
+    blocks and the current block) applied on top. Rebuilding it after every
+    registered block and reorganization keeps it on the branch of the chain,
+    instead of patching it block by block. Nonces only move forward, so the
+    nonce of a transaction that was validated but not registered stays used.
+    The wallet moves by the change of the node's own balance, because it also
+    holds the cost of the transactions the node sent and did not register yet.
+    """
+
+    with self.blockchain_lock:
+      tip = self.block_tree.get(self.blockchain.get_last_block().hash)
+      with self.mining_lock:
+        pending = [transaction for index in sorted(self.sealed_blocks) for transaction in self.sealed_blocks[index]] + self.current_block
+
+      pending = [transaction for transaction in pending if transaction.nonce > tip['nonces'].get(transaction.sender_address, -1)]
+      state, nonces = self.copy_state(tip['state']), dict(tip['nonces'])
+      self.blockchain.apply_transactions(state, pending)
+      for transaction in pending:
+        nonces[transaction.sender_address] = max(nonces.get(transaction.sender_address, -1), transaction.nonce)
+
+      delta = 0
+      for node in self.blockchain.nodes:
+        if node['id'] == self.id:
+          delta = state[node['key']]['balance'] - node['balance']
+        node['balance'] = state[node['key']]['balance']
+        node['stake'] = state[node['key']]['stake']
+        node['nonce'] = max(node['nonce'], nonces.get(node['key'], -1) + 1)
+
+    # The nodes that staked after joining are validators too (see add_node)
+    for node in self.blockchain.nodes:
+      if node['stake'] > 0 and (node['address'], node['port']) not in self.transaction_queue.exempt:
+        self.transaction_queue.exempt_sender((node['address'], node['port']))
+
+    if delta:
+      with self.balance_lock:
+        self.wallet.balance += delta
+
+  def reorganize(self, tip, best):
+    """Switches the chain to another branch of the block tree.
+
+    The blocks after the common ancestor are rolled back, restoring the nonces
+    kept in the tree for the ancestor, and the blocks of the new branch are
+    applied. The transactions of the rolled back blocks that are not in the new
+    branch are pending again, and the blocks that were sealed locally are
+    merged back into the current block. The live state is then rebuilt from the
+    state of the new tip in the tree (see restore_state).
+
+    Args:
+      tip (str): The hash of the last block of the chain.
+      best (str): The hash of the last block of the new branch.
+    """
+
+    ancestor, rolled_back, applied = self.block_tree.path(tip, best)
+    ancestor = self.block_tree.get(ancestor)
+
+    with self.blockchain_lock:
+      self.blockchain.rollback(ancestor['height'], ancestor['nonces'])
+      for block in applied:
+        self.blockchain.add_block(block)
+    self.registered_at = self.clock()
+
+    for block in rolled_back:
+      self.credit_validator(block, -1)
+    for block in applied:
+      self.credit_validator(block)
+    self.serve_light_clients(applied)
+
+    self.log(termcolor.yellow(f'Reorganized the chain after block {ancestor["height"]}: rolled back {len(rolled_back)} blocks, applied {len(applied)} blocks'))
+
+    # Collect every transaction that is not committed in the new branch
+    committed = {transaction.hash for block in applied for transaction in block.transactions}
+    with self.mining_lock:
+      pending = [transaction for block in reversed(rolled_back) for transaction in block.transactions]
+      for index in sorted(self.sealed_blocks):
+        pending += self.sealed_blocks[index]
+      pending += self.current_block
+
+      seen = set()
+      self.current_block = []
+      for transaction in pending:
+        if transaction.hash in committed or transaction.hash in seen or transaction.nonce <= self.blockchain.nonces.get(transaction.sender_address, -1):
+          continue
+        seen.add(transaction.hash)
+        self.current_block.append(transaction)
+
+      self.sealed_blocks = {}
+      self.mined_blocks = set()
+      self.seal_index = self.blockchain.block_index
+      full = len(self.current_block) >= self.blockchain.get_block_capacity()
+
+    self.restore_state()
+    self.query_cache.invalidate()
+    self.transaction_queue.put(None)
+
+    for block in rolled_back:
+      self.history.confirm(None, (transaction.uuid for transaction in block.transactions))
+    for block in applied:
+      self.history.confirm(block.index, (transaction.uuid for transaction in block.transactions))
+
+    self.schedule_validator()
+    if full:
+      self.seal_block()
+    self.prune_blocks()
+
+  def prune_blocks(self):
+    """Prunes the branches of the block tree that fell behind the finality depth, and the orphans below the last final block."""
+
+    dropped = self.block_tree.prune(self.blockchain.get_last_block().hash)
+    if dropped:
+      self.log(termcolor.blue(f'Pruned {dropped} blocks of stale branches'), not self.debug)
+
+    height = self.block_tree.get(self.block_tree.root)['height']
+    for block_hash in [block_hash for block_hash, block in self.orphan_blocks.items() if block['index'] <= height]:
+      del self.orphan_blocks[block_hash]
+
+    now = self.clock()
+    for block_hash in [block_hash for block_hash, requested in self.requested_blocks.items() if now - requested > 10.0]:
+      del self.requested_blocks[block_hash]
+
   def validate_chain(self, blockchain):
     """Validates the blockchain.
 
@@ -841,24 +2349,186 @@ class Node:
         self.log(termcolor.red(f'Block {current_block.index} is invalid: Invalid previous hash'))
         return False
 
-      # Check if the block has the expected hash
-      expected_hash = hashlib.sha256(json.dumps({
-        'index': current_block.index,
-        'timestamp': current_block.timestamp,
-        'validator': current_block.validator,
-        'transactions': [dict(transaction) for transaction in current_block.transactions],
-        'previous_hash': current_block.previous_hash,
-      }).encode()).hexdigest()
-      if current_block.hash != expected_hash:
+      # Check if the block has the expected hash, and if its transactions match their hashes
+      if current_block.hash != current_block.calculate_hash():
         self.log(termcolor.red(f'Block {current_block.index} is invalid: Invalid hash'))
         return False
+      if any(transaction.hash != transaction.calculate_hash() for transaction in current_block.transactions):
+        self.log(termcolor.red(f'Block {current_block.index} is invalid: Invalid transaction hash'))
+        return False
+
+    # Check that no transaction appears twice (the uuid index keeps one entry per uuid)
+    if len(blockchain.transaction_uuids) != sum(len(block.transactions) for block in blockchain.chain):
+      self.log(termcolor.red('Blockchain is invalid: Duplicate transaction'))
+      return False
 
     self.log(termcolor.green('Blockchain is valid'))
     return True
 
+  def serve_light_clients(self, blocks):
+    """Sends the header of registered blocks to the light clients served by the node, or the
+    full block if it has a transaction sent or received by the light client.
+
+    Args:
+      blocks (list): The blocks, in chain order.
+    """
+
+    for node in self.blockchain.nodes:
+      if node.get('light') and node.get('peer') == self.id:
+        for block in blocks:
+          self.send_header(block, node)
+
+  def send_header(self, block, node):
+    """Sends the header of a block to a light client.
+
+    The full block is attached only when one of its transactions involves the
+    light client, so that it can update its balance without trusting the sender.
+
+    Args:
+      block (Block): The block whose header is sent.
+      node (dict): The light client, as stored in the list of nodes of the blockchain.
+    """
+
+    relevant = any(node['key'] in (transaction.sender_address, transaction.receiver_address) for transaction in block.transactions)
+    message = {
+      'message_type': 'header',
+      'header': HeaderChain.header(block),
+      'block': dict(block) if relevant else None,
+    }
+
+    self.send(json.dumps(message), node['address'], node['port'])
+
+  def send_headers(self, request, address):
+    """Sends the headers (or blocks) after a given block to a light client that missed them.
+
+    Args:
+      request (dict): The request, with the ID of the light client and the index of its last known header.
+      address (tuple): The (address, port) of the light client.
+    """
+
+    node = next((node for node in self.blockchain.nodes if node['id'] == request['id'] and node.get('light')), None)
+    if node is None:
+      return
+
+    with self.blockchain_lock:
+      blocks = self.blockchain.chain[request['index'] + 1:]
+
+    self.log(termcolor.magenta(f'Sending {len(blocks)} headers to light client {node["id"]}'), not self.debug)
+    for block in blocks:
+      self.send_header(block, node)
+
+  def activate_light(self, blockchain, headers, balance):
+    """Starts following the chain as a light client, with the headers sent on activation.
+
+    The blockchain only holds the nodes of the network (and the parameters of
+    the chain), to address and sign transactions; its chain is empty.
+
+    Args:
+      blockchain (Blockchain): The blockchain, without blocks.
+      headers (list): The headers of the chain.
+      balance (int): The balance of the node after the last header.
+    """
+
+    self.blockchain = blockchain
+    self.headers = HeaderChain(self.wallet.get_address(), blockchain.fee_rate, headers, balance)
+    self.node_counter = len(blockchain.nodes)
+
+    with self.balance_lock:
+      self.wallet.balance = balance
+
+    self.log(termcolor.green(f'Following the chain as a light client from header {self.headers.tip()["index"]}'))
+
+  def receive_header(self, message, address=None):
+    """Adds a header, or a block with transactions of the node, sent by the full peer of a light client.
+
+    The balance of the node is the balance after the last header, minus the
+    cost of its transactions that are not in a block yet. If the header does
+    not follow a known header, the headers after the last final one are
+    requested again from the full peer. A header ahead of the known ones is
+    kept until its parent arrives, so headers that arrive out of order (e.g.
+    the burst of headers sent after such a request) are not requested again.
+    A header that lists a pending transaction of the node without its block is
+    dropped, since the full peer withheld the transaction, and so is a header
+    that does not come from the full peer.
+
+    Args:
+      message (dict): The message, with the header and the block (or None).
+      address (tuple, optional): The (address, port) of the node that sent the message, None for a kept header.
+    """
+
+    index = message['header']['index']
+    own = next((node for node in self.blockchain.nodes if node['id'] == self.id), None)
+    peer = next((node for node in self.blockchain.nodes if own is not None and node['id'] == own['peer']), None)
+    if peer is None or (address is not None and tuple(address) != (peer['address'], peer['port'])):
+      self.log(termcolor.yellow(f'Header {index} does not come from the full peer, dropping'), not self.debug)
+      return
+
+    with self.balance_lock:
+      withheld = message['block'] is None and any(transaction_hash in self.light_pending for transaction_hash in message['header']['transactions'])
+    if withheld:
+      self.log(termcolor.red(f'Header {index} from the full peer has a transaction of the node but no block, dropping'))
+      return
+
+    status, rolled_back, transactions = self.headers.add(message['header'], message['block'])
+
+    if status == 'invalid':
+      self.log(termcolor.red(f'Block {index} from the full peer does not match its hash, dropping'))
+      return
+
+    if status == 'gap':
+      if index > len(self.headers.headers) and len(self.light_orphans) < self.light_orphans_capacity:
+        self.light_orphans[index] = message
+
+      # Ask again for the headers after the last final one, at most once per second
+      if self.clock() - self.requested_headers > 1.0:
+        self.requested_headers = self.clock()
+        request = {'message_type': 'get_headers', 'id': self.id, 'index': max(len(self.headers.headers) - 1 - self.finality_depth, 0)}
+        self.log(termcolor.yellow(f'Header {index} does not follow the known headers, requesting headers from node {peer["id"]}'), not self.debug)
+        self.send(json.dumps(request), peer['address'], peer['port'])
+      return
+
+    if status == 'known':
+      return
+
+    with self.balance_lock:
+      for _, transaction_hash, cost in rolled_back:
+        if cost:
+          self.light_pending[transaction_hash] = cost
+      for _, transaction_hash, _ in transactions:
+        self.light_pending.pop(transaction_hash, None)
+      self.wallet.balance = self.headers.get_balance() - sum(self.light_pending.values())
+
+    self.history.confirm(None, (transaction_uuid for transaction_uuid, _, _ in rolled_back))
+
+    if transactions:
+      ids = {node['key']: node['id'] for node in self.blockchain.nodes}
+      uuids = {transaction_uuid for transaction_uuid, _, _ in transactions}
+      for transaction in message['block']['transactions']:
+        if transaction['uuid'] in uuids and transaction['uuid'] not in self.history.by_uuid:
+          self.history.add(
+            transaction['type_of_transaction'],
+            transaction['value'],
+            transaction['timestamp'],
+            ids.get(transaction['sender_address']),
+            ids.get(transaction['receiver_address']),
+            transaction['uuid']
+          )
+      self.history.confirm(index, uuids)
+
+      self.log(termcolor.green(f'Block {index} verified with {len(transactions)} transactions of the node, balance {Amount.format(self.headers.get_balance())} BCC'), not self.debug)
+    else:
+      self.log(termcolor.green(f'Header {index} added'), not self.debug)
+
+    # Add the kept header that follows this one, and drop the kept headers it replaced
+    for stale in [stale for stale in self.light_orphans if stale <= index]:
+      del self.light_orphans[stale]
+    following = self.light_orphans.pop(index + 1, None)
+    if following is not None:
+      self.receive_header(following)
+
 class Bootstrap(Node):
-  def __init__(self, bootstrap_address='0.0.0.0', bootstrap_port=5000, verbose=True, debug=False, blockchain=None, stake=0.0):
-    super().__init__(bootstrap_address, bootstrap_port, verbose, debug, stake)
+  def __init__(self, bootstrap_address='0.0.0.0', bootstrap_port=5000, verbose=True, debug=False, blockchain=None, stake=0, trace_rate=0.0, gossip_fanout=0, multicast_group=None, shared_memory=False, receivers=1, receive_buffer=0, api_port=None, replay_window=65536, replay_capacity=262144, replay_false_positive_rate=0.001, wallet=None):
+    super().__init__(bootstrap_address, bootstrap_port, verbose, debug, stake, trace_rate, gossip_fanout, multicast_group, shared_memory, receivers, receive_buffer, api_port, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate, wallet=wallet)
 
     self.blockchain = blockchain
     self.id = 0
@@ -875,22 +2545,22 @@ class Bootstrap(Node):
     """
 
     transaction = Transaction(
-      str(uuid.uuid4()),
+      self.create_uuid(),
       '0',
       self.wallet.get_address(),
-      datetime.now().isoformat(),
+      self.now().isoformat(),
       'coins',
-      1000 * nodes_count,
+      Amount.from_coins(1000) * nodes_count,
       0,
       None
     )
 
-    genesis_block = Block(0, 0, [transaction], '1')
+    genesis_block = Block(0, 0, [transaction], '1', self.now().isoformat())
 
     self.blockchain.add_block(genesis_block)
 
     self.wallet.balance += transaction.value
-    self.history += f'Credited {transaction.value} BCC for genesis block\n'
+    self.history.add('credit', transaction.value, transaction.timestamp, receiver=self.id, block=0)
 
     self.log(termcolor.blue('Genesis block created'))
 
@@ -904,15 +2574,13 @@ class Bootstrap(Node):
       key (str): The public key of the node.
     """
 
-    message = json.dumps({
+    message = {
       'message_type': 'node',
       'node': new_node
-    })
+    }
 
     self.log(termcolor.magenta(f'Broadcasting new node: {new_node["id"]}'), not self.debug)
-    for node in self.blockchain.nodes:
-      if node['id'] != new_node['id'] and node['id'] != 0:
-        self.send(message, node['address'], node['port'])
+    self.broadcaster.broadcast(message, exclude=(new_node['id'], self.id))
 
   def activate_node(self, node, color):
     """Activates a node in the blockchain network.
@@ -921,13 +2589,25 @@ class Bootstrap(Node):
       node (dict): The node.
     """
 
-    message = json.dumps({
+    message = {
       'message_type': 'activate',
       'id': node['id'],
       'color': color,
       'blockchain': dict(self.blockchain),
       'current_block': [dict(transaction) for transaction in self.current_block],
-    })
+    }
+
+    # A light client gets the headers instead of the blocks, and no pending transactions
+    if node.get('light'):
+      with self.blockchain_lock:
+        message['blockchain']['chain'] = []
+        message['headers'] = [HeaderChain.header(block) for block in self.blockchain.chain]
+        message['balance'] = self.block_tree.get(self.blockchain.get_last_block().hash)['state'].get(node['key'], {}).get('balance', 0)
+      message['current_block'] = []
+
+    # Tell the node where each multicast sender is, so it can recover what it misses before joining
+    if self.multicast_group is not None:
+      message['multicast_sequences'] = self.broadcaster.get_sequences()
 
     self.log(termcolor.magenta(f'Activating node: {node["id"]}'), not self.debug)
-    self.send(message, node['address'], node['port'])
+    self.send(json.dumps(message), node['address'], node['port'])
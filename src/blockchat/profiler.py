@@ -0,0 +1,178 @@
+"""A module for the Profiler class.
+
+This module contains the Profiler class, which is used to sample the stacks of
+all the threads of a running node for a fixed time window and write them in the
+collapsed-stack format used by flamegraph tools.
+"""
+
+import os
+import sys
+import time
+import signal
+
+from threading import Thread, Lock, Event, get_ident, enumerate as enumerate_threads, current_thread, main_thread
+
+class Profiler:
+  """A class to represent a low-overhead sampling profiler.
+
+  The profiler runs in its own daemon thread and periodically reads the current
+  frame of every other thread with sys._current_frames. Nothing is installed in
+  the profiled threads (no tracing or profiling hooks), so the overhead is
+  bounded by the sampling interval and the profiler can be attached to a running
+  node safely. Only one profiling window can be active at a time.
+
+  Attributes:
+    interval (float): The time between two samples in seconds.
+    max_duration (float): The maximum length of a profiling window in seconds.
+    running (bool): A boolean indicating whether a profiling window is active.
+
+  Methods:
+    start: Start a profiling window in the background.
+    run: Sample all threads for a time window and write the collapsed stacks.
+    sample: Take one sample of the stacks of all threads.
+    write: Write the collapsed stacks to a file.
+    install_signal_handler: Start a profiling window when the process receives SIGUSR1.
+  """
+
+  def __init__(self, interval=0.005, max_duration=300.0):
+    """Initializes a new instance of Profiler.
+
+    Args:
+      interval (float, optional): The time between two samples in seconds. Defaults to 0.005.
+      max_duration (float, optional): The maximum length of a profiling window in seconds. Defaults to 300.0.
+    """
+
+    self.interval = interval
+    self.max_duration = max_duration
+    self.running = False
+
+    self.lock = Lock()
+
+  def start(self, duration, file_path, callback=None):
+    """Starts a profiling window in a background daemon thread.
+
+    Args:
+      duration (float): The length of the profiling window in seconds.
+      file_path (str): The path of the collapsed-stack output file.
+      callback (function, optional): Called with the file path and the number of samples when done.
+
+    Returns:
+      bool: True if the profiler was started, False if a window is already active.
+    """
+
+    with self.lock:
+      if self.running:
+        return False
+      self.running = True
+
+    thread = Thread(target=self.run, args=(min(duration, self.max_duration), file_path, callback))
+    thread.daemon = True
+    thread.start()
+
+    return True
+
+  def run(self, duration, file_path, callback=None):
+    """Samples all threads for a time window and writes the collapsed stacks.
+
+    Args:
+      duration (float): The length of the profiling window in seconds.
+      file_path (str): The path of the collapsed-stack output file.
+      callback (function, optional): Called with the file path and the number of samples when done.
+    """
+
+    stacks = {}
+    samples = 0
+
+    try:
+      deadline = time.monotonic() + duration
+      while time.monotonic() < deadline:
+        self.sample(stacks)
+        samples += 1
+        time.sleep(self.interval)
+
+      self.write(stacks, file_path)
+    finally:
+      with self.lock:
+        self.running = False
+
+    if callback is not None:
+      callback(file_path, samples)
+
+  @staticmethod
+  def sample(stacks):
+    """Takes one sample of the stacks of all threads, except the profiler thread.
+
+    Args:
+      stacks (dict): A dictionary mapping collapsed stacks to their sample count, updated in place.
+    """
+
+    names = {thread.ident: thread.name for thread in enumerate_threads()}
+    own_ident = get_ident()
+
+    for ident, frame in sys._current_frames().items():
+      if ident == own_ident:
+        continue
+
+      frames = []
+      while frame is not None:
+        code = frame.f_code
+        frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+        frame = frame.f_back
+      frames.append(names.get(ident, f'thread-{ident}'))
+
+      stack = ';'.join(reversed(frames))
+      stacks[stack] = stacks.get(stack, 0) + 1
+
+  @staticmethod
+  def write(stacks, file_path):
+    """Writes the collapsed stacks to a file, one 'frame;frame;frame count' line per stack.
+
+    Args:
+      stacks (dict): A dictionary mapping collapsed stacks to their sample count.
+      file_path (str): The path of the file.
+    """
+
+    with open(file_path, 'w') as f:
+      for stack, count in sorted(stacks.items()):
+        f.write(f'{stack} {count}\n')
+
+  def install_signal_handler(self, duration, file_prefix, callback=None):
+    """Starts a profiling window whenever the process receives SIGUSR1.
+
+    Signal handlers can only be installed from the main thread and SIGUSR1 is
+    not available on every platform, in which case nothing is installed. The
+    handler runs on the main thread between two bytecodes, possibly while that
+    thread holds the profiler lock, so it only sets an event; a watcher thread,
+    started here, waits for the event and starts the window. Signals received
+    while a window is active are ignored.
+
+    Args:
+      duration (float): The length of each profiling window in seconds.
+      file_prefix (str): The prefix of the output files, suffixed with the process id and a timestamp.
+      callback (function, optional): Called with the file path and the number of samples when done.
+
+    Returns:
+      bool: True if the handler was installed, False otherwise.
+    """
+
+    if not hasattr(signal, 'SIGUSR1') or current_thread() is not main_thread():
+      return False
+
+    requested = Event()
+
+    def handler(signum, frame):
+      requested.set()
+
+    def watch():
+      while True:
+        requested.wait()
+        requested.clear()
+        file_path = f'{file_prefix}-{os.getpid()}-{int(time.time())}.folded'
+        self.start(duration, file_path, callback)
+
+    thread = Thread(target=watch)
+    thread.daemon = True
+    thread.start()
+
+    signal.signal(signal.SIGUSR1, handler)
+    return True
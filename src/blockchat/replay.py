@@ -0,0 +1,174 @@
+"""A module for the BloomFilter class and the ReplayFilter class.
+
+This module contains the BloomFilter class, a fixed-size probabilistic set, and
+the ReplayFilter class, which is used by a node to reject transactions it has
+already received before validating them again.
+"""
+
+import math
+import struct
+import hashlib
+
+from collections import OrderedDict
+from threading import Lock
+
+class BloomFilter:
+  """A class to represent a Bloom filter of strings.
+
+  The number of bits and of hash functions are derived from the capacity and
+  the false-positive rate; the bit positions of a key come from the two halves
+  of its BLAKE2b digest (double hashing).
+
+  Attributes:
+    capacity (int): The number of keys the filter is sized for.
+    size (int): The number of bits.
+    hashes (int): The number of bit positions per key.
+    count (int): The number of keys added.
+
+  Methods:
+    add: Add a key.
+  """
+
+  def __init__(self, capacity, false_positive_rate):
+    """Initializes a new instance of BloomFilter.
+
+    Args:
+      capacity (int): The number of keys the filter is sized for.
+      false_positive_rate (float): The false-positive rate at capacity.
+    """
+
+    self.capacity = capacity
+    self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+    self.hashes = max(1, round(self.size / capacity * math.log(2)))
+    self.bits = bytearray((self.size + 7) // 8)
+    self.count = 0
+
+  def positions(self, key):
+    first, second = struct.unpack('<QQ', hashlib.blake2b(key.encode(), digest_size=16).digest())
+    return [(first + i * second) % self.size for i in range(self.hashes)]
+
+  def add(self, key):
+    """Adds a key.
+
+    Args:
+      key (str): The key.
+    """
+
+    for position in self.positions(key):
+      self.bits[position >> 3] |= 1 << (position & 7)
+    self.count += 1
+
+  def __contains__(self, key):
+    return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+class ReplayFilter:
+  """A class to represent the filter of transaction uuids and hashes a node has already seen.
+
+  The keys of the most recent transactions are kept exactly in a window;
+  keys that leave the window move to a Bloom filter. When the Bloom filter
+  reaches its capacity it becomes the previous generation and a new one is
+  started, so the older history is forgotten two generations at a time and the
+  memory stays bounded. A key in the window is a duplicate. A key that is only
+  in a Bloom filter is confirmed with a callback (e.g. a lookup in the chain
+  index), so a false positive never rejects a new transaction.
+
+  Only valid transactions are added, so that a forged transaction cannot
+  make the filter reject the valid transaction it copies the uuid of.
+
+  Attributes:
+    window (int): The number of keys kept exactly.
+    capacity (int): The number of keys per Bloom filter generation.
+    false_positive_rate (float): The false-positive rate of each generation.
+    duplicates (int): The number of rejected duplicates.
+    false_positives (int): The number of Bloom filter hits that were not confirmed.
+
+  Methods:
+    contains: Check if a transaction was already seen.
+    add: Add the keys of a valid transaction.
+    memory: Get the size of the Bloom filters in bytes.
+  """
+
+  def __init__(self, window=65536, capacity=262144, false_positive_rate=0.001, confirm=None):
+    """Initializes a new instance of ReplayFilter.
+
+    Args:
+      window (int, optional): The number of keys kept exactly. Defaults to 65536.
+      capacity (int, optional): The number of keys per Bloom filter generation. Defaults to 262144.
+      false_positive_rate (float, optional): The false-positive rate of each generation. Defaults to 0.001.
+      confirm (function, optional): A function that confirms a Bloom filter hit, by key. Defaults to trusting the hit.
+
+    Raises:
+      ValueError: If the window or the capacity is not positive, or the false-positive rate is not between 0 and 1.
+    """
+
+    if window < 1 or capacity < 1 or not 0 < false_positive_rate < 1:
+      raise ValueError('The window and the capacity must be positive and the false-positive rate between 0 and 1')
+
+    self.window = window
+    self.capacity = capacity
+    self.false_positive_rate = false_positive_rate
+    self.confirm = confirm
+
+    self.recent = OrderedDict()
+    self.current = BloomFilter(capacity, false_positive_rate)
+    self.previous = None
+
+    self.duplicates = 0
+    self.false_positives = 0
+
+    self.lock = Lock()
+
+  def is_seen(self, key):
+    if key in self.recent:
+      return True
+
+    if key in self.current or (self.previous is not None and key in self.previous):
+      if self.confirm is None or self.confirm(key):
+        return True
+      self.false_positives += 1
+
+    return False
+
+  def contains(self, *keys):
+    """Checks if any key of a transaction (e.g. its uuid and hash) was already seen, counting the duplicate.
+
+    Args:
+      *keys (str): The keys.
+
+    Returns:
+      bool: True if the transaction is a duplicate, False if its keys are new.
+    """
+
+    with self.lock:
+      if any(self.is_seen(key) for key in keys):
+        self.duplicates += 1
+        return True
+    return False
+
+  def add(self, *keys):
+    """Adds the keys of a transaction, once it is known to be valid.
+
+    Args:
+      *keys (str): The keys.
+    """
+
+    with self.lock:
+      for key in keys:
+        self.recent[key] = None
+
+      while len(self.recent) > self.window:
+        key, _ = self.recent.popitem(last=False)
+        self.current.add(key)
+
+        if self.current.count >= self.capacity:
+          self.previous = self.current
+          self.current = BloomFilter(self.capacity, self.false_positive_rate)
+
+  def memory(self):
+    """Gets the size of the Bloom filters in bytes.
+
+    Returns:
+      int: The size.
+    """
+
+    return len(self.current.bits) + (len(self.previous.bits) if self.previous is not None else 0)
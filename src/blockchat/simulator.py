@@ -0,0 +1,608 @@
+"""A module for the Simulator class.
+
+This module contains the Simulator class, which is used to run many nodes in
+one process on a virtual clock, with an in-memory network that models latency,
+bandwidth, loss and reordering (and IP multicast), and the main function of
+the simulation mode.
+"""
+
+import json
+import math
+import time
+import uuid
+import heapq
+import base64
+import random
+import hashlib
+import argparse
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from blockchat.node import Node, Bootstrap
+from blockchat.blockchain import Blockchain
+from blockchat.amount import Amount
+from blockchat.broadcast import Broadcaster
+from blockchat.gossip import Gossip
+from blockchat.multicast import Multicast
+from blockchat.light import HeaderChain
+from blockchat.wallet import Wallet
+
+from blockchat.util import termcolor
+
+# The product of the odd primes below 2000, to sieve prime candidates with one gcd
+small_primes = math.prod(n for n in range(3, 2000, 2) if all(n % d for d in range(3, math.isqrt(n) + 1, 2)))
+
+def generate_prime(generator, bits):
+  """Generates a random prime with the top two bits set, with the Miller-Rabin test.
+
+  Args:
+    generator (Random): The random generator.
+    bits (int): The number of bits of the prime.
+
+  Returns:
+    int: The prime.
+  """
+
+  while True:
+    candidate = generator.getrandbits(bits) | (3 << (bits - 2)) | 1
+    if math.gcd(candidate, small_primes) != 1 or candidate % 65537 == 1:
+      continue
+
+    d, s = candidate - 1, 0
+    while d % 2 == 0:
+      d, s = d // 2, s + 1
+
+    for _ in range(8):
+      x = pow(generator.randrange(2, candidate - 1), d, candidate)
+      if x in (1, candidate - 1):
+        continue
+      for _ in range(s - 1):
+        x = pow(x, 2, candidate)
+        if x == candidate - 1:
+          break
+      else:
+        break
+    else:
+      return candidate
+
+@lru_cache(maxsize=None)
+def generate_key(seed, key_size=2048):
+  """Generates an RSA private key derived from a seed, cached so that runs with the same seed only pay for it once.
+
+  Args:
+    seed (str): The seed of the key.
+    key_size (int, optional): The size of the modulus in bits. Defaults to 2048.
+
+  Returns:
+    RSAPrivateKey: The private key.
+  """
+
+  generator = random.Random(seed)
+  p, q = generate_prime(generator, key_size // 2), generate_prime(generator, key_size // 2)
+  d = pow(65537, -1, (p - 1) * (q - 1))
+
+  return rsa.RSAPrivateNumbers(
+    p, q, d, rsa.rsa_crt_dmp1(d, p), rsa.rsa_crt_dmq1(d, q), rsa.rsa_crt_iqmp(p, q), rsa.RSAPublicNumbers(65537, p * q)
+  ).private_key()
+
+def mgf1(seed, length):
+  mask = b''.join(hashlib.sha256(seed + counter.to_bytes(4, 'big')).digest() for counter in range(-(-length // 32)))
+  return mask[:length]
+
+def sign_pss(private_key, message, salt_generator):
+  """Signs a message with RSA-PSS (SHA-256, MGF1, maximum salt length), with a salt from a seeded generator.
+
+  The signature verifies like the one of RSAPrivateKey.sign, whose salt
+  comes from the system generator.
+
+  Args:
+    private_key (RSAPrivateKey): The private key.
+    message (bytes): The message.
+    salt_generator (Random): The generator of the salt.
+
+  Returns:
+    bytes: The signature.
+  """
+
+  numbers = private_key.private_numbers()
+  modulus = numbers.public_numbers.n
+  em_bits = modulus.bit_length() - 1
+  em_length = -(-em_bits // 8)
+  salt = salt_generator.randbytes(em_length - 32 - 2)
+
+  digest = hashlib.sha256(b'\x00' * 8 + hashlib.sha256(message).digest() + salt).digest()
+  masked = bytearray(a ^ b for a, b in zip(b'\x01' + salt, mgf1(digest, em_length - 33)))
+  masked[0] &= 0xff >> (8 * em_length - em_bits)
+  encoded = int.from_bytes(bytes(masked) + digest + b'\xbc', 'big')
+
+  # Exponentiate with the CRT, as OpenSSL does
+  m1 = pow(encoded, numbers.dmp1, numbers.p)
+  m2 = pow(encoded, numbers.dmq1, numbers.q)
+  signature = m2 + numbers.iqmp * (m1 - m2) % numbers.p * numbers.q
+
+  return signature.to_bytes((modulus.bit_length() + 7) // 8, 'big')
+
+class SimulatedSocket:
+  """A class to represent the socket of a simulated node, which hands datagrams to the simulator.
+
+  Attributes:
+    simulator (Simulator): The simulator.
+    port (int): The port of the node, which is also its ID.
+  """
+
+  def __init__(self, simulator, port):
+    self.simulator = simulator
+    self.port = port
+
+  def sendto(self, payload, address):
+    self.simulator.transmit(self.port, payload, address)
+    return len(payload)
+
+  def getsockname(self):
+    return ('sim', self.port)
+
+class SimulatedNode(Node):
+  """A class to represent a simulated node, which counts the reorganizations of its chain and runs on the virtual clock.
+
+  The timestamps of its transactions and blocks are the virtual time after the
+  epoch of the simulator, so sealing by age follows the virtual clock too. Its
+  key pair, transaction uuids and signature salts are derived from the seed of
+  the simulator and the ID of the node, so the hashes of transactions and
+  blocks (and the validators they select) are the same in every run.
+
+  Attributes:
+    simulator (Simulator): The simulator.
+    random (Random): The generator of the uuids and signature salts of the node.
+    reorganizations (int): The number of times the chain switched to another branch.
+  """
+
+  simulator = None
+  reorganizations = 0
+
+  def clock(self):
+    return self.simulator.now
+
+  def now(self):
+    return self.simulator.epoch + timedelta(seconds=self.simulator.now)
+
+  def create_uuid(self):
+    return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+  def sign_transaction(self, transaction):
+    return base64.b64encode(sign_pss(self.wallet.private_key, json.dumps(transaction).encode(), self.random)).decode()
+
+  def reorganize(self, tip, best):
+    self.reorganizations += 1
+    super().reorganize(tip, best)
+
+class SimulatedBootstrap(Bootstrap, SimulatedNode):
+  """A class to represent the simulated bootstrap node."""
+
+class Simulator:
+  """A class to represent a deterministic discrete-event simulation of a BlockChat network.
+
+  All nodes run in the calling thread: instead of starting the handler threads,
+  the simulator drains the transaction and block queues of a node after each
+  event that reaches it. Datagrams go through an in-memory network: each sender
+  has a link of limited bandwidth, every datagram gets a latency with jitter,
+  and it may be lost or delayed further (reordered). Events are ordered by
+  virtual time and then by creation order, and every random choice (network,
+  workload) comes from one generator seeded with the seed. The keys, uuids,
+  signatures and timestamps of the nodes are derived from the seed too, so the
+  same seed gives the same schedule, blocks and metrics. Across processes this
+  also needs the same PYTHONHASHSEED, which orders the sets of the nodes.
+
+  The bootstrap node funds every node at the start, as in a real network, and
+  then every node sends short messages to random nodes at the transaction rate.
+
+  The broadcast mode of the full nodes is direct by default, or gossip with a
+  fanout, or IP multicast to a simulated group (one datagram on the link of the
+  sender, delivered to every other full node with its own latency and loss).
+  The last nodes can be light clients, each served by a random full node. The
+  periodic work of the node threads (block repair, sealing by age, gossip pull
+  requests and multicast gap repair) is scheduled on the virtual clock.
+
+  Attributes:
+    nodes_count (int): The number of nodes.
+    block_capacity (int): The block capacity.
+    seed (int): The seed of the simulation.
+    latency (float): The one-way latency of a datagram in seconds.
+    jitter (float): The maximum extra random latency in seconds.
+    bandwidth (float): The bandwidth of the link of each node in bytes per second.
+    loss (float): The probability that a datagram is lost.
+    reorder (float): The probability that a datagram is delayed by up to two latencies more.
+    transaction_rate (float): The number of transactions sent by each node per second.
+    funds (int): The coins sent by the bootstrap node to every node at the start, in minor units.
+    seal_interval (float): The maximum age of a pending transaction in seconds, 0 to seal blocks only when full.
+    gossip_fanout (int): The gossip fanout, 0 to send transactions and blocks to every node directly.
+    multicast (bool): Whether the full nodes multicast transactions and blocks to the group.
+    light_nodes (int): The number of light clients, the nodes with the highest IDs.
+    key_size (int): The size of the RSA keys of the nodes in bits.
+    epoch (datetime): The date and time at virtual time 0.
+    now (float): The virtual time in seconds.
+    nodes (list): The simulated nodes, indexed by ID.
+    stats (dict): The network and workload counters.
+    samples (list): The (time, distinct tips, height spread) samples of the full nodes.
+
+  Methods:
+    setup: Create the nodes, the genesis block and the membership.
+    schedule: Schedule a callback at a virtual time.
+    transmit: Send a datagram through the simulated network.
+    deliver: Deliver a datagram to a node.
+    drain: Process the queued transactions and blocks of a node.
+    tick: Run a periodic task of a node, as its threads would.
+    run: Run the simulation for a virtual duration and report the metrics.
+    report: Compute the throughput and divergence metrics.
+  """
+
+  group = ('239.0.0.1', 5007)
+
+  def __init__(self, nodes_count=20, block_capacity=5, seed=0, latency=0.01, jitter=0.005, bandwidth=12.5e6, loss=0.0, reorder=0.0, transaction_rate=1.0, funds=900.0, stake=10.0, sample_interval=1.0, seal_interval=0.0, gossip_fanout=0, multicast=False, light_nodes=0, key_size=2048):
+    """Initializes a new instance of Simulator.
+
+    Args:
+      nodes_count (int, optional): The number of nodes. Defaults to 20.
+      block_capacity (int, optional): The block capacity. Defaults to 5.
+      seed (int, optional): The seed of the simulation. Defaults to 0.
+      latency (float, optional): The one-way latency in seconds. Defaults to 0.01.
+      jitter (float, optional): The maximum extra random latency in seconds. Defaults to 0.005.
+      bandwidth (float, optional): The link bandwidth in bytes per second. Defaults to 12.5e6 (100 Mbit/s).
+      loss (float, optional): The probability that a datagram is lost. Defaults to 0.0.
+      reorder (float, optional): The probability that a datagram is reordered. Defaults to 0.0.
+      transaction_rate (float, optional): The transactions per node per second. Defaults to 1.0.
+      funds (float, optional): The BCC sent to every node at the start. Defaults to 900.0.
+      stake (float, optional): The BCC staked by every node. Defaults to 10.0.
+      sample_interval (float, optional): The time between two divergence samples in seconds. Defaults to 1.0.
+      seal_interval (float, optional): The maximum age of a pending transaction in seconds, 0 to disable sealing by age. Defaults to 0.0.
+      gossip_fanout (int, optional): The gossip fanout, 0 to disable gossip. Defaults to 0.
+      multicast (bool, optional): Whether to multicast transactions and blocks. Defaults to False.
+      light_nodes (int, optional): The number of light clients. Defaults to 0.
+      key_size (int, optional): The size of the RSA keys in bits, smaller keys are faster to derive. Defaults to 2048.
+
+    Raises:
+      ValueError: If gossip and multicast are both enabled, or there are no full nodes besides the light clients.
+    """
+
+    if gossip_fanout and multicast:
+      raise ValueError('Gossip and multicast cannot be enabled together')
+    if light_nodes >= nodes_count:
+      raise ValueError('The bootstrap node cannot be a light client')
+
+    self.nodes_count = nodes_count
+    self.block_capacity = block_capacity
+    self.seed = seed
+    self.latency = latency
+    self.jitter = jitter
+    self.bandwidth = bandwidth
+    self.loss = loss
+    self.reorder = reorder
+    self.transaction_rate = transaction_rate
+    self.funds = Amount.from_coins(funds)
+    self.stake = Amount.from_coins(stake)
+    self.sample_interval = sample_interval
+    self.seal_interval = seal_interval
+    self.gossip_fanout = gossip_fanout
+    self.multicast = multicast
+    self.light_nodes = light_nodes
+    self.key_size = key_size
+
+    self.epoch = datetime(2024, 1, 1)
+    self.now = 0.0
+    self.events = []
+    self.sequence = 0
+    self.random = random.Random(seed)
+    self.links = {}
+
+    self.nodes = []
+    self.stats = {'events': 0, 'datagrams': 0, 'bytes': 0, 'lost': 0, 'reordered': 0, 'invalid': 0, 'executed': 0, 'rejected': 0}
+    self.samples = []
+
+  def setup(self):
+    """Creates the nodes, the genesis block and the membership, as the bootstrap node would."""
+
+    full_count = self.nodes_count - self.light_nodes
+    multicast_group = f'{self.group[0]}:{self.group[1]}' if self.multicast else None
+
+    wallets = [Wallet(generate_key(f'{self.seed}:{id}', self.key_size)) for id in range(self.nodes_count)]
+
+    blockchain = Blockchain(self.block_capacity, chain=[], nodes=[], seal_interval=self.seal_interval)
+    bootstrap = SimulatedBootstrap(verbose=False, blockchain=blockchain, stake=self.stake, gossip_fanout=self.gossip_fanout, multicast_group=multicast_group, shared_memory=False, wallet=wallets[0])
+    self.nodes = [bootstrap] + [
+      SimulatedNode(verbose=False, stake=self.stake, gossip_fanout=self.gossip_fanout, multicast_group=multicast_group, shared_memory=False, wallet=wallets[id])
+      for id in range(1, full_count)
+    ] + [SimulatedNode(verbose=False, shared_memory=False, light=True, wallet=wallets[id]) for id in range(full_count, self.nodes_count)]
+
+    for id, node in enumerate(self.nodes):
+      node.id = id
+      node.simulator = self
+      node.random = random.Random(f'{self.seed}:{id}')
+      node.socket = SimulatedSocket(self, id)
+
+      # Send from the calling thread, the simulator runs the periodic work of the broadcasters
+      if node.light:
+        node.broadcaster = Broadcaster(node, workers=0)
+      elif self.gossip_fanout:
+        node.broadcaster = Gossip(node, self.gossip_fanout, workers=0)
+        node.broadcaster.random = random.Random(self.random.getrandbits(64))
+      elif self.multicast:
+        node.broadcaster = Multicast(node, node.multicast_group, workers=0)
+        node.broadcaster.attach(node.socket)
+      else:
+        node.broadcaster = Broadcaster(node, workers=0)
+
+    bootstrap.create_genesis_block(self.nodes_count)
+    for id, node in enumerate(self.nodes):
+      if node.light:
+        bootstrap.add_node(id, node.wallet.get_address(), 'sim', id, 0, 0, 0, light=True, peer=self.random.randrange(full_count))
+      else:
+        bootstrap.add_node(id, node.wallet.get_address(), 'sim', id, self.stake, 0, bootstrap.wallet.balance if id == 0 else 0)
+
+    # Every node gets its own copy of the blockchain, as with the activation message, and a light client only the headers
+    blockchain = json.dumps(dict(bootstrap.blockchain))
+    headers = [HeaderChain.header(block) for block in bootstrap.blockchain.chain]
+    for node in self.nodes[1:]:
+      if node.light:
+        node.activate_light(Blockchain(**{**json.loads(blockchain), 'chain': []}), headers, 0)
+      else:
+        node.blockchain = Blockchain(**json.loads(blockchain))
+        node.node_counter = len(node.blockchain.nodes)
+
+    for node in self.nodes[:full_count]:
+      node.prepare_chain()
+
+  def schedule(self, at, callback, *args):
+    """Schedules a callback at a virtual time.
+
+    Args:
+      at (float): The virtual time in seconds.
+      callback (function): The callback.
+      *args: The arguments of the callback.
+    """
+
+    heapq.heappush(self.events, (at, self.sequence, callback, args))
+    self.sequence += 1
+
+  def transmit(self, port, payload, address):
+    """Sends a datagram through the simulated network.
+
+    The datagram leaves the link of the sender after the datagrams already
+    queued on it, and arrives after the latency, unless it is lost. A datagram
+    sent to the multicast group leaves the link once and reaches every other
+    full node, each copy with its own latency and loss.
+
+    Args:
+      port (int): The port (ID) of the sender.
+      payload (bytes): The datagram.
+      address (tuple): The (address, port) of the receiver, or the multicast group.
+    """
+
+    self.stats['datagrams'] += 1
+    self.stats['bytes'] += len(payload)
+
+    departure = max(self.now, self.links.get(port, 0.0)) + len(payload) / self.bandwidth
+    self.links[port] = departure
+
+    if address == self.group:
+      receivers = [node.id for node in self.nodes if node.id != port and not node.light]
+    else:
+      receivers = [address[1]]
+
+    for receiver in receivers:
+      if self.random.random() < self.loss:
+        self.stats['lost'] += 1
+        continue
+
+      delay = self.latency + self.random.uniform(0.0, self.jitter)
+      if self.random.random() < self.reorder:
+        self.stats['reordered'] += 1
+        delay += self.random.uniform(0.0, 2 * self.latency)
+
+      self.schedule(departure + delay, self.deliver, receiver, payload, ('sim', port))
+
+  def deliver(self, port, payload, address):
+    """Delivers a datagram to a node and processes what it queued.
+
+    Args:
+      port (int): The port (ID) of the receiver.
+      payload (bytes): The datagram.
+      address (tuple): The (address, port) of the sender.
+    """
+
+    node = self.nodes[port]
+    if not node.dispatch(json.loads(payload.decode()), address):
+      self.stats['invalid'] += 1
+
+    self.drain(node)
+
+  def drain(self, node):
+    """Processes the queued transactions and blocks of a node, as its handler threads would.
+
+    Args:
+      node (Node): The node.
+    """
+
+    while not node.transaction_queue.empty() or not node.block_queue.empty():
+      while not node.transaction_queue.empty():
+        node.handle_transaction(node.transaction_queue.get_nowait())
+      while not node.block_queue.empty():
+        node.process_block(node.block_queue.get_nowait())
+
+  def tick(self, node, interval, task):
+    """Runs a periodic task of a node and schedules its next run, as the threads of the node would.
+
+    Args:
+      node (Node): The node.
+      interval (float): The time between two runs in seconds.
+      task (function): The task, e.g. the block repair or the seal check of the node.
+    """
+
+    task()
+    self.drain(node)
+    self.schedule(self.now + interval, self.tick, node, interval, task)
+
+  def execute(self, node, receiver_id, type_of_transaction, value):
+    """Executes a transaction on a node and processes what it queued.
+
+    Args:
+      node (Node): The node.
+      receiver_id (int): The ID of the receiver.
+      type_of_transaction (str): The type of the transaction.
+      value (int or str): The value of the transaction, in minor units, or the message.
+    """
+
+    if node.execute_transaction(receiver_id, type_of_transaction, value):
+      self.stats['executed'] += 1
+    else:
+      self.stats['rejected'] += 1
+    self.drain(node)
+
+  def transact(self, node):
+    """Sends a message from a node to a random node and schedules its next transaction.
+
+    Args:
+      node (Node): The node.
+    """
+
+    receiver_id = self.random.choice([id for id in range(self.nodes_count) if id != node.id])
+    self.execute(node, receiver_id, 'message', f'm{self.stats["executed"]}')
+    self.schedule(self.now + self.random.expovariate(self.transaction_rate), self.transact, node)
+
+  def sample(self):
+    """Records the number of distinct chain tips and the spread of chain heights."""
+
+    full_nodes = [node for node in self.nodes if not node.light]
+    tips = {node.blockchain.get_last_block().hash for node in full_nodes}
+    heights = [node.blockchain.block_index for node in full_nodes]
+    self.samples.append((self.now, len(tips), max(heights) - min(heights)))
+
+    self.schedule(self.now + self.sample_interval, self.sample)
+
+  def run(self, duration=60.0):
+    """Runs the simulation for a virtual duration.
+
+    Args:
+      duration (float, optional): The virtual duration in seconds. Defaults to 60.0.
+
+    Returns:
+      dict: The metrics of the simulation (see report).
+    """
+
+    started = time.perf_counter()
+    self.setup()
+
+    # Fund every node, then start the workload once the funds are committed
+    for node in self.nodes[1:]:
+      self.schedule(0.0, self.execute, self.nodes[0], node.id, 'coins', self.funds)
+    for node in self.nodes:
+      self.schedule(1.0 + self.random.expovariate(self.transaction_rate), self.transact, node)
+      if node.light:
+        continue
+
+      self.schedule(node.repair_interval, self.tick, node, node.repair_interval, node.repair_blocks)
+      if self.seal_interval > 0:
+        interval = min(0.1, self.seal_interval / 4)
+        self.schedule(interval, self.tick, node, interval, node.check_seal)
+      if self.gossip_fanout:
+        self.schedule(node.broadcaster.repair_interval, self.tick, node, node.broadcaster.repair_interval, node.broadcaster.pull_request)
+      elif self.multicast:
+        interval = node.broadcaster.gap_timeout / 4
+        self.schedule(interval, self.tick, node, interval, node.broadcaster.repair_gaps)
+    self.schedule(self.sample_interval, self.sample)
+
+    while self.events and self.events[0][0] <= duration:
+      self.now, _, callback, args = heapq.heappop(self.events)
+      callback(*args)
+      self.stats['events'] += 1
+
+    self.now = duration
+    return self.report(time.perf_counter() - started)
+
+  def report(self, wall_time=0.0):
+    """Computes the throughput and divergence metrics of the simulation.
+
+    The committed chain is the longest prefix common to all full nodes; the
+    throughput counts its transactions after the genesis block. A light client
+    lags by the blocks its header chain is behind the highest full node, and
+    its balance is wrong if it differs from the balance in the state of its
+    last header on the bootstrap node.
+
+    Args:
+      wall_time (float, optional): The real time the simulation took in seconds.
+
+    Returns:
+      dict: The metrics.
+    """
+
+    full_nodes = [node for node in self.nodes if not node.light]
+    light_nodes = [node for node in self.nodes if node.light]
+
+    chains = [node.blockchain.chain for node in full_nodes]
+    common = 0
+    while all(len(chain) > common for chain in chains) and len({chain[common].hash for chain in chains}) == 1:
+      common += 1
+
+    committed = sum(len(block.transactions) for block in chains[0][1:common])
+    heights = [node.blockchain.block_index for node in full_nodes]
+
+    # Balances are checked against the states the bootstrap node still holds
+    tree = self.nodes[0].block_tree
+    light_errors = sum(
+      1 for node in light_nodes
+      if node.headers.tip()['hash'] in tree and tree.get(node.headers.tip()['hash'])['state'].get(node.wallet.get_address(), {}).get('balance', 0) != node.headers.get_balance()
+    )
+
+    return {
+      'nodes': self.nodes_count,
+      'seed': self.seed,
+      'virtual_time': self.now,
+      'wall_time': round(wall_time, 3),
+      **self.stats,
+      'committed_blocks': max(common - 1, 0),
+      'committed_transactions': committed,
+      'throughput': committed / self.now if self.now else 0.0,
+      'max_height': max(heights),
+      'height_spread': max(heights) - min(heights),
+      'distinct_tips': len({chain[-1].hash for chain in chains}),
+      'max_distinct_tips': max((tips for _, tips, _ in self.samples), default=1),
+      'mean_distinct_tips': sum(tips for _, tips, _ in self.samples) / len(self.samples) if self.samples else 1.0,
+      'reorganizations': sum(node.reorganizations for node in full_nodes),
+      'light_nodes': len(light_nodes),
+      'max_light_lag': max((max(heights) - len(node.headers.headers) for node in light_nodes), default=0),
+      'light_balance_errors': light_errors,
+    }
+
+def main():
+  parser = argparse.ArgumentParser(description='Simulate a BlockChat network on a virtual clock')
+  parser.add_argument("--nodes", "-n", type=int, default=20, help="Number of nodes")
+  parser.add_argument("--capacity", "-c", type=int, default=5, help="Block capacity")
+  parser.add_argument("--duration", type=float, default=30.0, help="Virtual duration in seconds")
+  parser.add_argument("--seed", type=int, default=0, help="Seed of the network and the workload")
+  parser.add_argument("--latency", type=float, default=0.01, help="One-way latency in seconds")
+  parser.add_argument("--jitter", type=float, default=0.005, help="Maximum extra random latency in seconds")
+  parser.add_argument("--bandwidth", type=float, default=100.0, help="Link bandwidth of each node in Mbit/s")
+  parser.add_argument("--loss", type=float, default=0.0, help="Probability that a datagram is lost")
+  parser.add_argument("--reorder", type=float, default=0.0, help="Probability that a datagram is reordered")
+  parser.add_argument("--rate", type=float, default=1.0, help="Transactions per node per second")
+  parser.add_argument("--seal-interval", type=float, default=0.0, help="Seal a block when its oldest transaction is this many seconds old (0 to disable)")
+  parser.add_argument("--gossip", type=int, default=0, help="Gossip transactions and blocks with this fanout (0 to disable)")
+  parser.add_argument("--multicast", action="store_true", help="Multicast transactions and blocks to a simulated group")
+  parser.add_argument("--light", type=int, default=0, help="Number of light clients")
+  parser.add_argument("--key-size", type=int, default=2048, help="Size of the RSA keys of the nodes in bits (1024 starts faster)")
+  args = parser.parse_args()
+
+  simulator = Simulator(
+    args.nodes, args.capacity, args.seed, args.latency, args.jitter, args.bandwidth * 125000,
+    args.loss, args.reorder, args.rate, seal_interval=args.seal_interval, gossip_fanout=args.gossip,
+    multicast=args.multicast, light_nodes=args.light, key_size=args.key_size
+  )
+  print(termcolor.bold('[SIM]'), termcolor.magenta(f'Simulating {args.nodes} nodes for {args.duration} seconds (seed {args.seed})'))
+  metrics = simulator.run(args.duration)
+
+  for key, value in metrics.items():
+    print(termcolor.bold('[SIM]'), f'{key}: {round(value, 3) if isinstance(value, float) else value}')
+
+if __name__ == '__main__':
+  main()
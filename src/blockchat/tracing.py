@@ -0,0 +1,148 @@
+"""A module for the Tracer class.
+
+This module contains the Tracer class, which is used to record the lifecycle
+of sampled transactions as they move through a node, from execution to their
+registration inside a block.
+"""
+
+import json
+import zlib
+import time
+
+from collections import deque
+
+class Tracer:
+  """A class to record per-stage timestamps (spans) for sampled transactions.
+
+  Every span is a flat dictionary with the transaction uuid, the node id, the
+  stage name and a wall-clock timestamp, so that spans from different nodes can
+  be concatenated and aggregated offline. Sampling is decided by a hash of the
+  transaction uuid, which means that every node traces the same transactions.
+
+  Attributes:
+    sample_rate (float): The fraction of transactions to trace (0.0 to 1.0).
+    spans (deque): A bounded deque of the recorded spans.
+
+  Methods:
+    is_sampled: Check if a transaction is sampled.
+    record: Record a span for a transaction.
+    export: Export the recorded spans to a JSON lines file.
+    summary: Aggregate the time spent between consecutive stages.
+  """
+
+  stages = [
+    'execute',
+    'broadcast',
+    'receive',
+    'dequeue',
+    'verify',
+    'validate',
+    'register',
+    'mine',
+    'validator',
+    'broadcast_block',
+    'register_block',
+  ]
+
+  def __init__(self, sample_rate=1.0, max_spans=100000):
+    """Initializes a new instance of Tracer.
+
+    Args:
+      sample_rate (float, optional): The fraction of transactions to trace. Defaults to 1.0.
+      max_spans (int, optional): The maximum number of spans kept in memory. Defaults to 100000.
+    """
+
+    self.sample_rate = sample_rate
+    self.spans = deque(maxlen=max_spans)
+
+    self.threshold = int(sample_rate * 0xffffffff)
+
+  def is_sampled(self, transaction_uuid):
+    """Checks if a transaction is sampled, based on the hash of its uuid.
+
+    Args:
+      transaction_uuid (str): The UUID of the transaction.
+
+    Returns:
+      bool: True if the transaction is sampled, False otherwise.
+    """
+
+    if self.sample_rate >= 1.0:
+      return True
+
+    return zlib.crc32(transaction_uuid.encode()) <= self.threshold
+
+  def record(self, transaction_uuid, node_id, stage, timestamp=None):
+    """Records a span for a transaction, if it is sampled.
+
+    Args:
+      transaction_uuid (str): The UUID of the transaction.
+      node_id (int): The ID of the node recording the span.
+      stage (str): The name of the stage.
+      timestamp (float, optional): The time of the span. Defaults to now.
+    """
+
+    if not self.is_sampled(transaction_uuid):
+      return
+
+    self.spans.append({
+      'uuid': transaction_uuid,
+      'node': node_id,
+      'stage': stage,
+      'timestamp': time.time() if timestamp is None else timestamp,
+    })
+
+  def export(self, file_path):
+    """Exports the recorded spans to a JSON lines file, one span per line.
+
+    Args:
+      file_path (str): The path of the file.
+
+    Returns:
+      int: The number of exported spans.
+    """
+
+    spans = list(self.spans)
+    with open(file_path, 'w') as f:
+      for span in spans:
+        f.write(json.dumps(span) + '\n')
+
+    return len(spans)
+
+  @staticmethod
+  def summary(spans):
+    """Aggregates the time spent between consecutive stages of each transaction.
+
+    The spans of each transaction (on the same node) are ordered by timestamp
+    and the difference between two consecutive spans is attributed to the
+    later stage.
+
+    Args:
+      spans (iterable): The spans, possibly from many nodes.
+
+    Returns:
+      dict: A dictionary mapping each stage to its count, mean, p50, p95 and max duration in seconds.
+    """
+
+    traces = {}
+    for span in spans:
+      traces.setdefault((span['uuid'], span['node']), []).append(span)
+
+    durations = {}
+    for trace in traces.values():
+      trace.sort(key=lambda span: span['timestamp'])
+      for previous, current in zip(trace, trace[1:]):
+        durations.setdefault(current['stage'], []).append(current['timestamp'] - previous['timestamp'])
+
+    summary = {}
+    for stage in sorted(durations, key=lambda stage: Tracer.stages.index(stage) if stage in Tracer.stages else len(Tracer.stages)):
+      values = sorted(durations[stage])
+      summary[stage] = {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': values[len(values) // 2],
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max': values[-1],
+      }
+
+    return summary
@@ -16,7 +16,7 @@ class Transaction:
     receiver_address (str): The address of the receiver.
     timestamp (str): The timestamp of the transaction.
     type_of_transaction (str): The type of the transaction.
-    value (float): The value of the transaction.
+    value (int or str): The value of the transaction, in minor units (see Amount), or the message.
     nonce (int): The nonce of the transaction.
     signature (str): The signature of the transaction.
   """
@@ -30,7 +30,7 @@ class Transaction:
       receiver_address (str): The address of the receiver.
       timestamp (str): The timestamp of the transaction.
       type_of_transaction (str): The type of the transaction.
-      value (float): The value of the transaction.
+      value (int or str): The value of the transaction, in minor units (see Amount), or the message.
       nonce (int): The nonce of the transaction.
       signature (str): The signature of the transaction.
     """
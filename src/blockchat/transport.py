@@ -0,0 +1,952 @@
+"""A module for the receive pipeline of a node.
+
+This module contains the BufferPool class, a pool of preallocated receive
+buffers, the PriorityInbox class and the PriorityReceiver class, which let
+control messages (blocks, membership) overtake transactions on the way from
+the sockets of a node (one per receiver thread, sharing its port with
+SO_REUSEPORT) to the receive loop, the RingBuffer class, a
+single-producer single-consumer byte ring in a shared memory segment, and the
+SharedMemoryTransport class, which is used by nodes running on the same host to
+exchange messages through ring buffers instead of the loopback UDP stack.
+"""
+
+import os
+import time
+import json
+import struct
+import socket as sockets
+
+from multiprocessing import shared_memory, resource_tracker
+from collections import deque
+from threading import Thread, Lock, Condition
+
+class BufferPool:
+  """A class to represent a pool of preallocated receive buffers.
+
+  Attributes:
+    size (int): The size of each buffer in bytes.
+    misses (int): The number of times no buffer was free.
+
+  The buffers are taken and returned by the reader threads of the receiver,
+  so the pool and its counter are guarded by a lock.
+
+  Methods:
+    acquire: Take a free buffer.
+    release: Return a buffer to the pool.
+  """
+
+  def __init__(self, count=64, size=65536):
+    """Initializes a new instance of BufferPool.
+
+    Args:
+      count (int, optional): The number of buffers. Defaults to 64.
+      size (int, optional): The size of each buffer in bytes. Defaults to 65536, the largest UDP datagram.
+    """
+
+    self.size = size
+    self.free = deque(bytearray(size) for _ in range(count))
+    self.misses = 0
+    self.lock = Lock()
+
+  def acquire(self):
+    """Takes a free buffer.
+
+    Returns:
+      bytearray: The buffer, or None if all the buffers are in use.
+    """
+
+    with self.lock:
+      if not self.free:
+        self.misses += 1
+        return None
+      return self.free.popleft()
+
+  def release(self, buffer):
+    """Returns a buffer to the pool.
+
+    Args:
+      buffer (bytearray): The buffer.
+    """
+
+    with self.lock:
+      self.free.append(buffer)
+
+class PriorityInbox:
+  """A class to represent the inbox of received messages, with a bounded control lane and a bounded data lane.
+
+  Transactions and compact blocks go to the data lane and every other message
+  (blocks, membership, repair requests) to the control lane; get serves the
+  control lane first, and each lane in arrival order. Compact blocks share the
+  lane of the transactions so that they do not overtake the transactions they
+  refer to. The lane is chosen with a peek at the first bytes of the payload,
+  before it is parsed: messages are serialized with 'message_type' first, and
+  gossip and multicast envelopes carry the type of the message they wrap
+  within their first bytes. A message that arrives on a full lane is dropped,
+  like a datagram dropped by the kernel.
+
+  Attributes:
+    control_capacity (int): The maximum number of messages on the control lane.
+    data_capacity (int): The maximum number of messages on the data lane.
+    control (int): The number of messages received on the control lane.
+    data (int): The number of messages received on the data lane.
+    overtaken (int): The number of control messages served while data messages were waiting.
+    dropped (int): The number of messages dropped because their lane was full.
+
+  Methods:
+    put: Add a received message to its lane, unless the lane is full.
+    get: Get the next message, waiting until there is one.
+  """
+
+  data_markers = (b'"message_type": "transaction"', b'"message_type": "compact_block"')
+  peek_size = 256
+
+  def __init__(self, control_capacity=1024, data_capacity=8192):
+    """Initializes a new instance of PriorityInbox.
+
+    Args:
+      control_capacity (int, optional): The maximum number of messages on the control lane. Defaults to 1024, the size of the block queue of a node.
+      data_capacity (int, optional): The maximum number of messages on the data lane. Defaults to 8192, the size of the admission queue of a node.
+    """
+
+    self.control_capacity = control_capacity
+    self.data_capacity = data_capacity
+    self.lanes = (deque(), deque())
+    self.condition = Condition()
+
+    self.control = 0
+    self.data = 0
+    self.overtaken = 0
+    self.dropped = 0
+
+  def put(self, item, payload):
+    """Adds a received message to its lane, unless the lane is full.
+
+    Args:
+      item (tuple): The decoded message (None if it is not valid JSON), the (address, port) of the sender and the payload if it could not be decoded (or None).
+      payload (bytes): The received bytes (or a view of them), whose first bytes choose the lane.
+
+    Returns:
+      bool: True if the message was added, False if it was dropped.
+    """
+
+    peek = bytes(payload[:self.peek_size])
+    lane = 1 if any(marker in peek for marker in self.data_markers) else 0
+    with self.condition:
+      if len(self.lanes[lane]) >= (self.data_capacity if lane else self.control_capacity):
+        self.dropped += 1
+        return False
+
+      self.lanes[lane].append(item)
+      if lane:
+        self.data += 1
+      else:
+        self.control += 1
+      self.condition.notify()
+    return True
+
+  def get(self):
+    """Gets the next message, from the control lane first, waiting until there is one.
+
+    Returns:
+      tuple: The decoded message, the (address, port) of the sender and the payload if it could not be decoded (or None).
+    """
+
+    control, data = self.lanes
+    with self.condition:
+      while not control and not data:
+        self.condition.wait()
+
+      if control:
+        if data:
+          self.overtaken += 1
+        return control.popleft()
+      return data.popleft()
+
+class PriorityReceiver:
+  """A class to represent the socket of a node with a prioritized receive pipeline.
+
+  Reader threads drain and decode the UDP sockets: each one receives the
+  datagrams of its socket into a preallocated buffer of the pool with
+  recvfrom_into (or, if none is free, into a scratch buffer of its own),
+  decodes the JSON straight from the buffer, returns the buffer to the pool
+  and adds the message to a PriorityInbox. The receive loop only takes the
+  decoded messages of the inbox, so that a block or a membership message is
+  handled before the transactions that arrived ahead of it. Any other
+  attribute (e.g. sendto) is taken from the socket.
+
+  With more than one receiver, extra sockets are bound to the port of the node
+  with SO_REUSEPORT (the socket of the node must set it before binding, see
+  share_port), each with its own reader thread and kernel receive buffer. The
+  kernel spreads the datagrams over the sockets by sender, so the datagrams of
+  one sender stay in order. The drops and queued bytes of each socket are read
+  from /proc/net/udp, to size the receivers and the kernel receive buffer.
+
+  Attributes:
+    node (Node): The node that owns the receiver.
+    socket (socket): The UDP socket of the node.
+    sockets (list): The sockets of the receiver threads, the socket of the node first.
+    port (int): The port of the node.
+    pool (BufferPool): The receive buffers.
+    inbox (PriorityInbox): The received messages.
+    datagrams (list): The number of datagrams received by each socket.
+
+  Methods:
+    share_port: Let a socket share its port with the receiver sockets, before it is bound.
+    start: Start the socket reader threads.
+    enqueue: Decode a received message and add it to the inbox.
+    receive: Receive the next decoded message, control messages first.
+    recvfrom: Receive the next message as bytes, control messages first.
+    kernel_stats: Get the queued bytes and the drops of each socket from the kernel.
+    stats: Get the receive counters.
+    close: Release the resources of the receiver.
+  """
+
+  def __init__(self, node, socket, buffers=64, receivers=1, receive_buffer=0):
+    """Initializes a new instance of PriorityReceiver.
+
+    Args:
+      node (Node): The node that owns the receiver.
+      socket (socket): The UDP socket of the node, bound (with share_port first if there is more than one receiver).
+      buffers (int, optional): The number of preallocated receive buffers. Defaults to 64.
+      receivers (int, optional): The number of sockets and reader threads. Defaults to 1.
+      receive_buffer (int, optional): The kernel receive buffer size of each socket in bytes, 0 keeps the system default. Defaults to 0.
+    """
+
+    self.node = node
+    self.socket = socket
+    self.port = socket.getsockname()[1]
+    self.pool = BufferPool(buffers)
+    self.inbox = PriorityInbox()
+
+    self.sockets = [socket]
+    for _ in range(receivers - 1):
+      shared = sockets.socket(socket.family, sockets.SOCK_DGRAM)
+      self.share_port(shared)
+      shared.bind(socket.getsockname())
+      self.sockets.append(shared)
+
+    if receive_buffer:
+      for receiver in self.sockets:
+        receiver.setsockopt(sockets.SOL_SOCKET, sockets.SO_RCVBUF, receive_buffer)
+
+    self.datagrams = [0] * len(self.sockets)
+
+  def __getattr__(self, name):
+    return getattr(self.socket, name)
+
+  @staticmethod
+  def share_port(socket):
+    """Lets a socket share its port with other sockets of the same user (SO_REUSEPORT). Call it before binding.
+
+    Args:
+      socket (socket): The socket.
+    """
+
+    socket.setsockopt(sockets.SOL_SOCKET, sockets.SO_REUSEPORT, 1)
+
+  def start(self):
+    """Starts a reader thread for each socket."""
+
+    for index in range(len(self.sockets)):
+      thread = Thread(target=self.receive_datagrams, args=(index,))
+      thread.daemon = True
+      thread.start()
+
+  def receive_datagrams(self, index):
+    """Decodes the datagrams of a socket into the inbox, until the process exits.
+
+    Args:
+      index (int): The position of the socket in sockets.
+    """
+
+    receiver = self.sockets[index]
+    scratch = bytearray(self.pool.size)
+    while True:
+      buffer = self.pool.acquire()
+      try:
+        size, address = receiver.recvfrom_into(buffer if buffer is not None else scratch)
+      except OSError:
+        # The socket was closed
+        if buffer is not None:
+          self.pool.release(buffer)
+        return
+
+      self.datagrams[index] += 1
+      with memoryview(buffer if buffer is not None else scratch)[:size] as payload:
+        self.enqueue(payload, address)
+      if buffer is not None:
+        self.pool.release(buffer)
+
+  def enqueue(self, payload, address):
+    """Decodes a received message and adds it to the inbox, on the thread that received it.
+
+    Args:
+      payload (bytes): The received bytes (or a view of them), only used during the call.
+      address (tuple): The (address, port) of the sender.
+
+    Returns:
+      bool: True if the message was added, False if its lane was full.
+    """
+
+    try:
+      item = (json.loads(str(payload, 'utf-8')), address, None)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+      item = (None, address, bytes(payload))
+
+    return self.inbox.put(item, payload)
+
+  def receive(self):
+    """Receives the next decoded message, control messages first.
+
+    Returns:
+      tuple: The message (None if it is not valid JSON) and the (address, port) of the sender.
+    """
+
+    message, address, _ = self.inbox.get()
+    return message, address
+
+  def recvfrom(self, buffer_size):
+    """Receives the next message as bytes, control messages first.
+
+    Messages that are valid JSON were decoded by the reader threads and are
+    encoded again, the others (e.g. the pong of the bootstrap node) are kept
+    as they were received.
+
+    Args:
+      buffer_size (int): Unused, the buffers of the pool hold the largest datagram.
+
+    Returns:
+      tuple: The message and the (address, port) of the sender.
+    """
+
+    message, address, payload = self.inbox.get()
+    if payload is None:
+      payload = json.dumps(message).encode()
+    return payload, address
+
+  def kernel_stats(self):
+    """Gets the bytes waiting in the kernel receive buffer and the datagrams dropped by the kernel, for each socket.
+
+    Returns:
+      list: A dictionary with the 'queued' bytes, the 'drops' and the 'receive_buffer' size for each socket, or None if /proc/net/udp is not available.
+    """
+
+    inodes = [os.fstat(receiver.fileno()).st_ino for receiver in self.sockets]
+    entries = {}
+    try:
+      for path in ('/proc/net/udp', '/proc/net/udp6'):
+        if not os.path.exists(path):
+          continue
+        with open(path) as f:
+          next(f)
+          for line in f:
+            fields = line.split()
+            # tx_queue:rx_queue is in hexadecimal, drops is the last column
+            entries[int(fields[9])] = (int(fields[4].split(':')[1], 16), int(fields[-1]))
+    except (OSError, ValueError, IndexError):
+      return None
+
+    if not entries:
+      return None
+
+    return [
+      {
+        'queued': entries.get(inode, (0, 0))[0],
+        'drops': entries.get(inode, (0, 0))[1],
+        'receive_buffer': receiver.getsockopt(sockets.SOL_SOCKET, sockets.SO_RCVBUF),
+      }
+      for inode, receiver in zip(inodes, self.sockets)
+    ]
+
+  def stats(self):
+    """Gets the receive counters: the inbox lanes, the buffer pool, and the datagrams and kernel drops of each socket.
+
+    Returns:
+      dict: The counters.
+    """
+
+    kernel = self.kernel_stats()
+    return {
+      'control': self.inbox.control,
+      'data': self.inbox.data,
+      'overtaken': self.inbox.overtaken,
+      'inbox_dropped': self.inbox.dropped,
+      'buffer_misses': self.pool.misses,
+      'datagrams': list(self.datagrams),
+      'drops': sum(entry['drops'] for entry in kernel) if kernel is not None else None,
+      'sockets': kernel,
+    }
+
+  def close(self):
+    """Closes the sockets of the extra receivers (the socket of the node is closed by its owner)."""
+
+    for receiver in self.sockets[1:]:
+      receiver.close()
+
+# The segments created by this process, which are tracked (and unlinked at exit) by its resource tracker
+created_segments = set()
+
+def create_segment(name, size):
+  """Creates a shared memory segment, replacing a stale segment left by a previous process with the same name.
+
+  The pages of the segment are reserved up front, so a full /dev/shm fails
+  here with an OSError instead of killing the process with SIGBUS on the
+  first write to a page that cannot be allocated.
+
+  Args:
+    name (str): The name of the segment.
+    size (int): The size of the segment in bytes.
+
+  Returns:
+    SharedMemory: The segment.
+
+  Raises:
+    OSError: If the segment cannot be created or its pages cannot be reserved.
+  """
+
+  try:
+    memory = shared_memory.SharedMemory(name, create=True, size=size)
+  except FileExistsError:
+    stale = shared_memory.SharedMemory(name)
+    stale.close()
+    stale.unlink()
+    memory = shared_memory.SharedMemory(name, create=True, size=size)
+
+  if hasattr(os, 'posix_fallocate'):
+    try:
+      os.posix_fallocate(memory._fd, 0, size)
+    except OSError:
+      memory.close()
+      memory.unlink()
+      raise
+
+  created_segments.add(memory._name)
+  return memory
+
+def attach_segment(name):
+  """Attaches to a shared memory segment created by another process.
+
+  Args:
+    name (str): The name of the segment.
+
+  Returns:
+    SharedMemory: The segment, or None if it does not exist.
+  """
+
+  try:
+    memory = shared_memory.SharedMemory(name)
+  except FileNotFoundError:
+    return None
+
+  # The creator owns the segment, do not let the resource tracker unlink it when this process exits
+  if memory._name not in created_segments:
+    resource_tracker.unregister(memory._name, 'shared_memory')
+  return memory
+
+def close_segment(memory, owner):
+  memory.close()
+  if owner:
+    created_segments.discard(memory._name)
+    try:
+      memory.unlink()
+    except FileNotFoundError:
+      pass
+
+class RingBuffer:
+  """A class to represent a single-producer single-consumer ring of messages in shared memory.
+
+  The segment starts with a header holding the total number of bytes written
+  and read and a random token chosen when the ring is created, followed by the
+  data area. Each message is stored as a 4-byte length followed by its bytes,
+  wrapping around the end of the data area. The writer only moves the write
+  counter and the reader only moves the read counter, so no lock is shared
+  between the two processes. The token lets a reader notice that the ring was
+  recreated under the same name (e.g. by a restarted peer). A message is
+  handed to the reader as a view of the segment and its space is released
+  only after the reader is done with it; only a message that wraps around
+  the end of the data area is copied.
+
+  Attributes:
+    name (str): The name of the shared memory segment.
+    capacity (int): The size of the data area in bytes.
+    token (int): The token of the ring.
+    owner (bool): A boolean indicating whether the ring was created (and is unlinked) by this process.
+
+  Methods:
+    create: Create a ring, replacing a stale segment with the same name.
+    attach: Attach to a ring created by another process.
+    write: Append a message, unless the ring is full.
+    read: Pop the messages written so far, while the reader accepts them.
+    close: Close (and unlink, if owned) the segment.
+  """
+
+  header = struct.Struct('QQQ')
+  length = struct.Struct('I')
+
+  def __init__(self, memory, owner):
+    """Initializes a new instance of RingBuffer. Use create or attach instead.
+
+    Args:
+      memory (SharedMemory): The shared memory segment.
+      owner (bool): A boolean indicating whether the segment was created by this process.
+    """
+
+    self.memory = memory
+    self.name = memory.name
+    self.buffer = memory.buf
+    self.capacity = memory.size - self.header.size
+    self.token = self.header.unpack_from(self.buffer, 0)[2]
+    self.owner = owner
+
+  @classmethod
+  def create(cls, name, capacity=1 << 18):
+    """Creates a ring, replacing a stale segment left by a previous process with the same name.
+
+    Args:
+      name (str): The name of the segment.
+      capacity (int, optional): The size of the data area in bytes. Defaults to 256 KiB.
+
+    Returns:
+      RingBuffer: The ring.
+
+    Raises:
+      OSError: If there is no room left for the segment.
+    """
+
+    memory = create_segment(name, cls.header.size + capacity)
+    cls.header.pack_into(memory.buf, 0, 0, 0, int.from_bytes(os.urandom(8), 'little'))
+    return cls(memory, True)
+
+  @classmethod
+  def attach(cls, name):
+    """Attaches to a ring created by another process.
+
+    Args:
+      name (str): The name of the segment.
+
+    Returns:
+      RingBuffer: The ring, or None if it does not exist.
+    """
+
+    memory = attach_segment(name)
+    return cls(memory, False) if memory is not None else None
+
+  def put(self, position, data):
+    data = memoryview(data)
+    start = self.header.size + position % self.capacity
+    first = min(len(data), self.header.size + self.capacity - start)
+    self.buffer[start:start + first] = data[:first]
+    if first < len(data):
+      self.buffer[self.header.size:self.header.size + len(data) - first] = data[first:]
+
+  def get(self, position, size):
+    # A view of the segment if the bytes are contiguous, a copy if they wrap around
+    start = self.header.size + position % self.capacity
+    first = min(size, self.header.size + self.capacity - start)
+    if first == size:
+      return self.buffer[start:start + size]
+    return bytes(self.buffer[start:start + first]) + bytes(self.buffer[self.header.size:self.header.size + size - first])
+
+  def write(self, payload):
+    """Appends a message, unless the ring is full.
+
+    Args:
+      payload (bytes): The message.
+
+    Returns:
+      bool: True if the message was written, False if there is not enough space.
+    """
+
+    written, read, _ = self.header.unpack_from(self.buffer, 0)
+    size = self.length.size + len(payload)
+    if size > self.capacity - (written - read):
+      return False
+
+    self.put(written, self.length.pack(len(payload)))
+    self.put(written + self.length.size, payload)
+
+    # Publish the message only after its bytes are in place
+    struct.pack_into('Q', self.buffer, 0, written + size)
+    return True
+
+  def read(self, consume):
+    """Pops the messages written so far, in the order they were written, while the reader accepts them.
+
+    Args:
+      consume (callable): Called with each message as a memoryview, valid only during the call, of the segment (or of a copy if the message wraps around the end of the data area), returns False to leave the message and the ones after it in the ring.
+
+    Returns:
+      int: The number of messages popped.
+    """
+
+    written, read, _ = self.header.unpack_from(self.buffer, 0)
+
+    count = 0
+    while read < written:
+      with memoryview(self.get(read, self.length.size)) as length:
+        size, = self.length.unpack(length)
+      with memoryview(self.get(read + self.length.size, size)) as payload:
+        if consume(payload) is False:
+          break
+
+      # The writer may reuse the space only now
+      read += self.length.size + size
+      struct.pack_into('Q', self.buffer, 8, read)
+      count += 1
+
+    return count
+
+  def pending(self):
+    written, read, _ = self.header.unpack_from(self.buffer, 0)
+    return read < written
+
+  def close(self):
+    """Closes the segment, and unlinks it if it was created by this process."""
+
+    self.buffer = None
+    close_segment(self.memory, self.owner)
+
+class Presence:
+  """A class to represent the presence segment that announces a node to the other nodes on the same host.
+
+  The segment holds a random token chosen when the node starts, the port of
+  the doorbell socket of the node, and a flag that is set while the ring
+  reader of the node sleeps on that socket.
+
+  Attributes:
+    name (str): The name of the shared memory segment.
+    token (int): The token of the node.
+    port (int): The port of the doorbell socket of the node.
+    owner (bool): A boolean indicating whether the segment was created (and is unlinked) by this process.
+
+  Methods:
+    create: Announce a node.
+    attach: Attach to the presence segment of another node.
+    sleeping: Check if the ring reader of the node sleeps.
+    set_sleeping: Set or clear the sleeping flag.
+    close: Close (and unlink, if owned) the segment.
+  """
+
+  layout = struct.Struct('QQQ')
+
+  def __init__(self, memory, owner):
+    """Initializes a new instance of Presence. Use create or attach instead.
+
+    Args:
+      memory (SharedMemory): The shared memory segment.
+      owner (bool): A boolean indicating whether the segment was created by this process.
+    """
+
+    self.memory = memory
+    self.name = memory.name
+    self.token, self.port, _ = self.layout.unpack_from(memory.buf, 0)
+    self.owner = owner
+
+  @classmethod
+  def create(cls, name, port):
+    """Announces a node.
+
+    Args:
+      name (str): The name of the segment.
+      port (int): The port of the doorbell socket of the node.
+
+    Returns:
+      Presence: The presence segment.
+    """
+
+    memory = create_segment(name, cls.layout.size)
+    cls.layout.pack_into(memory.buf, 0, int.from_bytes(os.urandom(8), 'little'), port, 0)
+    return cls(memory, True)
+
+  @classmethod
+  def attach(cls, name):
+    """Attaches to the presence segment of another node.
+
+    Args:
+      name (str): The name of the segment.
+
+    Returns:
+      Presence: The presence segment, or None if the node is not running.
+    """
+
+    memory = attach_segment(name)
+    return cls(memory, False) if memory is not None else None
+
+  def sleeping(self):
+    return struct.unpack_from('Q', self.memory.buf, 16)[0] == 1
+
+  def set_sleeping(self, sleeping):
+    struct.pack_into('Q', self.memory.buf, 16, 1 if sleeping else 0)
+
+  def close(self):
+    """Closes the segment, and unlinks it if it was created by this process."""
+
+    close_segment(self.memory, self.owner)
+
+class SharedMemoryTransport(PriorityReceiver):
+  """A class to represent the transport of a node, which uses shared memory for peers on the same host.
+
+  The transport wraps the UDP socket of the node and can be used in its place.
+  Every node announces itself with a small presence segment named after its
+  port. When a message is sent to a known node on a local address that has a
+  presence segment, it is written to a ring buffer dedicated to that pair of
+  nodes instead of the socket; if the ring is full, if the node already has
+  max_rings outgoing rings or if there is no room left in /dev/shm, the socket
+  is used. The receiver drains the rings of the known local nodes (and of the
+  bootstrap node) into the prioritized inbox, so recvfrom returns both, with the
+  (address, port) of the sender. When the rings stay empty the reader sets the
+  sleeping flag of its presence segment and blocks on a doorbell socket, and a
+  writer that sees the flag sends an empty datagram to that socket to wake it.
+  A peer that restarts is noticed by the changed token of its segments, and its
+  rings are attached again. Any other attribute is taken from the socket.
+
+  Attributes:
+    node (Node): The node that owns the transport.
+    socket (socket): The UDP socket of the node.
+    port (int): The port of the node.
+    capacity (int): The size of each outgoing ring in bytes.
+    max_rings (int): The largest number of outgoing rings.
+    rings (dict): The outgoing ring and the presence segment of each local peer, keyed by port (None if the peer is not reachable through shared memory).
+    inbound (dict): The incoming ring of each local peer, keyed by port.
+    sent (int): The number of messages sent through shared memory.
+    received (int): The number of messages received through shared memory.
+
+  Methods:
+    start: Announce the node and start the socket and ring reader threads.
+    sendto: Send a message, through shared memory if the peer is local.
+    recvfrom: Receive the next message from the socket or the rings.
+    close: Remove the segments of the node.
+  """
+
+  local_addresses = ('127.0.0.1', 'localhost', '0.0.0.0')
+
+  def __init__(self, node, socket, capacity=1 << 18, max_rings=16, spin=0.002, discover_interval=0.5, **kwargs):
+    """Initializes a new instance of SharedMemoryTransport.
+
+    Args:
+      node (Node): The node that owns the transport.
+      socket (socket): The UDP socket of the node.
+      capacity (int, optional): The size of each outgoing ring in bytes. Defaults to 256 KiB.
+      max_rings (int, optional): The largest number of outgoing rings, the other peers use the socket. Defaults to 16.
+      spin (float, optional): How long the reader keeps polling the rings after the last message before it sleeps, in seconds. Defaults to 0.002.
+      discover_interval (float, optional): The time between two searches for new or restarted peers in seconds. Defaults to 0.5.
+      **kwargs: The options of PriorityReceiver (buffers, receivers, receive_buffer).
+    """
+
+    super().__init__(node, socket, **kwargs)
+    self.capacity = capacity
+    self.max_rings = max_rings
+    self.spin = spin
+    self.discover_interval = discover_interval
+
+    self.presence = None
+    self.doorbell = None
+    self.rings = {}
+    self.inbound = {}
+    self.sent = 0
+    self.received = 0
+
+    self.lock = Lock()
+
+  @staticmethod
+  def segment_name(source_port, destination_port=None):
+    if destination_port is None:
+      return f'blockchat-{source_port}'
+    return f'blockchat-{source_port}-{destination_port}'
+
+  def start(self):
+    """Announces the node with its presence segment, and starts the socket and ring reader threads."""
+
+    self.doorbell = sockets.socket(sockets.AF_INET, sockets.SOCK_DGRAM)
+    self.doorbell.bind(('127.0.0.1', 0))
+    self.doorbell.settimeout(self.discover_interval)
+    self.presence = Presence.create(self.segment_name(self.port), self.doorbell.getsockname()[1])
+    super().start()
+
+    thread = Thread(target=self.receive_rings)
+    thread.daemon = True
+    thread.start()
+
+  def is_local(self, address):
+    """Checks if an (address, port) is a known node on this host with a presence segment.
+
+    Args:
+      address (tuple): The (address, port).
+
+    Returns:
+      bool: True if the peer can be reached through shared memory.
+    """
+
+    host, port = address
+    if host not in self.local_addresses or self.node.blockchain is None:
+      return False
+
+    return any(node['port'] == port and node['address'] == host for node in self.node.blockchain.nodes)
+
+  def connect(self, port):
+    """Creates the outgoing ring to a local peer, unless the peer is not running, the node has max_rings rings or /dev/shm is full.
+
+    Args:
+      port (int): The port of the peer.
+
+    Returns:
+      tuple: The ring and the presence segment of the peer, or None if the socket must be used.
+    """
+
+    if sum(peer is not None for peer in self.rings.values()) >= self.max_rings:
+      return None
+
+    presence = Presence.attach(self.segment_name(port))
+    if presence is None:
+      return None
+
+    try:
+      ring = RingBuffer.create(self.segment_name(self.port, port), self.capacity)
+    except OSError:
+      presence.close()
+      return None
+
+    return ring, presence
+
+  def sendto(self, payload, address):
+    """Sends a message, through the ring of the peer if it is local, or through the socket otherwise.
+
+    Args:
+      payload (bytes): The message.
+      address (tuple): The (address, port) of the peer.
+    """
+
+    port = address[1]
+    with self.lock:
+      if port not in self.rings and self.is_local(address):
+        self.rings[port] = self.connect(port)
+
+      peer = self.rings.get(port)
+      if peer is not None and peer[0].write(payload):
+        self.sent += 1
+        doorbell = peer[1].port if peer[1].sleeping() else None
+      else:
+        peer = None
+
+    if peer is None:
+      return self.socket.sendto(payload, address)
+
+    if doorbell is not None:
+      self.socket.sendto(b'', ('127.0.0.1', doorbell))
+    return len(payload)
+
+  def discover(self):
+    """Attaches to the incoming rings of the bootstrap node and the known local nodes, and forgets the rings of peers that stopped or restarted."""
+
+    peers = [(self.node.bootstrap_address, self.node.bootstrap_port)]
+    if self.node.blockchain is not None:
+      peers += [(node['address'], node['port']) for node in self.node.blockchain.nodes]
+
+    for address, port in peers:
+      if port == self.port or address not in self.local_addresses:
+        continue
+
+      # A restarted peer recreates its ring under the same name, with a new token
+      ring = RingBuffer.attach(self.segment_name(port, self.port))
+      current = self.inbound.pop(port, None)
+      if current is not None and ring is not None and current[0].token == ring.token:
+        ring.close()
+        ring = current[0]
+      elif current is not None:
+        current[0].close()
+
+      if ring is not None:
+        self.inbound[port] = (ring, (address, port))
+
+    with self.lock:
+      for port, peer in list(self.rings.items()):
+        if peer is None:
+          continue
+
+        presence = Presence.attach(self.segment_name(port))
+        if presence is not None:
+          presence.close()
+        if presence is None or presence.token != peer[1].token:
+          # The peer stopped or restarted, connect again on the next message
+          peer[0].close()
+          peer[1].close()
+          del self.rings[port]
+
+  def drain(self):
+    # A message whose lane is full stays in its ring (and the ones after it),
+    # so the writer falls back to the socket once the ring fills up
+    count = 0
+    for ring, address in list(self.inbound.values()):
+      count += ring.read(lambda payload: self.enqueue(payload, address))
+
+    self.received += count
+    return count
+
+  def backlog(self):
+    return any(ring.pending() for ring, _ in list(self.inbound.values()))
+
+  def receive_rings(self):
+    """Moves the messages of the incoming rings to the inbox, until the transport is closed.
+
+    The reader polls the rings for spin seconds after the last message, then
+    sets the sleeping flag, checks the rings once more (a message written
+    before the flag was visible is not lost) and blocks on the doorbell socket
+    until a writer wakes it or the next search for peers is due. While the
+    inbox is too full to take the messages left in the rings, the reader
+    retries every spin seconds instead of sleeping.
+    """
+
+    discovered = 0.0
+    active = time.monotonic()
+    while True:
+      if time.monotonic() - discovered > self.discover_interval:
+        self.discover()
+        discovered = time.monotonic()
+
+      if self.drain():
+        active = time.monotonic()
+        continue
+
+      if time.monotonic() - active < self.spin:
+        time.sleep(0)
+        continue
+
+      if self.backlog():
+        time.sleep(self.spin)
+        continue
+
+      presence = self.presence
+      if presence is None:
+        return
+
+      presence.set_sleeping(True)
+      try:
+        if not self.drain():
+          self.doorbell.recv(1)
+      except sockets.timeout:
+        pass
+      except OSError:
+        return
+      finally:
+        if self.presence is not None:
+          presence.set_sleeping(False)
+
+      active = time.monotonic()
+
+  def close(self):
+    """Removes the presence segment and the outgoing rings of the node, and closes the doorbell and the extra receiver sockets."""
+
+    with self.lock:
+      for peer in self.rings.values():
+        if peer is not None:
+          peer[0].close()
+          peer[1].close()
+      self.rings = {}
+
+    presence, self.presence = self.presence, None
+    if self.doorbell is not None:
+      self.doorbell.close()
+    if presence is not None:
+      presence.close()
+
+    super().close()
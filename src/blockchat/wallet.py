@@ -19,11 +19,18 @@ class Wallet:
     get_address: Get the public key in PEM format.
   """
 
-  def __init__(self):
-    """Initializes a new instance of Wallet."""
+  def __init__(self, private_key=None):
+    """Initializes a new instance of Wallet.
 
-    self.balance = 0.0
-    self.private_key, self.public_key = self.generate_key()
+    Args:
+      private_key (RSAPrivateKey, optional): The private key of the wallet. Defaults to a new key.
+    """
+
+    self.balance = 0
+    if private_key is None:
+      self.private_key, self.public_key = self.generate_key()
+    else:
+      self.private_key, self.public_key = private_key, private_key.public_key()
 
   @staticmethod
   def generate_key():
@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+
+from queue import Empty
+from blockchat.admission import AdmissionQueue
+from blockchat.simulator import Simulator
+
+def test_senders_are_rate_limited_unless_exempt():
+  queue = AdmissionQueue(rate=1.0, burst=2.0)
+  assert [queue.put({'n': i}, 'a') for i in range(3)] == [True, True, False]
+  assert queue.shed_rate == 1
+
+  queue.exempt_sender('a')
+  assert all(queue.put({'n': i}, 'a') for i in range(3, 10))
+  assert queue.stats()['queued'] == 9
+
+def test_senders_are_served_round_robin_after_control_items():
+  queue = AdmissionQueue(sender_capacity=2)
+  for i in range(3):
+    queue.put(('a', i), 'a')
+  queue.put(('b', 0), 'b')
+  queue.put(None)
+
+  assert queue.shed_full == 1
+  assert [queue.get() for _ in range(4)] == [None, ('a', 0), ('b', 0), ('a', 1)]
+  try:
+    queue.get_nowait()
+    assert False
+  except Empty:
+    pass
+
+def deliveries(simulator, port, message_type):
+  events = [event for event in simulator.events if event[2] == simulator.deliver and event[3][0] == port and json.loads(event[3][1])['message_type'] == message_type]
+  for event in events:
+    simulator.events.remove(event)
+  return [event[3] for event in sorted(events)]
+
+def test_shed_transaction_is_not_pooled_and_its_nonce_gap_is_closed_by_its_sender():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  sender, receiver = simulator.nodes[0], simulator.nodes[2]
+  for i in range(3):
+    sender.execute_transaction(2, 'message', f'm{i}')
+
+  transactions = sorted((json.loads(args[1])['transaction'] for args in deliveries(simulator, 2, 'transaction')), key=lambda transaction: transaction['nonce'])
+  assert [transaction['nonce'] for transaction in transactions] == [0, 1, 2]
+
+  # The peer is not a validator for this queue, and its second transaction is shed
+  receiver.transaction_queue = AdmissionQueue(rate=0.001, burst=1.0)
+  expected = next(node for node in receiver.blockchain.nodes if node['key'] == transactions[0]['sender_address'])
+  receiver.receive_transaction(transactions[0], ('sim', 0))
+  simulator.drain(receiver)
+  assert not receiver.receive_transaction(transactions[1], ('sim', 0))
+  assert receiver.get_pooled_transaction(transactions[1]['sender_address'], 1) is None
+
+  receiver.transaction_queue.burst = 2.0
+  receiver.transaction_queue.buckets.clear()
+  receiver.receive_transaction(transactions[2], ('sim', 0))
+  simulator.drain(receiver)
+  assert expected['nonce'] == 1
+
+  # The held transaction makes the receiver ask the sender for the missing one
+  for args in deliveries(simulator, 0, 'get_transaction'):
+    simulator.deliver(*args)
+  for args in deliveries(simulator, 2, 'transaction'):
+    simulator.deliver(*args)
+
+  assert receiver.transaction_queue.shed_rate == 1
+  assert expected['nonce'] == 3
+  assert not receiver.held_transactions
+
+def test_forged_transactions_only_use_up_the_rate_of_their_peer():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  simulator.nodes[0].execute_transaction(2, 'message', 'hello')
+  transaction = json.loads(deliveries(simulator, 2, 'transaction')[0][1])['transaction']
+  receiver = simulator.nodes[2]
+  receiver.transaction_queue = AdmissionQueue(rate=0.001, burst=2.0)
+
+  # A flood that claims the sender of the transaction, from another peer
+  for i in range(10):
+    forged = {**transaction, 'uuid': f'forged-{i}'}
+    forged['hash'] = receiver.hash_transaction(forged)
+    receiver.receive_transaction(forged, ('evil', 1))
+
+  assert receiver.transaction_queue.shed_rate == 8
+  assert len(receiver.transaction_pool) == 2
+  assert receiver.receive_transaction(transaction, ('sim', 0))
@@ -0,0 +1,45 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from blockchat.amount import Amount
+
+def test_from_coins_is_exact():
+  assert Amount.from_coins(12) == 12000000
+  assert Amount.from_coins('12.5') == 12500000
+  assert Amount.from_coins(0.1) == 100000
+  assert Amount.from_coins('0.000001') == 1
+  assert Amount.from_coins(0.1) + Amount.from_coins(0.2) == Amount.from_coins('0.3')
+
+@pytest.mark.parametrize('value', ['abc', '', '0.0000001', 1e-7, 'inf', 'nan'])
+def test_from_coins_rejects_invalid_amounts(value):
+  with pytest.raises(ValueError):
+    Amount.from_coins(value)
+
+def test_format_drops_trailing_zeros():
+  assert Amount.format(12000000) == '12'
+  assert Amount.format(12500000) == '12.5'
+  assert Amount.format(1) == '0.000001'
+  assert Amount.format(0) == '0'
+  assert Amount.format(-1500000) == '-1.5'
+  assert Amount.format(Amount.from_coins('987.654321')) == '987.654321'
+
+def test_is_valid_accepts_only_ints():
+  assert Amount.is_valid(0)
+  assert Amount.is_valid(-5)
+  assert not Amount.is_valid(True)
+  assert not Amount.is_valid(1.0)
+  assert not Amount.is_valid('1')
+  assert not Amount.is_valid(None)
+
+def test_fee_is_rounded_down():
+  assert Amount.fee(Amount.from_coins(100), 300) == Amount.from_coins(3)
+  assert Amount.fee(33, 300) == 0
+  assert Amount.fee(34, 300) == 1
+  assert Amount.fee(Amount.from_coins(100), 0) == 0
+
+def test_message_cost_is_one_coin_per_character():
+  assert Amount.message_cost('') == 0
+  assert Amount.message_cost('hello') == Amount.from_coins(5)
@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+import heapq
+
+from urllib.request import urlopen
+
+from blockchat.amount import Amount
+from blockchat.api import QueryCache, QueryServer
+from blockchat.simulator import Simulator
+
+def test_views_are_cached_until_invalidated():
+  cache = QueryCache()
+  computed = []
+  compute = lambda: computed.append(1) or {'value': len(computed)}
+
+  assert cache.get(('a',), compute) == b'{"value": 1}'
+  assert cache.get(('a',), compute) == b'{"value": 1}'
+  assert (cache.hits, cache.misses) == (1, 1)
+
+  cache.invalidate()
+  assert cache.get(('a',), compute) == b'{"value": 2}'
+  assert (cache.version, cache.hits, cache.misses) == (1, 1, 2)
+
+  # Missing views are computed again on every request
+  assert cache.get(('b',), lambda: None) is None
+  assert cache.get(('b',), lambda: None) is None
+  assert cache.misses == 4
+
+def test_view_computed_during_an_invalidation_is_not_kept():
+  cache = QueryCache()
+
+  def compute():
+    # A block is registered while the view is computed from the old chain
+    cache.invalidate()
+    return {'stale': True}
+
+  assert cache.get(('a',), compute) == b'{"stale": true}'
+  assert cache.get(('a',), lambda: {'stale': False}) == b'{"stale": false}'
+  assert cache.hits == 0
+
+def settle(simulator):
+  while simulator.events:
+    simulator.now, _, callback, args = heapq.heappop(simulator.events)
+    callback(*args)
+
+def test_registered_block_invalidates_the_served_views():
+  simulator = Simulator(3, 1, seed=1)
+  simulator.setup()
+  sender, node = simulator.nodes[0], simulator.nodes[1]
+  server = QueryServer(node, '127.0.0.1', 0)
+  server.start()
+
+  try:
+    with urlopen(f'http://127.0.0.1:{server.port}/accounts', timeout=2.0) as response:
+      payload = response.read()
+    before = json.loads(payload)
+    assert server.handle('/accounts') == (200, payload)
+    assert server.cache.hits == 1
+
+    version = server.cache.version
+    simulator.execute(sender, 1, 'coins', Amount.from_coins(5))
+    settle(simulator)
+    assert server.cache.version > version
+
+    after = json.loads(server.handle('/accounts')[1])
+    assert after['block'] == before['block'] + 1
+    assert after['accounts'][1]['balance'] == before['accounts'][1]['balance'] + Amount.from_coins(5)
+    uuid = node.blockchain.get_last_block().transactions[0].uuid
+    assert json.loads(server.handle(f'/transactions/{uuid}')[1])['status'] == 'confirmed'
+    assert json.loads(server.handle('/blocks/latest')[1])['index'] == after['block']
+  finally:
+    server.close()
@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+
+import pytest
+
+from blockchat.block import Block
+from blockchat.node import Node
+from blockchat.simulator import Simulator
+
+def setup():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  simulator.nodes[0].execute_transaction(2, 'message', 'hello')
+  transaction = next(json.loads(args[1])['transaction'] for _, _, callback, args in simulator.events if callback == simulator.deliver and args[0] == 1)
+  simulator.events.clear()
+  return simulator, simulator.nodes[1], transaction
+
+def forge(node, transactions):
+  # Blocks are not signed, anyone can build one with the expected validator and hash
+  parent = node.blockchain.get_last_block()
+  block = {'index': 1, 'timestamp': parent.timestamp, 'validator': node.get_validator(1), 'transactions': transactions, 'previous_hash': parent.hash}
+  block['hash'] = Block.hash_header({**block, 'transactions': [transaction.get('hash') if isinstance(transaction, dict) else transaction for transaction in transactions]})
+  return block
+
+def rehash(transaction, **changes):
+  transaction = {**transaction, **changes}
+  transaction['hash'] = Node.hash_transaction(transaction)
+  return transaction
+
+@pytest.mark.parametrize('malform', [
+  lambda transaction: rehash(transaction, sender_address='garbage'),
+  lambda transaction: rehash(transaction, signature='not base64!'),
+  lambda transaction: rehash(transaction, nonce='0'),
+  lambda transaction: rehash(transaction, type_of_transaction='coins', value=-5),
+  lambda transaction: {key: value for key, value in transaction.items() if key != 'hash'},
+  lambda transaction: 'transaction',
+])
+def test_malformed_block_is_dropped_and_blocks_are_still_processed(malform):
+  simulator, node, transaction = setup()
+
+  node.receive_block(forge(node, [malform(transaction)]))
+  simulator.drain(node)
+  assert node.blockchain.block_index == 1
+
+  # The block handler survived, the same block with the valid transaction is registered
+  block = forge(node, [transaction])
+  node.receive_block(block)
+  simulator.drain(node)
+  assert node.blockchain.get_last_block().hash == block['hash']
+
+@pytest.mark.parametrize('block', [None, {}, {'index': '1'}, {'index': 1, 'validator': 0, 'transactions': 'x', 'previous_hash': '', 'timestamp': '', 'hash': ''}])
+def test_block_without_the_required_keys_is_not_queued(block):
+  simulator, node, _ = setup()
+
+  assert node.receive_block(block) is False
+  assert node.block_queue.empty()
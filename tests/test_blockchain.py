@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blockchat.amount import Amount
+from blockchat.block import Block
+from blockchat.blockchain import Blockchain
+from blockchat.transaction import Transaction
+
+def transaction(sender, receiver, kind, value):
+  return Transaction('u', sender, receiver, 't', kind, value, 0, None, hash='h')
+
+def chain():
+  nodes = [{'id': i, 'key': f'k{i}', 'address': 'x', 'port': i, 'stake': 0, 'initial_stake': Amount.from_coins(10), 'balance': 0, 'nonce': 0} for i in range(3)]
+  blockchain = Blockchain(5, chain=[], nodes=nodes)
+  blockchain.chain.append(Block(0, 0, [transaction('0', 'k0', 'coins', Amount.from_coins(300))], '1', timestamp='t', hash='g'))
+  blockchain.chain.append(Block(1, 0, [
+    transaction('k0', 'k1', 'coins', Amount.from_coins(100)),
+    transaction('k1', '0', 'stake', Amount.from_coins(40)),
+    transaction('k1', '0', 'stake', Amount.from_coins(25)),
+  ], 'g', timestamp='t', hash='b1'))
+  return blockchain
+
+def states(blockchain):
+  state, fees = blockchain.get_state()
+  by_key = {node['key']: {**node, 'balance': 0, 'stake': node['initial_stake']} for node in blockchain.nodes}
+  for block in blockchain.chain:
+    reference_fees = blockchain.apply_block(by_key, block)
+  return state, fees, list(by_key.values()), reference_fees
+
+def test_state_starts_from_the_declared_stakes():
+  state, _, reference, _ = states(chain())
+
+  assert [node['stake'] for node in state] == [Amount.from_coins(10), Amount.from_coins(25), Amount.from_coins(10)]
+  assert [node['stake'] for node in reference] == [node['stake'] for node in state]
+
+def test_stake_transactions_replace_the_stake():
+  state, fees, reference, reference_fees = states(chain())
+
+  assert fees == reference_fees == Amount.fee(Amount.from_coins(100), 300)
+  # Node 0 pays the fee of its transfer and validates the block, so it gets the fee back
+  assert state[0]['balance'] == Amount.from_coins(200)
+  assert state[1]['balance'] == Amount.from_coins(100)
+  assert [node['balance'] for node in reference] == [node['balance'] for node in state]
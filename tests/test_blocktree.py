@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blockchat.block import Block
+from blockchat.blocktree import BlockTree
+
+def block(index, hash, previous_hash):
+  return Block(index, 0, [], previous_hash, timestamp='t', hash=hash)
+
+def build(finality_depth=6):
+  # genesis <- a1 <- a2 <- a3
+  #         <- b1 <- b2
+  tree = BlockTree(block(0, 'g', '1'), {}, {}, finality_depth)
+  for index, hash, previous_hash in [(1, 'a1', 'g'), (2, 'a2', 'a1'), (3, 'a3', 'a2'), (1, 'b1', 'g'), (2, 'b2', 'b1')]:
+    tree.add(block(index, hash, previous_hash), {}, {})
+  return tree
+
+def test_best_tip_is_the_highest_block():
+  tree = build()
+  assert tree.best_tip() == 'a3'
+
+  tree.add(block(3, 'b3', 'b2'), {}, {})
+  assert tree.best_tip() == 'a3'
+
+  tree.add(block(4, 'b4', 'b3'), {}, {})
+  assert tree.best_tip() == 'b4'
+
+def test_ties_go_to_the_lowest_hash():
+  tree = BlockTree(block(0, 'g', '1'), {}, {})
+  tree.add(block(1, 'ff', 'g'), {}, {})
+  tree.add(block(1, '0a', 'g'), {}, {})
+  assert tree.best_tip() == '0a'
+
+def test_path_between_branches():
+  tree = build()
+  ancestor, rolled_back, applied = tree.path('a3', 'b2')
+
+  assert ancestor == 'g'
+  assert [b.hash for b in rolled_back] == ['a3', 'a2', 'a1']
+  assert [b.hash for b in applied] == ['b1', 'b2']
+
+def test_prune_drops_branches_behind_finality():
+  tree = build(finality_depth=2)
+  dropped = tree.prune('a3')
+
+  assert tree.root == 'a1'
+  assert dropped == 2
+  assert 'b1' not in tree and 'b2' not in tree
+  assert tree.get('a1')['parent'] is None
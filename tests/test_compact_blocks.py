@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+
+from blockchat.simulator import Simulator
+
+def sent(simulator, port, message_type):
+  messages = [json.loads(args[1]) for _, _, callback, args in simulator.events if callback == simulator.deliver and args[0] == port]
+  simulator.events.clear()
+  return [message for message in messages if message['message_type'] == message_type]
+
+def setup():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  sender, receiver = simulator.nodes[0], simulator.nodes[2]
+  sender.execute_transaction(2, 'message', 'hello')
+  transaction = sent(simulator, 2, 'transaction')[0]['transaction']
+
+  compact_block = {'index': 1, 'timestamp': '', 'validator': 0, 'transactions': [transaction['hash']], 'previous_hash': '', 'hash': 'block'}
+  blocks = []
+  receiver.receive_block = blocks.append
+  return simulator, receiver, transaction, compact_block, blocks
+
+def test_missing_transactions_are_requested_again_then_the_block():
+  simulator, receiver, transaction, compact_block, blocks = setup()
+
+  receiver.receive_compact_block(compact_block, ('sim', 0))
+  assert sent(simulator, 0, 'get_block_transactions')[0]['hashes'] == [transaction['hash']]
+
+  # A duplicate right away does not repeat the request, a later one does
+  receiver.receive_compact_block(compact_block, ('sim', 1))
+  assert not sent(simulator, 1, 'get_block_transactions')
+  simulator.now += receiver.partial_retry
+  receiver.receive_compact_block(compact_block, ('sim', 1))
+  assert sent(simulator, 1, 'get_block_transactions')
+
+  for _ in range(receiver.partial_attempts):
+    simulator.now += receiver.partial_retry
+    receiver.repair_partial_blocks()
+  assert sent(simulator, 1, 'get_block') == [{'message_type': 'get_block', 'hash': 'block'}]
+  assert not receiver.partial_blocks and not blocks
+
+def test_supplied_transactions_complete_the_block_and_are_queued():
+  simulator, receiver, transaction, compact_block, blocks = setup()
+
+  receiver.receive_compact_block(compact_block, ('sim', 0))
+  receiver.receive_block_transactions({'block_hash': 'block', 'transactions': [transaction]})
+
+  assert [block['transactions'] for block in blocks] == [[transaction]]
+  assert not receiver.partial_blocks
+  assert receiver.transaction_queue.stats()['queued'] == 1
+
+def test_transactions_evicted_from_the_pool_are_requested_again():
+  simulator, receiver, transaction, compact_block, blocks = setup()
+  receiver.pool_transaction(transaction)
+  receiver.partial_blocks['block'] = {'block': compact_block, 'missing': set(), 'address': ('sim', 0), 'received_at': 0.0, 'requested_at': None, 'attempts': 0}
+  receiver.transaction_pool.clear()
+
+  receiver.complete_block('block')
+  assert not blocks
+  assert sent(simulator, 0, 'get_block_transactions')[0]['hashes'] == [transaction['hash']]
@@ -0,0 +1,98 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import struct
+import hashlib
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from blockchat.amount import Amount
+from blockchat.block import Block
+from blockchat.blockchain import Blockchain
+from blockchat.export import ChainExporter
+from blockchat.transaction import Transaction
+
+start = datetime(2024, 1, 1)
+
+def transaction(sender, receiver, kind, value):
+  return Transaction('u', f'k{sender}', f'k{receiver}' if kind == 'coins' else '0', 't', kind, value, 0, None, hash='h')
+
+def digest(name):
+  return hashlib.sha256(name.encode()).hexdigest()
+
+def block(index, validator, transactions, branch='a'):
+  return Block(index, validator, transactions, 'p', timestamp=(start + timedelta(seconds=index)).isoformat(), hash=digest(f'{branch}{index}'))
+
+def chain():
+  nodes = [{'id': i, 'key': f'k{i}', 'address': 'x', 'port': i, 'stake': 0, 'balance': 0, 'nonce': 0} for i in range(3)]
+  blockchain = Blockchain(5, chain=[], nodes=nodes)
+  blockchain.chain = [
+    block(0, 0, [transaction('g', 0, 'coins', Amount.from_coins(3000))], 'g'),
+    block(1, 1, [transaction(0, 1, 'coins', Amount.from_coins(100)), transaction(1, 2, 'message', 'hello')]),
+    block(2, 2, [transaction(2, 0, 'stake', Amount.from_coins(10))]),
+    block(3, 1, [transaction(1, 0, 'coins', Amount.from_coins(50)), transaction(0, 2, 'coins', Amount.from_coins(10))]),
+  ]
+  return blockchain
+
+def test_export_is_incremental(tmp_path):
+  blockchain = chain()
+  exporter = ChainExporter(str(tmp_path))
+  assert exporter.export(blockchain, until=2) == 2
+  assert exporter.export(blockchain) == 2
+  assert exporter.export(blockchain) == 0
+
+  # A new exporter picks up the published row counts
+  assert ChainExporter(str(tmp_path)).meta['blocks'] == 4
+  assert ChainExporter(str(tmp_path)).meta['transactions'] == 6
+
+def test_export_load_and_summary(tmp_path):
+  pytest.importorskip('numpy')
+  blockchain = chain()
+  ChainExporter(str(tmp_path)).export(blockchain)
+
+  columns = ChainExporter.load(str(tmp_path))
+  assert columns['blocks']['index'].tolist() == [0, 1, 2, 3]
+  assert columns['blocks']['first_transaction'].tolist() == [0, 1, 3, 4]
+  assert columns['blocks']['timestamp'][1] - columns['blocks']['timestamp'][0] == 1.0
+  assert columns['transactions']['sender'].tolist() == [-1, 0, 1, 2, 1, 0]
+
+  summary = ChainExporter.summary(columns)
+  assert summary['blocks'] == 4 and summary['transactions'] == 6
+  # The genesis transfer has no known sender and pays no fee
+  fees = Amount.fee(Amount.from_coins(100), 300) + Amount.message_cost('hello')
+  later = Amount.fee(Amount.from_coins(50), 300) + Amount.fee(Amount.from_coins(10), 300)
+  assert summary['validators'] == {0: {'blocks': 1, 'fees': 0}, 1: {'blocks': 2, 'fees': fees + later}, 2: {'blocks': 1, 'fees': 0}}
+  assert summary['fees'] == fees + later
+  assert summary['types'] == {
+    'coins': {'count': 4, 'volume': Amount.from_coins(3160)},
+    'message': {'count': 1, 'volume': Amount.message_cost('hello')},
+    'stake': {'count': 1, 'volume': Amount.from_coins(10)},
+  }
+
+def test_export_truncates_the_blocks_replaced_by_a_reorganization(tmp_path):
+  blockchain = chain()
+  exporter = ChainExporter(str(tmp_path))
+  exporter.export(blockchain)
+
+  # The chain switches to a branch that forks after block 1
+  blockchain.chain[2:] = [
+    block(2, 0, [], 'b'),
+    block(3, 2, [transaction(0, 1, 'coins', Amount.from_coins(1))], 'b'),
+    block(4, 1, [transaction(1, 0, 'message', 'hi'), transaction(2, 1, 'coins', Amount.from_coins(2))], 'b'),
+  ]
+  assert exporter.export(blockchain) == 3
+  assert exporter.meta['blocks'] == 5 and exporter.meta['transactions'] == 6
+
+  assert [exporter.read('blocks', 'hash', row).decode() for row in range(5)] == [digest(name) for name in ['g0', 'a1', 'b2', 'b3', 'b4']]
+  assert [exporter.read('blocks', 'first_transaction', row) for row in range(5)] == [0, 1, 3, 3, 4]
+  assert [exporter.read('transactions', 'block', row) for row in range(6)] == [0, 1, 1, 3, 4, 4]
+  for column, code in ChainExporter.transaction_columns.items():
+    assert os.path.getsize(exporter.path('transactions', column)) == 6 * struct.calcsize(code)
+
+  # A shorter branch drops the rows past its end
+  del blockchain.chain[3:]
+  assert exporter.export(blockchain) == 0
+  assert exporter.meta['blocks'] == 3 and exporter.meta['transactions'] == 3
@@ -0,0 +1,37 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from types import SimpleNamespace
+
+from blockchat.gossip import Gossip
+
+class Peer:
+  def __init__(self):
+    self.id = 0
+    self.blockchain = SimpleNamespace(nodes=[])
+    self.delivered = []
+
+  def deliver(self, message, address=None):
+    self.delivered.append(message)
+
+def transaction(uuid):
+  return {'message_type': 'transaction', 'transaction': {'uuid': uuid, 'hash': 'claimed'}}
+
+def test_duplicates_are_detected_by_payload():
+  peer = Peer()
+  gossip = Gossip(peer, workers=0)
+
+  assert gossip.receive({'message_type': 'gossip', 'message': transaction('a')}, None)
+  assert not gossip.receive({'message_type': 'gossip', 'message': transaction('a')}, None)
+  assert len(peer.delivered) == 1
+
+def test_claimed_id_cannot_censor_another_message():
+  peer = Peer()
+  gossip = Gossip(peer, workers=0)
+
+  genuine = transaction('genuine')
+  forged = transaction('forged')
+  assert gossip.receive({'message_type': 'gossip', 'id': Gossip.message_id(genuine), 'message': forged}, None)
+  assert gossip.receive({'message_type': 'gossip', 'id': Gossip.message_id(genuine), 'message': genuine}, None)
+  assert peer.delivered == [forged, genuine]
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import builtins
+
+from threading import Thread
+
+from blockchat import history as history_module
+from blockchat.history import History
+
+def fill(history, count):
+  for i in range(count):
+    history.add('coins', i, f'2024-01-01T00:00:{i:02d}', sender=i % 3, receiver=(i + 1) % 3, uuid=f'tx-{i}')
+
+def test_query_pages_through_spill_file():
+  history = History(max_entries=5)
+  fill(history, 20)
+
+  assert history.spilled == 15
+  assert len(history.entries) == 5
+
+  pages = [history.query(page=page, page_size=6) for page in range(4)]
+  values = [entry['value'] for page in pages for entry in page]
+  assert values == list(range(19, -1, -1))
+
+  account = history.query(account=0, page_size=100)
+  assert [entry['value'] for entry in account] == [i for i in range(19, -1, -1) if 0 in (i % 3, (i + 1) % 3)]
+
+  history.close()
+
+def test_spilled_pending_entries_are_confirmed():
+  history = History(max_entries=3)
+  fill(history, 6)
+
+  history.confirm(7, ['tx-0', 'tx-1', 'tx-5'])
+  assert sorted(entry['value'] for entry in history.query(block=7)) == [0, 1, 5]
+
+  history.confirm(None, ['tx-1'])
+  assert sorted(entry['value'] for entry in history.query(block=7)) == [0, 5]
+
+  history.close()
+
+def test_close_removes_temporary_spill_file():
+  history = History(max_entries=1)
+  fill(history, 3)
+
+  file_path = history.file_path
+  assert os.path.exists(file_path)
+
+  history.close()
+  assert not os.path.exists(file_path)
+
+def test_query_reads_the_spill_file_while_it_is_closed(monkeypatch):
+  history = History(max_entries=2)
+  fill(history, 6)
+
+  # Close the history from another thread right when the query opens the spill file
+  def open_while_closing(*args):
+    closer = Thread(target=history.close)
+    closer.start()
+    closer.join(0.1)
+    return builtins.open(*args)
+  monkeypatch.setattr(history_module, 'open', open_while_closing, raising=False)
+
+  file_path = history.file_path
+  assert [entry['value'] for entry in history.query(page_size=6)] == list(range(5, -1, -1))
+  monkeypatch.undo()
+
+  history.close()
+  assert not os.path.exists(file_path)
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import random
+
+import pytest
+
+from blockchat.amount import Amount
+from blockchat.block import Block
+from blockchat.blockchain import Blockchain
+from blockchat.transaction import Transaction
+
+pytest.importorskip('numpy')
+from blockchat.ledger import Ledger
+
+def random_chain(seed, nodes_count=20, blocks_count=300):
+  generator = random.Random(seed)
+  nodes = [
+    {'id': i, 'key': f'k{i}', 'address': 'x', 'port': i, 'stake': 0, 'initial_stake': generator.choice([0, Amount.from_coins(10)]), 'balance': 0, 'nonce': 0}
+    for i in range(nodes_count)
+  ]
+  blockchain = Blockchain(5, chain=[], nodes=nodes)
+  blockchain.chain.append(Block(0, 0, [Transaction('g', '0', 'k0', 't', 'coins', Amount.from_coins(1000) * nodes_count, 0, None)], '1', timestamp='t', hash='g'))
+
+  for index in range(1, blocks_count + 1):
+    transactions = []
+    for _ in range(generator.randint(0, 10)):
+      sender, receiver = generator.randrange(nodes_count), generator.randrange(nodes_count)
+      kind = generator.choice(['coins', 'coins', 'message', 'stake'])
+      if kind == 'message':
+        value = generator.choice(['', 'hi', 'hello world'])
+      else:
+        value = Amount.from_coins(round(generator.uniform(0.1, 50), generator.randint(0, 6)))
+      transactions.append(Transaction('u', f'k{sender}', f'k{receiver}' if kind == 'coins' else '0', 't', kind, value, 0, None, hash='h'))
+
+    # Some blocks have a validator that is not a node, their fees are not credited
+    blockchain.chain.append(Block(index, generator.randrange(nodes_count + 1), transactions, 'p', timestamp='t', hash='h'))
+
+  return blockchain
+
+def replay(blockchain):
+  state = {node['key']: {**node, 'balance': 0, 'stake': node['initial_stake']} for node in blockchain.nodes}
+  fees = [blockchain.apply_block(state, block) for block in blockchain.chain]
+  return list(state.values()), fees
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_apply_blocks_matches_the_replay_block_by_block(seed):
+  blockchain = random_chain(seed)
+  reference, reference_fees = replay(blockchain)
+
+  ledger = Ledger(blockchain.nodes, blockchain.fee_rate)
+  fees = ledger.apply_blocks(blockchain.chain)
+  state = ledger.get_state()
+
+  assert fees.tolist() == reference_fees
+  assert [node['balance'] for node in state] == [node['balance'] for node in reference]
+  assert [node['stake'] for node in state] == [node['stake'] for node in reference]
+
+def test_apply_blocks_in_batches_matches_one_batch():
+  blockchain = random_chain(4)
+
+  whole = Ledger(blockchain.nodes, blockchain.fee_rate)
+  whole.apply_blocks(blockchain.chain)
+
+  batched = Ledger(blockchain.nodes, blockchain.fee_rate)
+  batched.apply_blocks(blockchain.chain[:100])
+  for block in blockchain.chain[100:]:
+    batched.apply_block(block)
+
+  assert batched.get_state() == whole.get_state()
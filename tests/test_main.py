@@ -8,6 +8,7 @@ import multiprocessing
 from blockchat.bootstrap import start_bootstrap
 from blockchat.client import start_node
 from blockchat.node import Node, Bootstrap
+from blockchat.amount import Amount
 
 from blockchat.util import termcolor
 
@@ -19,6 +20,19 @@ def main():
   parser.add_argument("--port", "-p", type=int, default=5555, help="Bootstrap port")
   parser.add_argument("--verbose", "-v", action="store_true", help="Increase output verbosity")
   parser.add_argument("--debug", "-d", action="store_true", help="Enable debug mode")
+  parser.add_argument("--trace", type=float, default=0.0, help="Fraction of transactions to trace")
+  parser.add_argument("--seal", type=float, default=0.0, help="Maximum block age in seconds (0 seals only at capacity)")
+  parser.add_argument("--max-capacity", type=int, default=None, help="Upper bound of the adaptive block capacity")
+  parser.add_argument("--gossip", type=int, default=0, help="Gossip fanout (0 sends to every node)")
+  parser.add_argument("--multicast", type=str, default=None, help="Multicast group (address:port) for transactions and blocks")
+  parser.add_argument("--shm", action="store_true", help="Use shared memory instead of UDP between the local nodes")
+  parser.add_argument("--receivers", type=int, default=1, help="Number of receiver threads sharing the port of each node (SO_REUSEPORT)")
+  parser.add_argument("--rcvbuf", type=int, default=0, help="Kernel receive buffer size of each receiver socket in bytes (0 keeps the system default)")
+  parser.add_argument("--light", type=int, default=0, help="Number of nodes that run as light clients")
+  parser.add_argument("--api-port", type=int, default=None, help="Port of the HTTP query server of the bootstrap node, the other nodes use the next ports (disabled by default)")
+  parser.add_argument("--replay-window", type=int, default=65536, help="Number of received transaction keys the replay filter keeps exactly")
+  parser.add_argument("--replay-capacity", type=int, default=262144, help="Number of transaction keys per Bloom filter generation of the replay filter")
+  parser.add_argument("--replay-fpr", type=float, default=0.001, help="False-positive rate of each Bloom filter generation of the replay filter")
   args = parser.parse_args()
 
   nodes = args.nodes
@@ -27,13 +41,26 @@ def main():
   port = args.port
   verbose = args.verbose
   debug = args.debug
+  trace_rate = args.trace
+  gossip_fanout = args.gossip
+  multicast_group = args.multicast
+  shared_memory = args.shm
+  receivers = args.receivers
+  receive_buffer = args.rcvbuf
+  api_port = args.api_port
+  light_count = args.light
+  replay_window = args.replay_window
+  replay_capacity = args.replay_capacity
+  replay_false_positive_rate = args.replay_fpr
+  seal_interval = args.seal
+  max_capacity = args.max_capacity
 
   try:
     # Start the bootstrap process
-    bootstrap = Bootstrap(address, port, verbose, debug, stake=10.0)
+    bootstrap = Bootstrap(address, port, verbose, debug, stake=Amount.from_coins(10), trace_rate=trace_rate, gossip_fanout=gossip_fanout, multicast_group=multicast_group, shared_memory=shared_memory, receivers=receivers, receive_buffer=receive_buffer, api_port=api_port, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate)
     bootstrap_process = multiprocessing.Process(
       target=start_bootstrap,
-      args=(nodes, capacity, bootstrap, None, True)
+      args=(nodes, capacity, bootstrap, None, True, max_capacity, seal_interval)
     )
     processes = [bootstrap_process]
     print(termcolor.bold('[INIT]'), termcolor.magenta('Starting bootstrap process'))
@@ -41,7 +68,7 @@ def main():
 
     # Start the client processes
     for i in range(nodes - 1):
-      node = Node(address, port, verbose, debug, stake=10.0)
+      node = Node(address, port, verbose, debug, stake=Amount.from_coins(10), trace_rate=trace_rate, gossip_fanout=gossip_fanout, multicast_group=multicast_group, shared_memory=shared_memory, receivers=receivers, receive_buffer=receive_buffer, api_port=api_port + i + 1 if api_port is not None else None, light=i >= nodes - 1 - light_count, replay_window=replay_window, replay_capacity=replay_capacity, replay_false_positive_rate=replay_false_positive_rate)
       node_process = multiprocessing.Process(
         target=start_node,
         args=(nodes, capacity, node, None, True)
@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import glob
+import signal
+
+import pytest
+
+from threading import Thread, Event, get_ident, enumerate as enumerate_threads
+from blockchat.profiler import Profiler
+
+def busy(stop):
+  while not stop.is_set():
+    stop.wait(0.001)
+
+def test_sample_collapses_the_stacks_of_the_other_threads():
+  stop = Event()
+  thread = Thread(target=busy, args=(stop,), name='worker')
+  thread.start()
+
+  stacks = {}
+  Profiler.sample(stacks)
+  stop.set()
+  thread.join()
+
+  worker = [stack for stack in stacks if stack.startswith('worker;')]
+  assert len(worker) == 1 and 'busy (test_profiler.py)' in worker[0]
+  assert all(count == 1 for count in stacks.values())
+  assert not any('sample (profiler.py)' in stack for stack in stacks)
+
+def test_one_window_at_a_time_writes_the_folded_stacks(tmp_path):
+  profiler = Profiler(interval=0.001)
+  done = Event()
+  result = []
+
+  def callback(file_path, samples):
+    result.append((file_path, samples))
+    done.set()
+
+  path = str(tmp_path / 'profile.folded')
+  assert profiler.start(0.05, path, callback)
+  assert not profiler.start(0.05, str(tmp_path / 'other.folded'))
+  assert done.wait(2.0)
+
+  assert result[0][0] == path and result[0][1] > 0
+  assert not profiler.running and not os.path.exists(tmp_path / 'other.folded')
+  with open(path) as f:
+    lines = f.read().splitlines()
+  assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason='SIGUSR1 is not available')
+def test_sigusr1_starts_a_window_from_the_watcher_thread(tmp_path, monkeypatch):
+  previous = signal.getsignal(signal.SIGUSR1)
+  profiler = Profiler(interval=0.001)
+  done = Event()
+  starters = []
+
+  def start(self, duration, file_path, callback):
+    starters.append(get_ident())
+    return Profiler.run(self, duration, file_path, callback)
+
+  monkeypatch.setattr(Profiler, 'start', start)
+  prefix = str(tmp_path / 'profile')
+  try:
+    assert profiler.install_signal_handler(0.02, prefix, lambda file_path, samples: done.set())
+    existing = {thread.ident for thread in enumerate_threads()}
+
+    for _ in range(2):
+      done.clear()
+      os.kill(os.getpid(), signal.SIGUSR1)
+      assert done.wait(2.0)
+  finally:
+    signal.signal(signal.SIGUSR1, previous)
+
+  # The handler does not start a thread, the watcher started by install_signal_handler does the work
+  assert len(starters) == 2 and starters[0] == starters[1] and starters[0] in existing
+  assert glob.glob(f'{prefix}-{os.getpid()}-*.folded')
@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+
+import pytest
+
+from blockchat.node import Node
+from blockchat.replay import ReplayFilter
+from blockchat.simulator import Simulator
+
+def test_keys_leaving_the_window_are_confirmed():
+  confirmed = {'old-0'}
+  replay = ReplayFilter(window=2, capacity=100, confirm=lambda key: key in confirmed)
+  for i in range(4):
+    assert not replay.contains(f'old-{i}')
+    replay.add(f'old-{i}')
+
+  assert replay.contains('old-3')
+  assert replay.contains('old-0')
+  assert not replay.contains('old-1')
+  assert replay.duplicates == 2 and replay.false_positives == 1
+
+def test_node_sizes_its_replay_filter():
+  node = Node(verbose=False, replay_window=16, replay_capacity=1000, replay_false_positive_rate=0.01)
+  assert (node.replay_filter.window, node.replay_filter.capacity, node.replay_filter.false_positive_rate) == (16, 1000, 0.01)
+  assert node.replay_filter.current.size < ReplayFilter().current.size
+
+@pytest.mark.parametrize('window, capacity, false_positive_rate', [(0, 100, 0.01), (10, 0, 0.01), (10, 100, 0), (10, 100, 1)])
+def test_invalid_replay_filter_sizes_are_rejected(window, capacity, false_positive_rate):
+  with pytest.raises(ValueError):
+    ReplayFilter(window, capacity, false_positive_rate)
+
+def test_only_valid_transactions_are_recorded():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  sender, receiver = simulator.nodes[0], simulator.nodes[2]
+  sender.execute_transaction(2, 'message', 'hello')
+
+  payload = next(args[1] for _, _, callback, args in simulator.events if callback == simulator.deliver and args[0] == 2)
+  transaction = json.loads(payload)['transaction']
+
+  # A forged copy with the same uuid does not make the real transaction a duplicate
+  forged = {**transaction, 'value': 'forged'}
+  receiver.receive_transaction(forged)
+  simulator.drain(receiver)
+  forged['hash'] = receiver.hash_transaction(forged)
+  receiver.receive_transaction(forged)
+  simulator.drain(receiver)
+  assert receiver.replay_filter.duplicates == 0
+
+  receiver.receive_transaction(transaction)
+  simulator.drain(receiver)
+  assert transaction['hash'] in {pending.hash for pending in receiver.current_block}
+
+  receiver.receive_transaction(transaction)
+  assert receiver.replay_filter.duplicates == 1
+  assert receiver.is_known_transaction(transaction['uuid'])
@@ -0,0 +1,176 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+import heapq
+
+from blockchat.block import BlockAssembler
+from blockchat.simulator import Simulator
+
+def test_network_commits_every_transaction():
+  simulator = Simulator(8, 5, seed=3)
+  metrics = simulator.run(30.0)
+
+  # A block may still be in flight when the run stops
+  assert metrics['height_spread'] <= 1
+  assert metrics['committed_transactions'] >= 0.95 * metrics['executed']
+
+def test_lost_transactions_do_not_stall_their_senders():
+  # With 2% loss some nodes miss transactions (nonce gaps) and blocks, which
+  # the committed nonces, the hold timeout and the block repair must close
+  simulator = Simulator(8, 5, seed=3, loss=0.02)
+  metrics = simulator.run(60.0)
+
+  assert metrics['lost'] > 0
+  assert metrics['committed_transactions'] >= 0.9 * metrics['executed']
+  assert all(len(node.held_transactions) < 5 for node in simulator.nodes)
+
+def test_missing_transaction_is_fetched_from_its_sender():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  sender, receiver = simulator.nodes[0], simulator.nodes[2]
+  for i in range(2):
+    sender.execute_transaction(2, 'message', f'm{i}')
+
+  # The first transaction is lost on its way to the receiver
+  simulator.events = [event for event in simulator.events if event[3][0] != 2 or json.loads(event[3][1])['transaction']['nonce'] == 1]
+  heapq.heapify(simulator.events)
+  while simulator.events:
+    simulator.now, _, callback, args = heapq.heappop(simulator.events)
+    callback(*args)
+
+  assert not receiver.held_transactions
+  assert [transaction.nonce for transaction in receiver.current_block if transaction.sender_address == sender.wallet.get_address()] == [0, 1]
+
+def test_gossip_network_repairs_lost_messages():
+  simulator = Simulator(8, 5, seed=3, loss=0.02, gossip_fanout=2)
+  metrics = simulator.run(60.0)
+
+  assert metrics['lost'] > 0
+  assert metrics['invalid'] == 0
+  assert metrics['committed_transactions'] >= 0.9 * metrics['executed']
+
+def test_multicast_network_repairs_lost_messages():
+  simulator = Simulator(8, 5, seed=3, loss=0.02, multicast=True)
+  metrics = simulator.run(30.0)
+
+  # Every transaction and block leaves the link of its sender once
+  assert metrics['datagrams'] < metrics['executed'] * 7
+  assert metrics['lost'] > 0
+  assert metrics['invalid'] == 0
+  assert metrics['committed_transactions'] >= 0.9 * metrics['executed']
+
+def test_blocks_are_sealed_by_age():
+  # Too few transactions to fill blocks, they are committed only when sealed by age
+  simulator = Simulator(4, 5, seed=3, transaction_rate=0.1, seal_interval=1.0)
+  metrics = simulator.run(30.0)
+
+  assert metrics['committed_transactions'] >= 0.9 * metrics['executed']
+  assert any(len(block.transactions) < 5 for block in simulator.nodes[0].blockchain.chain[1:])
+
+def test_only_the_validator_seals_by_age():
+  simulator = Simulator(4, 5, seed=3, seal_interval=1.0)
+  simulator.setup()
+  simulator.nodes[0].execute_transaction(1, 'message', 'm')
+  simulator.drain(simulator.nodes[0])
+  while simulator.events:
+    simulator.now, _, callback, args = heapq.heappop(simulator.events)
+    callback(*args)
+
+  simulator.now += 2.0
+  validator = simulator.nodes[0].get_validator(1)
+  assert all(node.current_block for node in simulator.nodes)
+  assert [node.is_block_due() for node in simulator.nodes] == [node.id == validator for node in simulator.nodes]
+
+  # Without a seal interval, blocks are sealed only when full
+  for node in simulator.nodes:
+    node.blockchain.seal_interval = 0.0
+  assert not any(node.is_block_due() for node in simulator.nodes)
+
+def test_validator_seals_the_block_it_assembled(monkeypatch):
+  built = []
+  build = BlockAssembler.build
+  monkeypatch.setattr(BlockAssembler, 'build', lambda self, *args: built.append(build(self, *args)) or built[-1])
+
+  simulator = Simulator(8, 5, seed=1, transaction_rate=5.0)
+  metrics = simulator.run(5.0)
+
+  # The assembled block is used unless other transactions were sealed, and the other nodes accept it
+  assembled = [block for block in built if block is not None]
+  assert len(assembled) >= 0.7 * len(built)
+  node = simulator.nodes[0]
+  assert all(block.hash in node.blockchain.block_hashes or block.hash in node.block_tree for block in assembled[:-1])
+  assert metrics['committed_transactions'] >= 0.95 * metrics['executed']
+
+def test_light_clients_follow_the_chain():
+  simulator = Simulator(8, 5, seed=3, light_nodes=2)
+  metrics = simulator.run(30.0)
+
+  assert metrics['light_nodes'] == 2
+  assert metrics['max_light_lag'] <= 1
+  assert metrics['light_balance_errors'] == 0
+  assert metrics['committed_transactions'] >= 0.95 * metrics['executed']
+  assert all(node.nonce > 0 for node in simulator.nodes[-2:])
+
+def test_light_client_keeps_headers_that_arrive_out_of_order():
+  simulator = Simulator(3, 1, seed=1, light_nodes=1)
+  simulator.setup()
+  light = simulator.nodes[2]
+  for _ in range(3):
+    simulator.nodes[0].execute_transaction(1, 'message', 'm')
+
+  # Hold back the headers sent to the light client, then deliver them in reverse order
+  held = []
+  while simulator.events:
+    simulator.now, _, callback, args = heapq.heappop(simulator.events)
+    if callback == simulator.deliver and args[0] == light.id:
+      held.append(args)
+    else:
+      callback(*args)
+  for args in reversed(held):
+    simulator.deliver(*args)
+
+  assert len(held) == 3
+  assert [header['hash'] for header in light.headers.headers] == [block.hash for block in simulator.nodes[0].blockchain.chain]
+  assert not light.light_orphans
+
+def test_light_client_checks_the_headers_against_their_hash_and_peer():
+  simulator = Simulator(3, 1, seed=1, light_nodes=1)
+  simulator.setup()
+  light = simulator.nodes[2]
+  simulator.nodes[0].execute_transaction(1, 'message', 'm')
+  simulator.drain(simulator.nodes[0])
+
+  held = []
+  while simulator.events:
+    simulator.now, _, callback, args = heapq.heappop(simulator.events)
+    if callback == simulator.deliver and args[0] == light.id:
+      held.append(args)
+    else:
+      callback(*args)
+  port, payload, address = held[0]
+  message = json.loads(payload)
+  assert message['block'] is None and len(message['header']['transactions']) == 1
+
+  # A header without the transactions of its block, one from another node, and one that withholds a pending transaction
+  omitted = {**message, 'header': {**message['header'], 'transactions': []}}
+  simulator.deliver(port, json.dumps(omitted).encode(), address)
+  simulator.deliver(port, payload, ('sim', 9))
+  light.light_pending[message['header']['transactions'][0]] = 1
+  simulator.deliver(port, payload, address)
+  assert len(light.headers.headers) == 1
+
+  del light.light_pending[message['header']['transactions'][0]]
+  simulator.deliver(port, payload, address)
+  assert light.headers.tip()['hash'] == simulator.nodes[0].blockchain.get_last_block().hash
+
+def test_same_seed_gives_the_same_run():
+  runs = []
+  for _ in range(2):
+    simulator = Simulator(8, 3, seed=5, loss=0.05, reorder=0.1)
+    metrics = simulator.run(15.0)
+    metrics.pop('wall_time')
+    runs.append((metrics, [block.hash for block in simulator.nodes[0].blockchain.chain]))
+
+  assert runs[0] == runs[1]
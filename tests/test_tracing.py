@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+import uuid
+
+from blockchat.simulator import Simulator
+from blockchat.tracing import Tracer
+
+def test_sampling_follows_the_uuid_and_the_rate():
+  uuids = [str(uuid.UUID(int=i)) for i in range(2000)]
+  first, second = Tracer(0.25), Tracer(0.25)
+
+  # Every node traces the same transactions
+  sampled = [key for key in uuids if first.is_sampled(key)]
+  assert sampled == [key for key in uuids if second.is_sampled(key)]
+  assert 400 < len(sampled) < 600
+
+  assert all(Tracer(1.0).is_sampled(key) for key in uuids)
+  assert not any(Tracer(0.0).is_sampled(key) for key in uuids[:100])
+
+def test_record_keeps_the_sampled_spans_up_to_the_limit():
+  tracer = Tracer(0.5, max_spans=3)
+  sampled = next(str(uuid.UUID(int=i)) for i in range(100) if tracer.is_sampled(str(uuid.UUID(int=i))))
+  skipped = next(str(uuid.UUID(int=i)) for i in range(100) if not tracer.is_sampled(str(uuid.UUID(int=i))))
+
+  tracer.record(skipped, 1, 'execute', 1.0)
+  assert not tracer.spans
+
+  for stage, timestamp in [('execute', 1.0), ('broadcast', 2.0), ('receive', 3.0), ('dequeue', 4.0)]:
+    tracer.record(sampled, 1, stage, timestamp)
+  assert [span['stage'] for span in tracer.spans] == ['broadcast', 'receive', 'dequeue']
+  assert tracer.spans[0] == {'uuid': sampled, 'node': 1, 'stage': 'broadcast', 'timestamp': 2.0}
+
+def test_export_writes_one_span_per_line(tmp_path):
+  tracer = Tracer()
+  tracer.record('a', 0, 'execute', 1.0)
+  tracer.record('a', 2, 'receive', 1.5)
+
+  path = tmp_path / 'trace.jsonl'
+  assert tracer.export(str(path)) == 2
+  with open(path) as f:
+    assert [json.loads(line) for line in f] == list(tracer.spans)
+
+def test_summary_attributes_the_time_to_the_later_stage_per_node():
+  tracer = Tracer()
+  for node, stage, timestamp in [(0, 'execute', 0.0), (0, 'broadcast', 0.5), (1, 'validate', 10.0), (1, 'receive', 9.0), (0, 'register', 2.5)]:
+    tracer.record('a', node, stage, timestamp)
+  tracer.record('b', 0, 'execute', 0.0)
+  tracer.record('b', 0, 'broadcast', 1.5)
+
+  summary = Tracer.summary(tracer.spans)
+  assert list(summary) == ['broadcast', 'validate', 'register']
+  assert summary['broadcast'] == {'count': 2, 'mean': 1.0, 'p50': 1.5, 'p95': 1.5, 'max': 1.5}
+  assert summary['validate']['max'] == 1.0
+  assert summary['register']['mean'] == 2.0
+
+def test_every_node_traces_the_stages_of_a_transaction():
+  simulator = Simulator(3, 5, seed=1)
+  simulator.setup()
+  for node in simulator.nodes:
+    node.tracer = Tracer()
+
+  simulator.nodes[0].execute_transaction(2, 'message', 'hello')
+  simulator.drain(simulator.nodes[0])
+  for _, _, callback, args in list(simulator.events):
+    if callback == simulator.deliver:
+      simulator.deliver(*args)
+  for node in simulator.nodes:
+    simulator.drain(node)
+
+  stages = [[span['stage'] for span in node.tracer.spans] for node in simulator.nodes]
+  assert {'execute', 'broadcast'} <= set(stages[0])
+  for node, node_stages in zip(simulator.nodes, stages):
+    assert node_stages[-4:] == ['dequeue', 'verify', 'validate', 'register']
+    assert {span['node'] for span in node.tracer.spans} == {node.id}
+    assert len({span['uuid'] for span in node.tracer.spans}) == 1
@@ -0,0 +1,135 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import json
+import time
+import socket
+
+from types import SimpleNamespace
+from threading import Thread
+from blockchat.transport import PriorityInbox, PriorityReceiver, RingBuffer, SharedMemoryTransport
+
+def transports(count):
+  sockets = []
+  for _ in range(count):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(('127.0.0.1', 0))
+    sockets.append(s)
+
+  nodes = [{'address': '127.0.0.1', 'port': s.getsockname()[1]} for s in sockets]
+  blockchain = SimpleNamespace(nodes=nodes)
+  result = []
+  for s in sockets:
+    node = SimpleNamespace(blockchain=blockchain, bootstrap_address='127.0.0.1', bootstrap_port=nodes[0]['port'])
+    transport = SharedMemoryTransport(node, s, capacity=4096, max_rings=1, discover_interval=0.05)
+    transport.start()
+    result.append(transport)
+  return result
+
+def receive(transport, timeout=2.0):
+  result = []
+  thread = Thread(target=lambda: result.append(transport.recvfrom(65536)[0]), daemon=True)
+  thread.start()
+  thread.join(timeout)
+  return result[0] if result else None
+
+def test_rings_wake_the_reader_and_fall_back_to_udp():
+  first, second, third = transports(3)
+  time.sleep(0.2)
+
+  # The reader is asleep on its doorbell by now
+  first.sendto(b'hello', ('127.0.0.1', second.port))
+  assert receive(second) == b'hello'
+  assert first.sent == 1 and second.received == 1
+
+  # Over max_rings and too large for the ring, the socket is used
+  first.sendto(b'over', ('127.0.0.1', third.port))
+  assert receive(third) == b'over'
+  first.sendto(b'x' * 8192, ('127.0.0.1', second.port))
+  assert receive(second) == b'x' * 8192
+  assert first.sent == 1 and third.received == 0
+
+  for transport in (first, second, third):
+    transport.close()
+
+def test_restarted_peer_ring_is_attached_again():
+  first, second = transports(2)
+  first.sendto(b'before', ('127.0.0.1', second.port))
+  assert receive(second) == b'before'
+
+  # The peer restarts and recreates its ring under the same name
+  first.rings[second.port][0].close()
+  ring = RingBuffer.create(first.segment_name(first.port, second.port), 4096)
+  first.rings[second.port] = (ring, first.rings[second.port][1])
+
+  first.sendto(b'after', ('127.0.0.1', second.port))
+  assert receive(second) == b'after'
+
+  for transport in (first, second):
+    transport.close()
+
+def test_inbox_lanes_are_bounded_and_keep_compact_blocks_behind_transactions():
+  inbox = PriorityInbox(control_capacity=2, data_capacity=2)
+  transaction = ({'message_type': 'transaction'}, None, None)
+  compact = ({'message_type': 'compact_block'}, None, None)
+  block = ({'message_type': 'block'}, None, None)
+  put = lambda item: inbox.put(item, json.dumps(item[0]).encode())
+
+  assert put(transaction) and put(compact)
+  assert not put(transaction)
+  assert put(block) and put(block)
+  assert not put(block)
+  assert inbox.dropped == 2
+
+  assert [inbox.get() for _ in range(4)] == [block, block, transaction, compact]
+
+def test_reader_threads_decode_the_datagrams_and_return_the_buffers():
+  s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  PriorityReceiver.share_port(s)
+  s.bind(('127.0.0.1', 0))
+  receiver = PriorityReceiver(SimpleNamespace(), s, buffers=2, receivers=2)
+  receiver.start()
+
+  sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  for i in range(50):
+    sender.sendto(json.dumps({'message_type': 'transaction', 'i': i}).encode(), ('127.0.0.1', receiver.port))
+  sender.sendto(b'pong', ('127.0.0.1', receiver.port))
+
+  deadline = time.monotonic() + 2.0
+  while sum(receiver.datagrams) < 51 and time.monotonic() < deadline:
+    time.sleep(0.01)
+
+  # The inbox holds decoded messages, the receive loop does not parse anything
+  control, data = receiver.inbox.lanes
+  assert sorted(message['i'] for message, _, _ in data) == list(range(50))
+  assert [item[0] for item in control] == [None] and control[0][2] == b'pong'
+  assert receiver.recvfrom(1024)[0] == b'pong'
+  assert receiver.receive()[0]['message_type'] == 'transaction'
+  # Each reader holds one buffer while it waits, and returns it after decoding
+  assert receiver.pool.misses == 0
+
+  receiver.close()
+  sender.close()
+  s.close()
+
+def test_ring_hands_out_views_and_keeps_the_messages_the_reader_refuses():
+  ring = RingBuffer.create(f'blockchat-test-{os.getpid()}', 64)
+  received = []
+
+  def consume(payload):
+    # A copy backs the view only when the message wraps around
+    received.append((isinstance(payload.obj, bytes), bytes(payload)))
+
+  # 22 bytes per message, the third one wraps around the end of the data area
+  assert ring.write(b'a' * 18) and ring.write(b'b' * 18)
+  assert ring.read(consume) == 2
+  assert ring.write(b'c' * 18)
+  assert ring.read(lambda payload: False) == 0 and ring.pending()
+
+  # The refused message still takes its space
+  assert ring.write(b'd' * 18) and not ring.write(b'e' * 18)
+  assert ring.read(consume) == 2 and not ring.pending()
+  assert received == [(False, b'a' * 18), (False, b'b' * 18), (True, b'c' * 18), (False, b'd' * 18)]
+
+  ring.close()